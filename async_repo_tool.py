@@ -0,0 +1,71 @@
+from models import RepoToolInput, Requirement
+from repo_tool import RepoTool
+from git_objects import BlobHashDelta
+from tracing import tracer
+
+
+from typing import Dict
+import asyncio
+import time
+
+
+class AsyncRepoTool:
+    def __init__(self, repo_dir: str, **repo_tool_options):
+        self.repo_dir = repo_dir
+        # file edits and object reads stay in-process; they run on a worker
+        # thread so they never block the event loop
+        self.repo_tool = RepoTool(repo_dir, **repo_tool_options)
+
+    @staticmethod
+    async def run_command(command, cwd=None, input=None) -> (bool, str):
+        if tracer.enabled:
+            started, start = time.time(), time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            "/bin/sh",
+            "-c",
+            command,
+            cwd=cwd,
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate(
+            input.encode() if input is not None else None
+        )
+        if tracer.enabled:
+            tracer.record_command(
+                command,
+                cwd,
+                started,
+                time.perf_counter() - start,
+                process.returncode,
+                len(stdout) + len(stderr),
+            )
+        stdout, stderr = stdout.decode(), stderr.decode()
+        if process.returncode != 0:
+            return False, stdout + "\n" + stderr
+
+        return True, stdout.strip()
+
+    async def implement_changes(self, data: RepoToolInput):
+        await asyncio.to_thread(self.repo_tool.implement_changes, data)
+
+    async def requirement_is_fulfilled(self, data: Requirement) -> (bool, str):
+        # verification runs under RepoTool's supervisor (process group, limits,
+        # bounded output), which blocks, so it gets a worker thread
+        return await asyncio.to_thread(self.repo_tool.requirement_is_fulfilled, data)
+
+    async def fetch_blob_hashes(self) -> Dict[str, str]:
+        return await asyncio.to_thread(self.repo_tool.fetch_blob_hashes)
+
+    async def fetch_blob_hash_delta(self) -> BlobHashDelta:
+        return await asyncio.to_thread(self.repo_tool.fetch_blob_hash_delta)
+
+    def reset_blob_hash_report(self):
+        self.repo_tool.reset_blob_hash_report()
+
+    async def commit(self, message: str) -> (bool, str):
+        return await asyncio.to_thread(self.repo_tool.commit, message)
+
+    def close(self):
+        self.repo_tool.close()
@@ -0,0 +1,181 @@
+from main import run_session, REPO_TOOL_OPTIONS, VERIFICATION_OUTPUT_BYTES
+from client import ChatClient
+from response_cache import cache_from_env
+from tracing import configure_from_env
+
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import time
+import sys
+import os
+
+
+def load_jobs(path: str) -> List[Dict]:
+    # one job per line: {"requirement": "..."} with an optional "id"
+    jobs = []
+    with open(path) as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            job.setdefault("id", f"job-{line_number}")
+            jobs.append(job)
+    return jobs
+
+
+def finished_ids(results_path: str) -> set:
+    if not os.path.exists(results_path):
+        return set()
+    with open(results_path) as file:
+        return {json.loads(line)["id"] for line in file if line.strip()}
+
+
+def run_job(
+    job: Dict,
+    work_dir: str,
+    max_iterations: int,
+    make_client: Callable[[], ChatClient],
+    repo_tool_options: Optional[Dict] = None,
+    candidates: int = 1,
+) -> Dict:
+    repo_dir = os.path.join(work_dir, job["id"])
+    os.makedirs(repo_dir, exist_ok=True)
+    start = time.perf_counter()
+    record = {"id": job["id"], "repo_dir": repo_dir}
+
+    # the session's progress goes to a log per job instead of the terminal
+    with open(os.path.join(work_dir, f"{job['id']}.log"), "w") as log_file:
+
+        def log(*objects):
+            print(*objects, file=log_file, flush=True)
+
+        try:
+            result = run_session(
+                make_client(),
+                repo_dir,
+                job["requirement"],
+                max_iterations=max_iterations,
+                log=log,
+                repo_tool_options=repo_tool_options,
+                candidates=candidates,
+            )
+            record.update(
+                status="fulfilled" if result.fulfilled else "unfulfilled",
+                iterations=result.iterations,
+                output=result.output,
+            )
+        except Exception as error:
+            log(f"job failed: {error!r}")
+            record.update(status="error", iterations=None, output=repr(error))
+
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def run_batch(
+    jobs: List[Dict],
+    work_dir: str,
+    results_path: str,
+    max_workers: int = 4,
+    max_iterations: int = 10,
+    make_client: Optional[Callable[[], ChatClient]] = None,
+    repo_tool_options: Optional[Dict] = None,
+    candidates: int = 1,
+) -> List[Dict]:
+    # sessions spend their time waiting on the API and on builds, so threads
+    # are enough; each job gets its own client, repository and log
+    make_client = make_client or (lambda: ChatClient(cache=cache_from_env()))
+    os.makedirs(work_dir, exist_ok=True)
+
+    done = finished_ids(results_path)
+    pending = [job for job in jobs if job["id"] not in done]
+    if done:
+        print(f"skipping {len(jobs) - len(pending)} finished jobs", file=sys.stderr)
+
+    records = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, open(
+        results_path, "a"
+    ) as results_file:
+        futures = {
+            pool.submit(
+                run_job,
+                job,
+                work_dir,
+                max_iterations,
+                make_client,
+                repo_tool_options,
+                candidates,
+            ): job
+            for job in pending
+        }
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            # flushed per job, so an interrupted run can resume
+            results_file.write(json.dumps(record) + "\n")
+            results_file.flush()
+            print(
+                f"[{len(records)}/{len(pending)}] {record['id']}: "
+                f"{record['status']} after {record['iterations']} iterations "
+                f"({record['seconds']:.1f}s)",
+                file=sys.stderr,
+            )
+    return records
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run many requirements without supervision, one repository each"
+    )
+    parser.add_argument("jobs", help='JSONL file of {"id": ..., "requirement": ...}')
+    parser.add_argument("--work-dir", default="batch_runs")
+    parser.add_argument(
+        "--results",
+        help="JSONL results file; jobs already in it are skipped "
+        "(default: <work-dir>/results.jsonl)",
+    )
+    parser.add_argument("--jobs-in-parallel", "-j", type=int, default=4)
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=10,
+        help="rounds of repository changes per job before giving up",
+    )
+    parser.add_argument(
+        "--max-output-bytes",
+        type=int,
+        default=VERIFICATION_OUTPUT_BYTES,
+        help="verification output kept in memory per run; the middle of "
+        "longer output is dropped",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="alternative change sets to request and verify side by side per round",
+    )
+    args = parser.parse_args(argv)
+
+    records = run_batch(
+        load_jobs(args.jobs),
+        args.work_dir,
+        args.results or os.path.join(args.work_dir, "results.jsonl"),
+        max_workers=args.jobs_in_parallel,
+        max_iterations=args.max_iterations,
+        repo_tool_options={
+            **REPO_TOOL_OPTIONS,
+            "max_output_bytes": args.max_output_bytes,
+        },
+        candidates=args.candidates,
+    )
+    fulfilled = sum(record["status"] == "fulfilled" for record in records)
+    print(f"{fulfilled}/{len(records)} requirements fulfilled", file=sys.stderr)
+    return 0 if fulfilled == len(records) else 1
+
+
+if __name__ == "__main__":
+    configure_from_env()
+    sys.exit(main())
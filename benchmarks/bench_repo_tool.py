@@ -0,0 +1,306 @@
+from typing import Callable, Dict, List, Optional
+import statistics
+import tracemalloc
+import argparse
+import platform
+import tempfile
+import resource
+import shutil
+import time
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import (  # noqa: E402
+    RepoToolInput,
+    RepoChange,
+    Patch,
+    FileAction,
+    DirectoryAction,
+    Action,
+    Requirement,
+)
+from repo_tool import RepoTool  # noqa: E402
+from verification_cache import VerificationCache  # noqa: E402
+
+LAYOUTS = ["flat", "deep"]
+DEFAULT_SIZES = [10, 1_000]
+FILE_LINES = 20
+
+
+def file_path_for(index: int, layout: str) -> str:
+    if layout == "flat":
+        return f"file{index}.txt"
+    # seven directory levels with a fan-out of ten per level
+    digits = f"{index:08d}"
+    return os.path.join(*[f"d{digit}" for digit in digits[:-1]], f"file{index}.txt")
+
+
+def make_repo(repo_dir: str, files: int, layout: str) -> List[str]:
+    RepoTool.run_command("git init -q", repo_dir)
+    paths = []
+    for index in range(files):
+        path = file_path_for(index, layout)
+        full_path = os.path.join(repo_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as file:
+            file.write("".join(f"file {index} line {n}\n" for n in range(FILE_LINES)))
+        paths.append(path)
+
+    RepoTool.run_command(
+        "git add -A && git -c user.name=bench -c user.email=bench@localhost "
+        "commit -qm 'synthetic repository'",
+        repo_dir,
+    )
+    return paths
+
+
+def commit(repo_dir: str, message: str):
+    RepoTool.run_command(
+        "git -c user.name=bench -c user.email=bench@localhost "
+        f"commit -qm '{message}'",
+        repo_dir,
+    )
+
+
+def patch_batch(paths: List[str], count: int, round_: int) -> RepoToolInput:
+    changes = []
+    for index, path in enumerate(paths[:count]):
+        old = f"file {index} line 5" if round_ == 0 else f"round {round_ - 1} {index}"
+        changes.append(
+            RepoChange(
+                patch=Patch(
+                    file_name=path,
+                    blob_hash="0000000",
+                    diff_range="-5,3 +5,3",
+                    changes=[
+                        f" file {index} line 4",
+                        f"-{old}",
+                        f"+round {round_} {index}",
+                        f" file {index} line 6",
+                    ],
+                )
+            )
+        )
+    return RepoToolInput(changes=changes)
+
+
+def creation_batch(count: int, round_: int) -> RepoToolInput:
+    directory_name = f"created{round_}"
+    changes = [
+        RepoChange(
+            directory_action=DirectoryAction(
+                action=Action.CREATE, directory_name=directory_name
+            )
+        )
+    ]
+    for index in range(count):
+        changes.append(
+            RepoChange(
+                file_action=FileAction(
+                    action=Action.CREATE,
+                    file_name=f"{directory_name}/file{index}.txt",
+                    content=f"created {round_} {index}\n" * FILE_LINES,
+                )
+            )
+        )
+    return RepoToolInput(changes=changes)
+
+
+def measure(run: Callable[[int], None], repeat: int) -> Dict[str, object]:
+    timings = []
+    for round_ in range(repeat):
+        start = time.perf_counter()
+        run(round_)
+        timings.append(time.perf_counter() - start)
+
+    # tracemalloc hooks every allocation, which would slow the in-process
+    # paths down far more than the subprocess ones; one more round, untimed,
+    # measures memory
+    tracemalloc.start()
+    run(repeat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.mean(timings),
+        },
+        "repeat": repeat,
+        "peak_python_bytes": peak,
+        # ru_maxrss of waited-for children is a high-water mark over the whole
+        # run so far, not a figure for this benchmark alone
+        "max_rss_children_kb_so_far": resource.getrusage(
+            resource.RUSAGE_CHILDREN
+        ).ru_maxrss,
+    }
+
+
+def bench_repo(files: int, layout: str, repeat: int, batch: int) -> List[Dict]:
+    results = []
+    repo_dir = tempfile.mkdtemp(prefix="gitpt-bench-")
+    try:
+        start = time.perf_counter()
+        paths = make_repo(repo_dir, files, layout)
+        setup_seconds = time.perf_counter() - start
+
+        def record(name: str, run: Callable[[int], None], repeat: int = repeat):
+            result = {"benchmark": name, "files": files, "layout": layout}
+            result.update(measure(run, repeat))
+            result["setup_seconds"] = setup_seconds
+            results.append(result)
+
+        record(
+            "fetch_blob_hashes_cold",
+            lambda _: RepoTool(repo_dir).fetch_blob_hashes(),
+        )
+        warm_tool = RepoTool(repo_dir)
+        warm_tool.fetch_blob_hashes()
+        record("fetch_blob_hashes_warm", lambda _: warm_tool.fetch_blob_hashes())
+
+        patch_files_dir = tempfile.mkdtemp(prefix="gitpt-bench-patches-")
+        patches = [change.patch for change in patch_batch(paths, batch, 0).changes]
+        record(
+            "patch_to_patch_file",
+            lambda _: [
+                patch.to_patch_file(os.path.join(patch_files_dir, f"{i}.patch"))
+                for i, patch in enumerate(patches)
+            ],
+        )
+        shutil.rmtree(patch_files_dir)
+
+        # every round rewrites the lines the previous round wrote
+        batch_tool = RepoTool(repo_dir)
+        record(
+            f"implement_changes_{min(batch, files)}_patches",
+            lambda round_: batch_tool.implement_changes(
+                patch_batch(paths, batch, round_)
+            ),
+        )
+        commit(repo_dir, "patched")
+
+        record(
+            f"implement_changes_{batch}_file_creations",
+            lambda round_: batch_tool.implement_changes(creation_batch(batch, round_)),
+        )
+        commit(repo_dir, "created")
+
+        delta_tool = RepoTool(repo_dir)
+        delta_tool.fetch_blob_hash_delta()
+
+        def touch_and_delta(round_: int):
+            with open(os.path.join(repo_dir, paths[0]), "a") as file:
+                file.write(f"delta round {round_}\n")
+            RepoTool.run_command(f"git add {paths[0]}", repo_dir)
+            commit(repo_dir, f"delta {round_}")
+            delta_tool.fetch_blob_hash_delta()
+
+        record("commit_and_fetch_blob_hash_delta", touch_and_delta)
+
+        requirement = Requirement(
+            description="first file is readable",
+            verification_commands=[f"tail -n 1 {paths[0]}"],
+            expected_output="never matches",
+        )
+        plain_tool = RepoTool(repo_dir)
+        record(
+            "requirement_is_fulfilled",
+            lambda _: plain_tool.requirement_is_fulfilled(requirement),
+        )
+        cached_tool = RepoTool(repo_dir, verification_cache=VerificationCache())
+        cached_tool.requirement_is_fulfilled(requirement)
+        record(
+            "requirement_is_fulfilled_cached",
+            lambda _: cached_tool.requirement_is_fulfilled(requirement),
+        )
+    finally:
+        shutil.rmtree(repo_dir, ignore_errors=True)
+
+    return results
+
+
+def compare(results: Dict, baseline_path: str, threshold: float) -> List[str]:
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+
+    def key(result):
+        return result["benchmark"], result["files"], result["layout"]
+
+    baseline_results = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        old = baseline_results.get(key(result))
+        if old is None:
+            continue
+        ratio = result["seconds"]["median"] / max(old["seconds"]["median"], 1e-9)
+        line = f"{'/'.join(map(str, key(result)))}: {ratio:.2f}x"
+        print(line)
+        if ratio > threshold:
+            regressions.append(line)
+    return regressions
+
+
+def run(
+    sizes: List[int],
+    layouts: List[str],
+    repeat: int,
+    batch: int,
+    output: Optional[str] = None,
+) -> Dict:
+    _, revision = RepoTool.run_command(
+        "git rev-parse HEAD", os.path.dirname(os.path.abspath(__file__))
+    )
+    results = {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": [],
+    }
+    for files in sizes:
+        for layout in layouts:
+            print(f"benchmarking {files} files, {layout} layout", file=sys.stderr)
+            results["results"].extend(bench_repo(files, layout, repeat, batch))
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Time RepoTool hot paths on synthetic git repositories"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="number of files per synthetic repository, e.g. 10 1000 100000",
+    )
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=LAYOUTS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=200, help="patches per batch")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="median slowdown ratio that counts as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.layouts, args.repeat, args.batch, args.output)
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+from typing import Dict, List, Optional, Tuple
+import subprocess
+import tempfile
+import hashlib
+import shutil
+import sys
+import os
+
+BUILD_ROOT_ENV = "GITPT_BUILD_ROOT"
+DEFAULT_BUILD_ROOT = os.path.join("~", ".cache", "gitpt", "build")
+COMPILER_CACHE_ENV = "GITPT_COMPILER_CACHE"
+
+# exported to verification commands
+BUILD_DIR_ENV = "GITPT_BUILD_DIR"
+SOURCE_DIR_ENV = "GITPT_SOURCE_DIR"
+
+SOURCE_DIR_PLACEHOLDER = "@GITPT_SOURCE_DIR@"
+BUILD_DIR_PLACEHOLDER = "@GITPT_BUILD_DIR@"
+
+# options whose value is the next argument and only names an output
+OUTPUT_OPTIONS = {"-o", "-MF", "-MT", "-MQ"}
+DEPENDENCY_FLAGS = {"-MD", "-MMD"}
+# outputs we would not know how to restore
+UNCACHEABLE_PREFIXES = ("-save-temps", "--coverage", "-fprofile-", "-ftest-coverage")
+
+
+def build_dir_for(
+    repo_dir: str, build_root: Optional[str] = None, create: bool = True
+) -> str:
+    # one directory per checkout, outside of it so `git status`, worktree
+    # removal and the verification cache digest never see build products
+    build_root = build_root or os.getenv(BUILD_ROOT_ENV) or DEFAULT_BUILD_ROOT
+    repo_dir = os.path.realpath(repo_dir)
+    key = hashlib.sha256(repo_dir.encode()).hexdigest()[:16]
+    build_dir = os.path.join(
+        os.path.expanduser(build_root), f"{os.path.basename(repo_dir)}-{key}"
+    )
+    if create:
+        os.makedirs(build_dir, exist_ok=True)
+    return build_dir
+
+
+def build_environment(
+    source_dir: str, build_dir: str, compiler_cache: Optional[str] = None
+) -> Dict[str, str]:
+    env = {
+        SOURCE_DIR_ENV: os.path.realpath(source_dir),
+        BUILD_DIR_ENV: os.path.realpath(build_dir),
+    }
+    if compiler_cache:
+        env[COMPILER_CACHE_ENV] = os.path.abspath(os.path.expanduser(compiler_cache))
+        # CMake seeds CMAKE_<LANG>_COMPILER_LAUNCHER from these on first configure
+        launcher = f"{sys.executable};{os.path.abspath(__file__)}"
+        env["CMAKE_C_COMPILER_LAUNCHER"] = launcher
+        env["CMAKE_CXX_COMPILER_LAUNCHER"] = launcher
+    return env
+
+
+class CompilerCache:
+    # ccache-style object cache: the key is the compiler, its arguments and
+    # the preprocessed translation unit, so an edit that leaves a file's
+    # preprocessed form untouched (or reverts it) never recompiles it
+    def __init__(self, path: str, env: Optional[Dict[str, str]] = None):
+        self.path = path
+        env = os.environ if env is None else env
+        # checkout and build paths end up in line markers and dependency
+        # files; replacing them lets worktrees of the same repository share hits
+        self.replacements: List[Tuple[str, str]] = []
+        for name, placeholder in (
+            (SOURCE_DIR_ENV, SOURCE_DIR_PLACEHOLDER),
+            (BUILD_DIR_ENV, BUILD_DIR_PLACEHOLDER),
+        ):
+            if env.get(name):
+                self.replacements.append((env[name], placeholder))
+
+    def normalize(self, data: bytes) -> bytes:
+        for path, placeholder in self.replacements:
+            data = data.replace(path.encode(), placeholder.encode())
+        return data
+
+    def denormalize(self, data: bytes) -> bytes:
+        for path, placeholder in self.replacements:
+            data = data.replace(placeholder.encode(), path.encode())
+        return data
+
+    def key(self, compiler: str, args: List[str], preprocessed: bytes) -> str:
+        digest = hashlib.sha256()
+        compiler_path = shutil.which(compiler) or compiler
+        stat = os.stat(compiler_path)
+        digest.update(f"{compiler_path}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        for arg in args:
+            digest.update(self.normalize(arg.encode()) + b"\0")
+        digest.update(self.normalize(preprocessed))
+        return digest.hexdigest()
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def lookup(self, key: str) -> Optional[Dict[str, bytes]]:
+        entry_dir = self.entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return None
+        entry = {}
+        for name in os.listdir(entry_dir):
+            with open(os.path.join(entry_dir, name), "rb") as file:
+                entry[name] = file.read()
+        return entry if "object" in entry else None
+
+    def store(self, key: str, entry: Dict[str, bytes]):
+        # write into a scratch directory and rename it into place, so parallel
+        # builds never observe a half-written entry
+        entry_dir = self.entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        scratch = tempfile.mkdtemp(dir=os.path.dirname(entry_dir))
+        for name, data in entry.items():
+            with open(os.path.join(scratch, name), "wb") as file:
+                file.write(data)
+        try:
+            os.rename(scratch, entry_dir)
+        except OSError:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def parse_compile(args: List[str]) -> Optional[Dict[str, object]]:
+    # returns the outputs and preprocessor command of a plain `-c` compile,
+    # or None for anything else (links, -E, coverage, ...)
+    if "-c" not in args or "-" in args:
+        return None
+    if any(arg.startswith(UNCACHEABLE_PREFIXES) for arg in args):
+        return None
+
+    outputs: Dict[str, str] = {}
+    preprocess: List[str] = []
+    words = iter(args)
+    for arg in words:
+        if arg in OUTPUT_OPTIONS:
+            value = next(words, None)
+            if value is None:
+                return None
+            outputs[arg] = value
+        elif arg in DEPENDENCY_FLAGS:
+            continue
+        elif arg == "-c":
+            preprocess.append("-E")
+        else:
+            preprocess.append(arg)
+
+    if "-o" not in outputs:
+        return None
+    return {
+        "object": outputs["-o"],
+        "deps": outputs.get("-MF") if DEPENDENCY_FLAGS & set(args) else None,
+        "preprocess": preprocess,
+    }
+
+
+def compile_cached(
+    argv: List[str], cache_dir: str, env: Optional[Dict[str, str]] = None
+) -> Tuple[int, str]:
+    # runs `argv` (compiler first) through the cache; the second element is
+    # "hit", "miss" or "uncacheable"
+    compiler, args = argv[0], argv[1:]
+    compile_ = parse_compile(args)
+    if compile_ is None:
+        return subprocess.run(argv).returncode, "uncacheable"
+
+    preprocessed = subprocess.run(
+        [compiler, *compile_["preprocess"]],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if preprocessed.returncode != 0:
+        # let the real compile report the error
+        return subprocess.run(argv).returncode, "uncacheable"
+
+    cache = CompilerCache(cache_dir, env)
+    key = cache.key(compiler, args, preprocessed.stdout)
+    entry = cache.lookup(key)
+    if entry is not None:
+        with open(compile_["object"], "wb") as file:
+            file.write(entry["object"])
+        if compile_["deps"] and "deps" in entry:
+            with open(compile_["deps"], "wb") as file:
+                file.write(cache.denormalize(entry["deps"]))
+        # warnings are part of the result
+        sys.stderr.buffer.write(entry.get("stderr", b""))
+        sys.stderr.flush()
+        return 0, "hit"
+
+    result = subprocess.run(argv, stderr=subprocess.PIPE)
+    sys.stderr.buffer.write(result.stderr)
+    sys.stderr.flush()
+    if result.returncode != 0:
+        return result.returncode, "miss"
+
+    entry = {"stderr": result.stderr}
+    with open(compile_["object"], "rb") as file:
+        entry["object"] = file.read()
+    if compile_["deps"] and os.path.exists(compile_["deps"]):
+        with open(compile_["deps"], "rb") as file:
+            entry["deps"] = cache.normalize(file.read())
+    cache.store(key, entry)
+    return 0, "miss"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # compiler launcher: `python build_cache.py <compiler> <args>...`
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("usage: build_cache.py <compiler> [args...]", file=sys.stderr)
+        return 2
+    cache_dir = os.getenv(COMPILER_CACHE_ENV)
+    if not cache_dir:
+        return subprocess.run(argv).returncode
+    returncode, _ = compile_cached(argv, cache_dir)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
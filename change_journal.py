@@ -0,0 +1,188 @@
+from typing import Dict, Iterable, List, Optional, Set
+import ctypes.util
+import ctypes
+import struct
+import errno
+import sys
+import os
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+WATCH_CHANGES_ENV = "GITPT_WATCH_CHANGES"
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+# past this many candidates a pathspec-limited git call is no cheaper than a
+# full scan
+MAX_CANDIDATES = 10_000
+
+
+class ChangeJournal:
+    # paths that may differ from the index, kept up to date by inotify so
+    # status-like queries only look at what changed instead of restatting
+    # the whole checkout. Callers ask for candidates(), run their query on
+    # them and hand the dirty paths it found to settle(), which becomes the
+    # new baseline. When events were lost the next query is a full scan
+    def __init__(self, repo_dir: str):
+        self.repo_dir = repo_dir
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> directory relative to the repository root
+        self._watches: Dict[int, str] = {}
+        self._watched: Set[str] = set()
+        self.touched: Set[str] = set()
+        self.overflowed = False
+        # a directory could not be watched; from then on every query is a
+        # full scan, since changes below it would go unnoticed
+        self.disabled = False
+
+        self._watch_tree("")
+        # dirty paths as of the last settle(); None until the first query,
+        # which is a full scan
+        self.baseline: Optional[Set[str]] = None
+
+    @classmethod
+    def start(cls, repo_dir: str) -> Optional["ChangeJournal"]:
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            journal = cls(repo_dir)
+        except (OSError, AttributeError, TypeError):
+            return None
+        if journal.disabled:
+            journal.close()
+            return None
+        return journal
+
+    def _watch_tree(self, directory: str):
+        for root, dirs, _ in os.walk(os.path.join(self.repo_dir, directory)):
+            relative = os.path.relpath(root, self.repo_dir)
+            relative = "" if relative == "." else relative
+            if relative == "":
+                dirs[:] = [name for name in dirs if name != ".git"]
+            if not self._watch(relative):
+                dirs[:] = []
+
+    def _watch(self, directory: str) -> bool:
+        if self.disabled:
+            return False
+        wd = self._libc.inotify_add_watch(
+            self.fd,
+            os.fsencode(os.path.join(self.repo_dir, directory)),
+            WATCH_MASK,
+        )
+        if wd < 0:
+            # a directory that vanished meanwhile needs no watch; anything
+            # else (ENOSPC, EACCES, ...) leaves changes unseen
+            if ctypes.get_errno() not in (errno.ENOENT, errno.ENOTDIR):
+                self.disabled = True
+            return False
+        self._watches[wd] = directory
+        self._watched.add(directory)
+        return True
+
+    def drain(self):
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                self._handle(wd, mask, name)
+
+    def _handle(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            self.overflowed = True
+            return
+        if mask & IN_IGNORED:
+            self._watched.discard(self._watches.pop(wd, None))
+            return
+        directory = self._watches.get(wd)
+        if directory is None or not name:
+            return
+        path = os.path.join(directory, name) if directory else name
+        if path == ".git" or path.startswith(".git/"):
+            return
+        # a directory stands for everything below it as a pathspec, which
+        # covers files created before its watch was in place
+        self.touched.add(path)
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            self._watch_tree(path)
+
+    def candidates(self) -> Optional[List[str]]:
+        # every path that may differ from the index, or None when the caller
+        # has to scan the whole tree
+        if self.disabled:
+            return None
+        self.drain()
+        if self.overflowed or self.baseline is None:
+            # nothing is known until a full scan is settled
+            self.overflowed = False
+            self.baseline = None
+            self.touched.clear()
+            return None
+        paths = self.baseline | self.touched
+        if len(paths) > MAX_CANDIDATES:
+            return None
+        return sorted(paths)
+
+    def settle(self, dirty: Iterable[str]):
+        # the result of a query on candidates() (or of a full scan): paths
+        # it found clean drop out, and what changes next comes in as events
+        if self.disabled:
+            return
+        self.baseline = {path.rstrip("/") for path in dirty}
+        self.touched.clear()
+        # directories created while events were being dropped have no watch;
+        # they hold a dirty path, so only those are looked at
+        for path in self.baseline:
+            directory = os.path.dirname(path)
+            missing = None
+            while directory and directory not in self._watched:
+                missing = directory
+                directory = os.path.dirname(directory)
+            if missing is not None and os.path.isdir(
+                os.path.join(self.repo_dir, missing)
+            ):
+                self._watch_tree(missing)
+            if os.path.isdir(os.path.join(self.repo_dir, path)) and (
+                path not in self._watched
+            ):
+                self._watch_tree(path)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
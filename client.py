@@ -0,0 +1,239 @@
+from models import RepoChange
+from response_cache import ResponseCache
+from schemas import decode_completion, decode_choices, parse_arguments
+
+
+from typing import Callable, Dict, List, Optional
+import requests
+import json
+import os
+
+OPENAI_CHAT_COMPLETIONS_URL = "https://api.openai.com/v1/chat/completions"
+
+
+# emits each element of the top-level `changes` array of a streamed
+# RepoToolInput as soon as its closing brace arrives
+class IncrementalChangesParser:
+    def __init__(self):
+        self.changes: List[RepoChange] = []
+        # characters fed so far
+        self.length = 0
+        # fragments that may still be needed: the unfinished change or key,
+        # starting at offset _kept_start of the whole text
+        self._kept: List[str] = []
+        self._kept_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expecting_key = False
+        self._last_key: Optional[str] = None
+        self._in_changes = False
+        self._element_start: Optional[int] = None
+
+    def _slice(self, start: int, end: int) -> str:
+        text = "".join(self._kept)
+        self._kept = [text]
+        return text[start - self._kept_start : end - self._kept_start]
+
+    def feed(self, fragment: str) -> List[RepoChange]:
+        # scans only the new fragment, so feeding n characters costs O(n)
+        # however it is split up
+        completed = []
+        offset = self.length
+        self._kept.append(fragment)
+        self.length += len(fragment)
+
+        for index, char in enumerate(fragment):
+            pos = offset + index
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expecting_key:
+                        self._last_key = self._slice(self._string_start + 1, pos)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expecting_key = True
+                elif self._depth == 2 and char == "[":
+                    self._in_changes = self._last_key == "changes"
+                elif self._depth == 3 and self._in_changes:
+                    self._element_start = pos
+            elif char in "}]":
+                if self._depth == 3 and self._in_changes:
+                    element = self._slice(self._element_start, pos + 1)
+                    completed.append(parse_arguments(RepoChange, element))
+                    self._element_start = None
+                elif self._depth == 2:
+                    self._in_changes = False
+                self._depth -= 1
+            elif self._depth == 1 and char == ":":
+                self._expecting_key = False
+            elif self._depth == 1 and char == ",":
+                self._expecting_key = True
+
+        # drop what no unfinished change or key can refer to any more
+        if self._element_start is not None:
+            keep_from = self._element_start
+        elif self._in_string:
+            keep_from = self._string_start
+        else:
+            keep_from = self.length
+        if keep_from > self._kept_start:
+            text = "".join(self._kept)
+            self._kept = [text[keep_from - self._kept_start :]]
+            self._kept_start = keep_from
+        self.changes.extend(completed)
+        return completed
+
+
+class ChatClient:
+    def __init__(
+        self,
+        url: str = OPENAI_CHAT_COMPLETIONS_URL,
+        api_key: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        timeout: Optional[float] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.cache = cache
+        # one keep-alive session for the whole run instead of a TLS handshake per turn
+        self.session = session or requests.Session()
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {api_key or os.getenv('OPENAI_API_KEY')}",
+                "Content-Type": "application/json",
+            }
+        )
+
+    def close(self):
+        self.session.close()
+
+    def complete(self, payload: Dict) -> Dict:
+        if self.cache is not None:
+            cached = self.cache.get(payload)
+            if cached is not None:
+                return cached
+
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        message = decode_completion(response.content)
+        if self.cache is not None:
+            self.cache.put(payload, message)
+        return message
+
+    def complete_choices(self, payload: Dict, n: int) -> List[Dict]:
+        # n alternative messages for the same conversation in one request
+        payload = {**payload, "n": n}
+        if self.cache is not None:
+            cached = self.cache.get(payload)
+            if cached is not None:
+                return cached["choices"]
+
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        messages = decode_choices(response.content)
+        if self.cache is not None:
+            self.cache.put(payload, {"choices": messages})
+        return messages
+
+    @staticmethod
+    def replay_changes(message: Dict, on_change: Callable[[RepoChange], None]):
+        # a cached message arrives whole; hand out its changes as a stream would
+        for tool_call in message.get("tool_calls") or []:
+            if tool_call["function"]["name"] == "implement_changes":
+                parser = IncrementalChangesParser()
+                for change in parser.feed(tool_call["function"]["arguments"]):
+                    on_change(change)
+
+    def stream(
+        self,
+        payload: Dict,
+        on_change: Optional[Callable[[RepoChange], None]] = None,
+    ) -> Dict:
+        if self.cache is not None:
+            cached = self.cache.get(payload)
+            if cached is not None:
+                if on_change:
+                    ChatClient.replay_changes(cached, on_change)
+                return cached
+
+        message = {"role": "assistant", "content": None}
+        tool_calls: Dict[int, Dict] = {}
+        parsers: Dict[int, IncrementalChangesParser] = {}
+        content_parts: List[str] = []
+        argument_parts: Dict[int, List[str]] = {}
+        # a stream that stops without [DONE] or a finish_reason was cut off
+        # and is not worth replaying
+        finished = False
+
+        with self.session.post(
+            self.url,
+            json={**payload, "stream": True},
+            timeout=self.timeout,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    finished = True
+                    break
+
+                choice = json.loads(data)["choices"][0]
+                finished = finished or bool(choice.get("finish_reason"))
+                delta = choice.get("delta", {})
+                if delta.get("content"):
+                    content_parts.append(delta["content"])
+
+                for call_delta in delta.get("tool_calls") or []:
+                    index = call_delta.get("index", 0)
+                    tool_call = tool_calls.setdefault(
+                        index,
+                        {
+                            "id": None,
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""},
+                        },
+                    )
+                    if call_delta.get("id"):
+                        tool_call["id"] = call_delta["id"]
+                    function = call_delta.get("function", {})
+                    tool_call["function"]["name"] += function.get("name") or ""
+
+                    fragment = function.get("arguments") or ""
+                    argument_parts.setdefault(index, []).append(fragment)
+                    if tool_call["function"]["name"] == "implement_changes":
+                        parser = parsers.get(index)
+                        if parser is None:
+                            # the name can complete after arguments started
+                            parser = parsers[index] = IncrementalChangesParser()
+                            fragment = "".join(argument_parts[index])
+                        for change in parser.feed(fragment):
+                            if on_change:
+                                on_change(change)
+
+        # fragments are joined once at the end; growing a string held in a
+        # dict by += copies it on every delta
+        if content_parts:
+            message["content"] = "".join(content_parts)
+        for index, parts in argument_parts.items():
+            tool_calls[index]["function"]["arguments"] = "".join(parts)
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+        if self.cache is not None and finished:
+            self.cache.put(payload, message)
+        return message
@@ -0,0 +1,152 @@
+from typing import Dict, List, Optional, Tuple
+import json
+
+# kinds of messages the compactor treats specially
+BLOB_HASH_SNAPSHOT = "blob_hash_snapshot"
+BLOB_HASH_DELTA = "blob_hash_delta"
+
+FOLD_MARKER = "\n... [{omitted} characters folded] ...\n"
+
+
+def estimate_tokens(message: Dict) -> int:
+    # ~4 characters per token for JSON and code is close enough for budgeting,
+    # and needs no tokenizer for whatever model the payload is sent to
+    return len(json.dumps(message, ensure_ascii=False)) // 4 + 4
+
+
+def fold_text(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    head = max_chars // 2
+    tail = max_chars - head
+    return (
+        text[:head]
+        + FOLD_MARKER.format(omitted=len(text) - max_chars)
+        + text[len(text) - tail :]
+    )
+
+
+class Conversation:
+    # the messages sent with every request. The first `pinned` messages (the
+    # system prompt and the requirement) are always kept verbatim; older
+    # turns are folded, then dropped, until the estimate fits `token_budget`
+    def __init__(
+        self,
+        messages: List[Dict],
+        pinned: int = 2,
+        token_budget: int = 24_000,
+        keep_recent: int = 4,
+        folded_chars: int = 2_000,
+    ):
+        self.pinned = pinned
+        self.token_budget = token_budget
+        # messages at the end that are never folded or dropped
+        self.keep_recent = keep_recent
+        self.folded_chars = folded_chars
+        self._entries: List[Tuple[Dict, Optional[str]]] = [
+            (message, None) for message in messages
+        ]
+        # set when blob hash reports had to be dropped, so the next report
+        # has to be a full snapshot again
+        self.blob_hashes_dropped = False
+
+    @property
+    def messages(self) -> List[Dict]:
+        return [message for message, _ in self._entries]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def append(self, message: Dict, kind: Optional[str] = None):
+        self._entries.append((message, kind))
+
+    def tokens(self) -> int:
+        return sum(estimate_tokens(message) for message, _ in self._entries)
+
+    def compact(self) -> List[Dict]:
+        self._drop_superseded_blob_hashes()
+        if self.tokens() > self.token_budget:
+            self._fold_old_messages()
+        while self.tokens() > self.token_budget and self._drop_oldest_turn():
+            pass
+        return self.messages
+
+    def _compactable(self) -> range:
+        return range(
+            self.pinned, max(self.pinned, len(self._entries) - self.keep_recent)
+        )
+
+    def _drop_superseded_blob_hashes(self):
+        # a snapshot lists every path, so earlier reports add nothing
+        snapshots = [
+            index
+            for index, (_, kind) in enumerate(self._entries)
+            if kind == BLOB_HASH_SNAPSHOT
+        ]
+        if not snapshots:
+            return
+        self._entries = [
+            entry
+            for index, entry in enumerate(self._entries)
+            if index >= snapshots[-1]
+            or index < self.pinned
+            or entry[1] not in (BLOB_HASH_SNAPSHOT, BLOB_HASH_DELTA)
+        ]
+
+    def _fold_old_messages(self):
+        for index in self._compactable():
+            message, kind = self._entries[index]
+            if kind is not None:
+                continue
+            folded = dict(message)
+            if isinstance(folded.get("content"), str):
+                folded["content"] = fold_text(folded["content"], self.folded_chars)
+            if folded.get("tool_calls"):
+                # the arguments of old implement_changes calls are whole files
+                folded["tool_calls"] = [
+                    {
+                        **tool_call,
+                        "function": {
+                            **tool_call["function"],
+                            "arguments": fold_text(
+                                tool_call["function"]["arguments"], self.folded_chars
+                            ),
+                        },
+                    }
+                    for tool_call in folded["tool_calls"]
+                ]
+            self._entries[index] = (folded, kind)
+
+    def _drop_oldest_turn(self) -> bool:
+        # a turn is an assistant message with the tool results and user
+        # messages that follow it, so tool results never lose their call
+        compactable = self._compactable()
+        start = next(
+            (
+                index
+                for index in compactable
+                if self._entries[index][0].get("role") == "assistant"
+            ),
+            None,
+        )
+        if start is None:
+            return False
+        end = next(
+            (
+                index
+                for index in range(start + 1, len(self._entries))
+                if self._entries[index][0].get("role") == "assistant"
+            ),
+            None,
+        )
+        if end is None or end > compactable.stop:
+            # the rest of the history belongs to a recent turn
+            return False
+
+        if any(
+            kind in (BLOB_HASH_SNAPSHOT, BLOB_HASH_DELTA)
+            for _, kind in self._entries[start:end]
+        ):
+            self.blob_hashes_dropped = True
+        del self._entries[start:end]
+        return True
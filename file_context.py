@@ -0,0 +1,155 @@
+from patch_engine import parse_diff_range, PatchResult
+
+
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+import os
+
+# git's own heuristic: a NUL byte early in the file means binary
+BINARY_PROBE_BYTES = 8000
+
+
+def split_lines(text: str) -> List[str]:
+    # only "\n" ends a line, as in the patch engine; str.splitlines() also
+    # splits on form feeds, \u2028 and the like, which shifts the numbers
+    lines = text.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def number_lines(text: str, start: int = 1, end: Optional[int] = None) -> str:
+    # 1-based, inclusive; the numbers are what diff_range refers to
+    lines = split_lines(text)
+    end = len(lines) if end is None else min(end, len(lines))
+    start = max(start, 1)
+    width = len(str(end)) if end else 1
+    return "\n".join(
+        f"{number:>{width}}| {lines[number - 1]}" for number in range(start, end + 1)
+    )
+
+
+class BlobContentCache:
+    # decoded blob contents by hash. A hash names its content forever, so
+    # entries never go stale; least recently used ones go past max_bytes
+    def __init__(
+        self,
+        read_object: Callable[[str], Tuple[str, bytes]],
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.read_object = read_object
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # None marks a binary blob
+        self._entries: "OrderedDict[str, Optional[str]]" = OrderedDict()
+
+    def get(self, blob_hash: str) -> Optional[str]:
+        if blob_hash in self._entries:
+            self._entries.move_to_end(blob_hash)
+            return self._entries[blob_hash]
+
+        _, data = self.read_object(blob_hash)
+        text = None
+        if b"\0" not in data[:BINARY_PROBE_BYTES]:
+            try:
+                text = data.decode()
+            except UnicodeDecodeError:
+                pass
+
+        self._entries[blob_hash] = text
+        self.total_bytes += len(text or "")
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted or "")
+        return text
+
+
+class ContextDelivery:
+    # ships file contents to the model once per blob hash per session, so
+    # patches are written against what is really there; `seen` has to be
+    # reset when the conversation loses earlier deliveries
+    def __init__(
+        self,
+        repo_tool,
+        max_bytes: int = 24_000,
+        max_file_bytes: int = 8_000,
+        cache: Optional[BlobContentCache] = None,
+    ):
+        self.repo_tool = repo_tool
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.cache = cache or BlobContentCache(repo_tool.read_object)
+        self.seen: Set[str] = set()
+
+    def reset(self):
+        self.seen.clear()
+
+    def contents_message(self, priority_paths: Iterable[str] = ()) -> str:
+        # files whose current blob the model has not seen, the paths that
+        # just changed first; whatever does not fit waits for the next turn
+        blob_hashes = self.repo_tool.fetch_blob_hashes()
+        paths = list(dict.fromkeys([*priority_paths, *sorted(blob_hashes)]))
+
+        sections: List[str] = []
+        used = 0
+        for path in paths:
+            blob_hash = blob_hashes.get(path)
+            if blob_hash is None or blob_hash in self.seen:
+                continue
+
+            text = self.cache.get(blob_hash)
+            if text is None:
+                section = f"{path} ({blob_hash[:7]}): binary file, not shown"
+            else:
+                body = text
+                if len(body) > self.max_file_bytes:
+                    cut = body[: self.max_file_bytes].count("\n")
+                    body = "\n".join(split_lines(body)[:cut])
+                    note = f"\n... ({len(split_lines(text)) - cut} more lines)"
+                else:
+                    note = ""
+                section = (
+                    f"{path} ({blob_hash[:7]}):\n```\n{number_lines(body)}{note}\n```"
+                )
+
+            if used + len(section) > self.max_bytes and sections:
+                break
+            sections.append(section)
+            used += len(section)
+            self.seen.add(blob_hash)
+
+        if not sections:
+            return ""
+        return "current file contents (line numbers are not part of the files):\n\n" + (
+            "\n\n".join(sections)
+        )
+
+    def excerpt(self, path: str, start: int, end: int) -> str:
+        # from the working tree, which is what the next patch applies to
+        try:
+            with open(os.path.join(self.repo_tool.repo_dir, path)) as file:
+                text = file.read()
+        except (OSError, UnicodeDecodeError):
+            return f"{path}: not readable"
+        return number_lines(text, start, end)
+
+    def failed_hunk_excerpts(
+        self, patch_results: List[PatchResult], context: int = 5
+    ) -> str:
+        excerpts = []
+        for result in patch_results:
+            for hunk in result.hunks:
+                if hunk.applied:
+                    continue
+                try:
+                    old_start, old_count, _, _ = parse_diff_range(hunk.diff_range)
+                except ValueError:
+                    continue
+                start = max(old_start - context, 1)
+                end = old_start + old_count + context
+                excerpts.append(
+                    f"{result.file_name} lines {start}-{end}:\n```\n"
+                    + self.excerpt(result.file_name, start, end)
+                    + "\n```"
+                )
+        return "\n\n".join(excerpts)
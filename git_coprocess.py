@@ -0,0 +1,170 @@
+from tracing import tracer
+from typing import List, Optional, Tuple
+import subprocess
+import tempfile
+
+# the most paths written to hash-object before its answers are read back:
+# small enough that the request always fits in the pipe buffer, so neither
+# side can block on a full pipe while the other waits for it
+HASH_CHUNK_BYTES = 4096
+
+
+class CoprocessError(RuntimeError):
+    pass
+
+
+class GitCoprocess:
+    def __init__(self, args: List[str], cwd: str, reads_output: bool = True):
+        self.args = ["git", *args]
+        self.cwd = cwd
+        self.reads_output = reads_output
+        self.process: Optional[subprocess.Popen] = None
+        # stderr goes to a file: nobody reads it while the process runs, and
+        # a pipe would stall git once it filled up
+        self._stderr = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            self.args,
+            cwd=self.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE if self.reads_output else subprocess.DEVNULL,
+            stderr=self._stderr,
+        )
+
+    def stop(self) -> Tuple[int, str]:
+        if self.process is None:
+            return 0, ""
+
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = process.wait()
+        if process.stdout:
+            process.stdout.close()
+        stderr_file, self._stderr = self._stderr, None
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors="replace")
+        stderr_file.close()
+        return returncode, stderr
+
+    def restart(self):
+        if self.process is not None:
+            self.process.kill()
+            self.stop()
+        self.start()
+
+    def send(self, data: bytes):
+        if not self.alive:
+            self.restart()
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def readline(self) -> bytes:
+        line = self.process.stdout.readline()
+        if not line:
+            raise CoprocessError(f"{' '.join(self.args)} exited unexpectedly")
+        return line
+
+    def read(self, size: int) -> bytes:
+        data = self.process.stdout.read(size)
+        if len(data) != size:
+            raise CoprocessError(f"{' '.join(self.args)} exited unexpectedly")
+        return data
+
+
+class GitCoprocesses:
+    def __init__(self, repo_dir: str):
+        self.repo_dir = repo_dir
+        self.cat_file = GitCoprocess(["cat-file", "--batch"], repo_dir)
+        self.hash_object = GitCoprocess(["hash-object", "--stdin-paths"], repo_dir)
+        # update-index only writes the index (and drops index.lock) once its
+        # stdin is closed, so it lives until the next flush_index()
+        self.update_index = GitCoprocess(
+            ["update-index", "--add", "--remove", "-z", "--stdin"],
+            repo_dir,
+            reads_output=False,
+        )
+        self._unflushed_paths: List[str] = []
+
+    def _with_retry(self, coprocess: GitCoprocess, request):
+        try:
+            return request()
+        except (BrokenPipeError, CoprocessError):
+            # one restart covers a coprocess that died between requests
+            coprocess.restart()
+            return request()
+
+    def read_object(self, name: str) -> Tuple[str, bytes]:
+        def request():
+            self.cat_file.send(f"{name}\n".encode())
+            header = self.cat_file.readline().decode().split()
+            if header[-1] == "missing":
+                raise KeyError(name)
+            _, obj_type, size = header
+            data = self.cat_file.read(int(size) + 1)
+            return obj_type, data[:-1]
+
+        with tracer.span("git cat-file", "coprocess", object=name):
+            return self._with_retry(self.cat_file, request)
+
+    def hash_files(self, paths: List[str]) -> List[str]:
+        def request(chunk: List[str]):
+            self.hash_object.send("".join(f"{path}\n" for path in chunk).encode())
+            return [self.hash_object.readline().decode().strip() for _ in chunk]
+
+        blob_hashes: List[str] = []
+        chunk: List[str] = []
+        chunk_bytes = 0
+        with tracer.span("git hash-object", "coprocess", paths=len(paths)):
+            for path in paths:
+                if chunk and chunk_bytes + len(path) + 1 > HASH_CHUNK_BYTES:
+                    blob_hashes.extend(
+                        self._with_retry(self.hash_object, lambda: request(chunk))
+                    )
+                    chunk, chunk_bytes = [], 0
+                chunk.append(path)
+                chunk_bytes += len(path) + 1
+            if chunk:
+                blob_hashes.extend(
+                    self._with_retry(self.hash_object, lambda: request(chunk))
+                )
+        return blob_hashes
+
+    def stage(self, paths: List[str]):
+        if not paths:
+            return
+
+        self._unflushed_paths.extend(paths)
+        with tracer.span("git update-index", "coprocess", paths=len(paths)):
+            try:
+                if not self.update_index.alive:
+                    # a dead update-index never wrote what it was sent; replay it
+                    self.update_index.restart()
+                    paths = self._unflushed_paths
+                self.update_index.send("".join(f"{path}\0" for path in paths).encode())
+            except BrokenPipeError:
+                self.update_index.restart()
+                self.update_index.send(
+                    "".join(f"{path}\0" for path in self._unflushed_paths).encode()
+                )
+
+    def flush_index(self) -> Tuple[bool, str]:
+        self._unflushed_paths = []
+        with tracer.span("git update-index", "coprocess", flush=True) as span:
+            returncode, stderr = self.update_index.stop()
+            if span is not None:
+                span.args["exit_code"] = returncode
+        return returncode == 0, stderr
+
+    def close(self):
+        self.flush_index()
+        self.cat_file.stop()
+        self.hash_object.stop()
@@ -0,0 +1,484 @@
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Tuple
+import binascii
+import tempfile
+import hashlib
+import bisect
+import mmap
+import os
+import struct
+import zlib
+
+OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+TreeEntry = Tuple[str, str, str]  # (mode, name, hex sha)
+
+
+class BlobHashDelta:
+    def __init__(self):
+        self.added: Dict[str, str] = {}
+        self.modified: Dict[str, str] = {}
+        self.removed: List[str] = []
+
+    @classmethod
+    def between(cls, old: Dict[str, str], new: Dict[str, str]) -> "BlobHashDelta":
+        delta = cls()
+        for path, blob_hash in new.items():
+            if path not in old:
+                delta.added[path] = blob_hash
+            elif old[path] != blob_hash:
+                delta.modified[path] = blob_hash
+        delta.removed = [path for path in old if path not in new]
+        return delta
+
+    def update(self, other: "BlobHashDelta"):
+        self.added.update(other.added)
+        self.modified.update(other.modified)
+        self.removed.extend(other.removed)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.modified or self.removed)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "added": self.added,
+            "modified": self.modified,
+            "removed": sorted(self.removed),
+        }
+
+
+def find_git_dir(repo_dir: str) -> Optional[str]:
+    dot_git = os.path.join(repo_dir, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git
+
+    # worktrees and submodules use a `gitdir: <path>` file instead of a directory
+    if os.path.isfile(dot_git):
+        with open(dot_git) as file:
+            content = file.read().strip()
+        if content.startswith("gitdir:"):
+            git_dir = content[len("gitdir:") :].strip()
+            return os.path.normpath(os.path.join(repo_dir, git_dir))
+
+    return None
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    def read_varint(pos: int) -> Tuple[int, int]:
+        value = shift = 0
+        while True:
+            byte = delta[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, pos
+
+    source_size, pos = read_varint(0)
+    target_size, pos = read_varint(pos)
+    if source_size != len(base):
+        raise ValueError("delta base size mismatch")
+
+    out = bytearray()
+    while pos < len(delta):
+        opcode = delta[pos]
+        pos += 1
+        if opcode & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if opcode & (1 << (4 + i)):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset : offset + (size or 0x10000)]
+        elif opcode:
+            out += delta[pos : pos + opcode]
+            pos += opcode
+        else:
+            raise ValueError("invalid delta opcode")
+
+    if len(out) != target_size:
+        raise ValueError("delta target size mismatch")
+    return bytes(out)
+
+
+class IndexNames:
+    # the sorted object names of a pack index, sliced from the mapped file
+    # when bisect asks for them instead of copied into a list up front
+    def __init__(self, buffer, start: int, count: int):
+        self.buffer = buffer
+        self.start = start
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        start = self.start + index * 20
+        return self.buffer[start : start + 20]
+
+
+class PackFile:
+    def __init__(self, idx_path: str):
+        self.idx_path = idx_path
+        self.pack_path = idx_path[: -len(".idx")] + ".pack"
+
+        self._idx_file = open(idx_path, "rb")
+        try:
+            self._idx = mmap.mmap(self._idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._idx_file.close()
+            raise ValueError(f"empty pack index: {idx_path}")
+        idx = self._idx
+        if idx[:4] != b"\377tOc" or struct.unpack(">I", idx[4:8])[0] != 2:
+            self._idx.close()
+            self._idx_file.close()
+            raise ValueError(f"unsupported pack index: {idx_path}")
+
+        self.fanout = struct.unpack(">256I", idx[8 : 8 + 256 * 4])
+        count = self.fanout[-1]
+        names_start = 8 + 256 * 4
+        self.names = IndexNames(idx, names_start, count)
+        self.offsets_start = names_start + count * 20 + count * 4
+        self.large_start = self.offsets_start + count * 4
+
+        self._file = open(self.pack_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+        self._idx.close()
+        self._idx_file.close()
+
+    def find_offset(self, sha: bytes) -> Optional[int]:
+        lo = self.fanout[sha[0] - 1] if sha[0] else 0
+        hi = self.fanout[sha[0]]
+        i = bisect.bisect_left(self.names, sha, lo, hi)
+        if i == hi or self.names[i] != sha:
+            return None
+
+        (offset,) = struct.unpack_from(">I", self._idx, self.offsets_start + i * 4)
+        if offset & 0x80000000:
+            large = (offset & 0x7FFFFFFF) * 8
+            (offset,) = struct.unpack_from(">Q", self._idx, self.large_start + large)
+        return offset
+
+    def read_header(self, offset: int) -> Tuple[int, int, int]:
+        byte = self._map[offset]
+        offset += 1
+        obj_type = (byte >> 4) & 7
+        size = byte & 0x0F
+        shift = 4
+        while byte & 0x80:
+            byte = self._map[offset]
+            offset += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+        return obj_type, size, offset
+
+    def read_ofs_delta_base(self, offset: int) -> Tuple[int, int]:
+        byte = self._map[offset]
+        offset += 1
+        base = byte & 0x7F
+        while byte & 0x80:
+            byte = self._map[offset]
+            offset += 1
+            base = ((base + 1) << 7) | (byte & 0x7F)
+        return base, offset
+
+    def inflate(self, offset: int, size: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        out = bytearray()
+        chunk_size = max(size + 64, 4096)
+        while not decompressor.eof:
+            chunk = self._map[offset : offset + chunk_size]
+            if not chunk:
+                raise ValueError("truncated pack object")
+            out += decompressor.decompress(chunk)
+            offset += chunk_size
+        if len(out) != size:
+            raise ValueError("pack object size mismatch")
+        return bytes(out)
+
+
+class GitObjectStore:
+    def __init__(self, repo_dir: str, max_cached_trees: int = 100_000):
+        git_dir = find_git_dir(repo_dir)
+        if git_dir is None:
+            raise FileNotFoundError(f"not a git repository: {repo_dir}")
+
+        self.git_dir = git_dir
+        self.common_dir = git_dir
+        commondir_path = os.path.join(git_dir, "commondir")
+        if os.path.isfile(commondir_path):
+            with open(commondir_path) as file:
+                self.common_dir = os.path.normpath(
+                    os.path.join(git_dir, file.read().strip())
+                )
+
+        config_path = os.path.join(self.common_dir, "config")
+        if os.path.isfile(config_path):
+            with open(config_path) as file:
+                if "objectformat" in file.read().lower():
+                    raise ValueError("only sha1 repositories are supported")
+
+        self.objects_dir = os.path.join(self.common_dir, "objects")
+        self.max_cached_trees = max_cached_trees
+        self._trees: "OrderedDict[str, List[TreeEntry]]" = OrderedDict()
+        self._packs: Dict[str, PackFile] = {}
+        self._delta_bases: "OrderedDict[Tuple[str, int], Tuple[str, bytes]]" = (
+            OrderedDict()
+        )
+
+    def close(self):
+        for pack in self._packs.values():
+            pack.close()
+        self._packs.clear()
+
+    def _refresh_packs(self):
+        pack_dir = os.path.join(self.objects_dir, "pack")
+        if not os.path.isdir(pack_dir):
+            return
+        for name in os.listdir(pack_dir):
+            idx_path = os.path.join(pack_dir, name)
+            if name.endswith(".idx") and idx_path not in self._packs:
+                if os.path.exists(idx_path[: -len(".idx")] + ".pack"):
+                    self._packs[idx_path] = PackFile(idx_path)
+
+    def _read_loose(self, sha: str) -> Optional[Tuple[str, bytes]]:
+        path = os.path.join(self.objects_dir, sha[:2], sha[2:])
+        try:
+            with open(path, "rb") as file:
+                raw = zlib.decompress(file.read())
+        except FileNotFoundError:
+            return None
+
+        header, _, data = raw.partition(b"\0")
+        obj_type, size = header.decode().split()
+        if int(size) != len(data):
+            raise ValueError(f"corrupt loose object: {sha}")
+        return obj_type, data
+
+    def _read_packed(self, pack: PackFile, offset: int) -> Tuple[str, bytes]:
+        cache_key = (pack.idx_path, offset)
+        if cache_key in self._delta_bases:
+            self._delta_bases.move_to_end(cache_key)
+            return self._delta_bases[cache_key]
+
+        obj_type, size, data_offset = pack.read_header(offset)
+        if obj_type == OFS_DELTA:
+            distance, data_offset = pack.read_ofs_delta_base(data_offset)
+            base_type, base = self._read_packed(pack, offset - distance)
+            result = base_type, apply_delta(base, pack.inflate(data_offset, size))
+        elif obj_type == REF_DELTA:
+            base_sha = pack._map[data_offset : data_offset + 20].hex()
+            base_type, base = self.read_object(base_sha)
+            result = base_type, apply_delta(base, pack.inflate(data_offset + 20, size))
+        elif obj_type in OBJECT_TYPES:
+            result = OBJECT_TYPES[obj_type], pack.inflate(data_offset, size)
+        else:
+            raise ValueError(f"unknown pack object type {obj_type}")
+
+        # only delta bases are worth keeping, and they are usually trees
+        if result[0] != "blob":
+            self._delta_bases[cache_key] = result
+            if len(self._delta_bases) > 256:
+                self._delta_bases.popitem(last=False)
+        return result
+
+    def read_object(self, sha: str) -> Tuple[str, bytes]:
+        loose = self._read_loose(sha)
+        if loose is not None:
+            return loose
+
+        binary_sha = binascii.unhexlify(sha)
+        for attempt in range(2):
+            for pack in self._packs.values():
+                offset = pack.find_offset(binary_sha)
+                if offset is not None:
+                    return self._read_packed(pack, offset)
+            # a gc or fetch may have written new packs since we last looked
+            if attempt == 0:
+                self._refresh_packs()
+
+        raise KeyError(sha)
+
+    def write_blob(
+        self, chunks: Iterable[bytes], size: int, file_path: Optional[str] = None
+    ) -> str:
+        # streams `chunks` into a loose object, optionally writing the same
+        # bytes to `file_path` on the way; nothing is held in memory whole
+        header = f"blob {size}\0".encode()
+        sha = hashlib.sha1(header)
+        # git compresses loose objects for speed (core.looseCompression=1)
+        compressor = zlib.compressobj(1)
+        fd, temp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=self.objects_dir)
+        try:
+            written = 0
+            with os.fdopen(fd, "wb") as object_file, (
+                open(file_path, "wb") if file_path else nullcontext()
+            ) as file:
+                object_file.write(compressor.compress(header))
+                for chunk in chunks:
+                    written += len(chunk)
+                    sha.update(chunk)
+                    object_file.write(compressor.compress(chunk))
+                    if file is not None:
+                        file.write(chunk)
+                object_file.write(compressor.flush())
+            if written != size:
+                raise ValueError(f"blob size mismatch: {written} != {size}")
+
+            blob_hash = sha.hexdigest()
+            object_path = os.path.join(self.objects_dir, blob_hash[:2], blob_hash[2:])
+            if os.path.exists(object_path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                os.chmod(temp_path, 0o444)
+                os.replace(temp_path, object_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return blob_hash
+
+    def resolve_ref(self, ref: str = "HEAD") -> Optional[str]:
+        # None means an unborn branch. Refs kept in a reftable cannot be
+        # read here; HEAD then points at the placeholder refs/heads/.invalid,
+        # which would look unborn, so callers are sent to git instead
+        if os.path.isdir(os.path.join(self.common_dir, "reftable")):
+            raise ValueError("reftable ref storage is not supported")
+        for _ in range(10):
+            for base in (self.git_dir, self.common_dir):
+                path = os.path.join(base, ref)
+                if os.path.isfile(path):
+                    with open(path) as file:
+                        value = file.read().strip()
+                    break
+            else:
+                value = self._packed_ref(ref)
+                if value is None:
+                    return None
+
+            if value.startswith("ref:"):
+                ref = value[len("ref:") :].strip()
+                if ref == "refs/heads/.invalid":
+                    raise ValueError("HEAD points at refs/heads/.invalid")
+                continue
+            return value
+
+        raise ValueError(f"symbolic ref loop resolving {ref}")
+
+    def _packed_ref(self, ref: str) -> Optional[str]:
+        path = os.path.join(self.common_dir, "packed-refs")
+        if not os.path.isfile(path):
+            return None
+        with open(path) as file:
+            for line in file:
+                if line.startswith(("#", "^")):
+                    continue
+                sha, _, name = line.strip().partition(" ")
+                if name == ref:
+                    return sha
+        return None
+
+    def commit_tree(self, commit_sha: str) -> str:
+        obj_type, data = self.read_object(commit_sha)
+        if obj_type != "commit":
+            raise ValueError(f"{commit_sha} is a {obj_type}, not a commit")
+        for line in data.split(b"\n"):
+            if line.startswith(b"tree "):
+                return line[5:].decode()
+        raise ValueError(f"commit {commit_sha} has no tree")
+
+    def read_tree(self, tree_sha: str) -> List[TreeEntry]:
+        if tree_sha in self._trees:
+            self._trees.move_to_end(tree_sha)
+            return self._trees[tree_sha]
+
+        obj_type, data = self.read_object(tree_sha)
+        if obj_type != "tree":
+            raise ValueError(f"{tree_sha} is a {obj_type}, not a tree")
+
+        entries = []
+        pos = 0
+        while pos < len(data):
+            space = data.index(b" ", pos)
+            nul = data.index(b"\0", space)
+            mode = data[pos:space].decode()
+            name = data[space + 1 : nul].decode("utf-8", "surrogateescape")
+            entries.append((mode, name, data[nul + 1 : nul + 21].hex()))
+            pos = nul + 21
+
+        self._trees[tree_sha] = entries
+        if len(self._trees) > self.max_cached_trees:
+            self._trees.popitem(last=False)
+        return entries
+
+    def walk_tree(self, tree_sha: str, prefix: str = "") -> Dict[str, str]:
+        blobs = {}
+        for mode, name, sha in self.read_tree(tree_sha):
+            path = f"{prefix}{name}"
+            if mode == "40000":
+                blobs.update(self.walk_tree(sha, f"{path}/"))
+            else:
+                blobs[path] = sha
+        return blobs
+
+    def head_tree(self) -> Optional[str]:
+        head = self.resolve_ref("HEAD")
+        return self.commit_tree(head) if head else None
+
+    def head_blob_hashes(self) -> Dict[str, str]:
+        tree_sha = self.head_tree()
+        return self.walk_tree(tree_sha) if tree_sha else {}
+
+    def diff_trees(
+        self, old_tree: Optional[str], new_tree: Optional[str], prefix: str = ""
+    ) -> BlobHashDelta:
+        delta = BlobHashDelta()
+        if old_tree == new_tree:
+            return delta
+
+        old_entries = {
+            name: (mode, sha)
+            for mode, name, sha in (self.read_tree(old_tree) if old_tree else [])
+        }
+        new_entries = {
+            name: (mode, sha)
+            for mode, name, sha in (self.read_tree(new_tree) if new_tree else [])
+        }
+
+        for name in old_entries.keys() | new_entries.keys():
+            old_mode, old_sha = old_entries.get(name, (None, None))
+            new_mode, new_sha = new_entries.get(name, (None, None))
+            if (old_mode, old_sha) == (new_mode, new_sha):
+                continue
+
+            path = f"{prefix}{name}"
+            old_is_tree, new_is_tree = old_mode == "40000", new_mode == "40000"
+            if old_is_tree or new_is_tree:
+                delta.update(
+                    self.diff_trees(
+                        old_sha if old_is_tree else None,
+                        new_sha if new_is_tree else None,
+                        f"{path}/",
+                    )
+                )
+            if old_mode is not None and not old_is_tree:
+                if new_mode is not None and not new_is_tree:
+                    delta.modified[path] = new_sha
+                    continue
+                delta.removed.append(path)
+            if new_mode is not None and not new_is_tree:
+                delta.added[path] = new_sha
+
+        return delta
@@ -1,10 +1,52 @@
-from models import RepoToolInput, Requirement
+from models import (
+    RepoToolInput,
+    Requirement,
+    RepoChange,
+    Action,
+    ResourceLimits,
+    SessionResult,
+)
 from repo_tool import RepoTool
+from async_repo_tool import AsyncRepoTool
+from git_objects import BlobHashDelta
+from client import ChatClient
+from response_cache import cache_from_env
+from schemas import json_schema, parse_arguments
+from patch_engine import PatchResult
+from tracing import configure_from_env
+from conversation import Conversation, BLOB_HASH_SNAPSHOT, BLOB_HASH_DELTA
+from file_context import ContextDelivery
+from build_cache import BUILD_ROOT_ENV, DEFAULT_BUILD_ROOT, COMPILER_CACHE_ENV
+from change_journal import WATCH_CHANGES_ENV
 from rich import print
-import requests
-import json
+from typing import Callable, Dict, List, Optional
+import asyncio
 import os
 
+SYSTEM_PROMPT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "system.txt"
+)
+DEFAULT_REQUIREMENT = "build a CMake project and execute the binary named `hello` -- expected result is that it outputs `hello world` to stdout."
+
+# a hanging or runaway build must not stall the conversation loop
+VERIFICATION_LIMITS = ResourceLimits(wall_seconds=600, command_wall_seconds=300)
+# rough size of the messages sent with every request; older turns are folded
+# and dropped to stay under it
+CONTEXT_TOKEN_BUDGET = 24_000
+# verification output kept in memory per run (head and tail, the middle is
+# dropped); concurrent batch sessions would otherwise hold whole build logs
+VERIFICATION_OUTPUT_BYTES = 64 * 1024
+# characters of file contents shipped with one blob hash report
+FILE_CONTENTS_BUDGET = 16_000
+# builds persist between iterations; the compiler cache and the inotify
+# change journal (for very large checkouts) are opt-in
+REPO_TOOL_OPTIONS = {
+    "limits": VERIFICATION_LIMITS,
+    "max_output_bytes": VERIFICATION_OUTPUT_BYTES,
+    "build_root": os.getenv(BUILD_ROOT_ENV, DEFAULT_BUILD_ROOT),
+    "compiler_cache": os.getenv(COMPILER_CACHE_ENV),
+    "watch_changes": os.getenv(WATCH_CHANGES_ENV) == "1",
+}
 
 tools = [
     {
@@ -12,7 +54,7 @@ tools = [
         "function": {
             "name": "implement_changes",
             "description": "Implement changes on repository described by JSON representation of RepoToolInput",
-            "parameters": RepoToolInput.model_json_schema(),
+            "parameters": json_schema(RepoToolInput),
         },
     },
     {
@@ -20,84 +62,230 @@ tools = [
         "function": {
             "name": "check_requirements",
             "description": "Checks to see if the requirement described by the given JSON representation is fulfilled. Returns a boolean `is_fulfilled` indicating success if true, and an str `output` (especially useful if unsuccessful).",
-            "parameters": Requirement.model_json_schema(),
+            "parameters": json_schema(Requirement),
         },
     },
 ]
 
 
-def main():
-    headers = {
-        "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
-        "Content-Type": "application/json",
-    }
+def blob_hash_message(delta: BlobHashDelta, first: bool) -> str:
+    if first:
+        return f"current blob hashes: {delta.added}"
+    if not delta:
+        return "blob hashes unchanged since last report"
+    return f"blob hash changes since last report: {delta.to_dict()}"
+
+
+def tool_result_message(
+    is_fulfilled: bool,
+    output: str,
+    patch_results: List[PatchResult],
+    excerpts: str = "",
+    reverted: bool = False,
+) -> str:
+    content = f"{is_fulfilled=}, {output=}"
+    if reverted:
+        content += (
+            "\nnot every hunk applied, so NONE of the changes from the last"
+            " implement_changes call were kept: files created or patched by it"
+            " are back to how they were before it"
+        )
+    failed = [
+        f"{result.file_name} @@ {hunk.diff_range} @@: {hunk.message}"
+        for result in patch_results
+        for hunk in result.hunks
+        if not hunk.applied
+    ]
+    if failed:
+        content += "\nhunks that failed to apply:\n" + "\n".join(failed)
+    if excerpts:
+        content += "\nthe lines around them as they are now:\n" + excerpts
+    return content
+
+
+def stream_repo_changes(
+    client: ChatClient, payload: dict, rt: RepoTool
+) -> (dict, RepoToolInput, bool):
+    applied, parsed = [], []
+
+    def on_change(change: RepoChange):
+        # file creations can land while the rest of the response streams in,
+        # as long as nothing before them is still waiting to be applied
+        if len(applied) == len(parsed) and change.file_action:
+            if change.file_action.action == Action.CREATE:
+                rt.implement_changes(RepoToolInput(changes=[change]))
+                applied.append(change)
+        parsed.append(change)
+
+    # a batch whose patches do not all apply is undone as a whole, so the
+    # model never has to reason about a half-applied change
+    snapshot = rt.snapshot()
+    reverted = False
+    try:
+        message = client.stream(payload, on_change)
+        args = message["tool_calls"][0]["function"]["arguments"]
+        repo_changes = parse_arguments(RepoToolInput, args)
+        rt.implement_changes(
+            RepoToolInput(changes=repo_changes.changes[len(applied) :])
+        )
+        if not all(result.applied for result in rt.patch_results):
+            rt.rollback(snapshot)
+            reverted = True
+    except Exception:
+        rt.rollback(snapshot)
+        raise
+    finally:
+        snapshot.discard()
+    return message, repo_changes, reverted
+
+
+def speculative_turn(
+    client: ChatClient,
+    payload: dict,
+    rt: RepoTool,
+    requirement: Requirement,
+    candidates: int,
+    commit_counter: int,
+) -> (dict, bool, str):
+    # ask for several alternative change sets at once and try them side by
+    # side; the first to pass is kept, otherwise the first one is, so the
+    # conversation continues from a single history
+    messages, changes = [], []
+    for message in client.complete_choices(payload, candidates):
+        try:
+            arguments = message["tool_calls"][0]["function"]["arguments"]
+            changes.append(parse_arguments(RepoToolInput, arguments))
+        except (KeyError, IndexError, ValueError):
+            continue
+        messages.append(message)
+    if not messages:
+        raise ValueError("no candidate called implement_changes")
+
+    # worktrees need a commit to branch from
+    if not RepoTool.run_command("git rev-parse --verify -q HEAD", rt.repo_dir)[0]:
+        rt.commit("initial commit", allow_empty=True)
+    winner, results = rt.evaluate_candidates(
+        changes, requirement, message=f"commit #{commit_counter}"
+    )
+    chosen = results[winner if winner is not None else 0]
+    if not rt.adopt_candidate(chosen):
+        return messages[chosen.index], False, chosen.output
+    return messages[chosen.index], chosen.fulfilled, chosen.output
 
-    url = "https://api.openai.com/v1/chat/completions"
 
-    dir_name = "cpp_hello"
-    rt = RepoTool(dir_name)
-    os.makedirs(dir_name, exist_ok=True)
-    RepoTool.run_command("git init", cwd=rt.repo_dir)
+async def run_session_async(
+    client: ChatClient,
+    repo_dir: str,
+    requirement_text: str = DEFAULT_REQUIREMENT,
+    max_iterations: Optional[int] = None,
+    confirm: Optional[Callable[[], bool]] = None,
+    log: Callable = print,
+    repo_tool_options: Optional[Dict] = None,
+    candidates: int = 1,
+) -> SessionResult:
+    # one requirement, one repository: ask for verification commands, then
+    # alternate between changes and verification until the requirement holds,
+    # `confirm` says no or max_iterations rounds of changes were made. Work
+    # that does not depend on the previous step overlaps with it: the
+    # repository is set up while the requirement is requested, HEAD's trees
+    # are read while the model answers and the next blob hash report is
+    # computed while verification runs
+    os.makedirs(repo_dir, exist_ok=True)
+    if repo_tool_options is None:
+        repo_tool_options = REPO_TOOL_OPTIONS
+    rt = AsyncRepoTool(repo_dir, **repo_tool_options)
+    delivery = ContextDelivery(rt.repo_tool, max_bytes=FILE_CONTENTS_BUDGET)
 
     messages = [
         {
             "role": "system",
-            "content": open("system.txt").read(),
+            "content": open(SYSTEM_PROMPT_PATH).read(),
         },
         {
             "role": "user",
-            "content": "Requirement: build a CMake project and execute the binary named `hello` -- expected result is that it outputs `hello world` to stdout.",
+            "content": f"Requirement: {requirement_text}",
         },
     ]
+    # the system prompt and the requirement stay pinned
+    conversation = Conversation(
+        messages, pinned=len(messages), token_budget=CONTEXT_TOKEN_BUDGET
+    )
 
     payload = {
-        "messages": messages,
+        "messages": conversation.messages,
         "model": "gpt-4-1106-preview",
         "tools": tools,
         "tool_choice": {"type": "function", "function": {"name": "check_requirements"}},
     }
 
-    request = requests.post(url, json=payload, headers=headers)
-    json_data = json.loads(request.content.decode())
+    try:
+        message, _ = await asyncio.gather(
+            asyncio.to_thread(client.complete, payload),
+            AsyncRepoTool.run_command("git init", cwd=rt.repo_dir),
+        )
 
-    # print(json.dumps(json_data, indent=4))
+        conversation.append(message)
+        tool_call = message["tool_calls"][0]
+        args = tool_call["function"]["arguments"]
 
-    message = json_data["choices"][0]["message"]
+        requirement = parse_arguments(Requirement, args)
+        log(requirement)
 
-    messages.append(message)
-    tool_call = message["tool_calls"][0]
-    args = tool_call["function"]["arguments"]
+        (is_fulfilled, output), delta = await asyncio.gather(
+            rt.requirement_is_fulfilled(requirement), rt.fetch_blob_hash_delta()
+        )
 
-    requirement = Requirement.model_validate_json(args)
-    print(requirement)
+        log(f"{is_fulfilled=}, {output=}")
 
-    is_fulfilled, output = rt.requirement_is_fulfilled(requirement)
+        commit_counter = 1
+        # whether the last batch was rolled back because a hunk failed
+        reverted = False
 
-    print(f"{is_fulfilled=}, {output=}")
+        while not is_fulfilled:
+            if max_iterations is not None and commit_counter > max_iterations:
+                break
+            if confirm is not None and not await asyncio.to_thread(confirm):
+                break
 
-    commit_counter = 1
-
-    while True:
-        if input("Generate repository changes? (y/n) ").lower() == "y":
             # add the tool call result message
-            messages.append(
+            conversation.append(
                 {
                     "role": "tool",
                     "tool_call_id": tool_call["id"],
                     "name": tool_call["function"]["name"],
-                    "content": f"{is_fulfilled=}, {output=}",
+                    "content": tool_result_message(
+                        is_fulfilled,
+                        output,
+                        rt.repo_tool.patch_results,
+                        delivery.failed_hunk_excerpts(rt.repo_tool.patch_results),
+                        reverted,
+                    ),
                 }
             )
 
-            messages.append(
+            conversation.compact()
+            snapshot = commit_counter == 1 or conversation.blob_hashes_dropped
+            if conversation.blob_hashes_dropped:
+                # earlier reports were compacted away, so list every path again
+                # and ship the contents that went with them again too
+                rt.reset_blob_hash_report()
+                delta = await rt.fetch_blob_hash_delta()
+                delivery.reset()
+                conversation.blob_hashes_dropped = False
+            report = blob_hash_message(delta, snapshot)
+            contents = delivery.contents_message([*delta.added, *delta.modified])
+            if contents:
+                report += "\n\n" + contents
+            conversation.append(
                 {
                     "role": "user",
-                    "content": f"current blob hashes: {rt.fetch_blob_hashes()}",
-                }
+                    "content": report,
+                },
+                kind=BLOB_HASH_SNAPSHOT if snapshot else BLOB_HASH_DELTA,
             )
 
             payload = {
-                "messages": messages,
+                "messages": conversation.messages,
                 "model": "gpt-4-1106-preview",
                 "tools": tools,
                 "tool_choice": {
@@ -106,33 +294,99 @@ def main():
                 },
             }
 
-            response = requests.post(url, json=payload, headers=headers)
-            json_data = json.loads(response.content.decode())
-            message = json_data["choices"][0]["message"]
-            messages.append(message)
-
+            # while the model answers, read HEAD's trees so the object store
+            # has them cached when the changes land and the next delta is
+            # computed
+            prefetch = asyncio.create_task(rt.fetch_blob_hashes())
+            try:
+                if candidates > 1:
+                    message, is_fulfilled, output = await asyncio.to_thread(
+                        speculative_turn,
+                        client,
+                        payload,
+                        rt.repo_tool,
+                        requirement,
+                        candidates,
+                        commit_counter,
+                    )
+                else:
+                    message, repo_changes, reverted = await asyncio.to_thread(
+                        stream_repo_changes, client, payload, rt.repo_tool
+                    )
+            finally:
+                await prefetch
+            conversation.append(message)
             tool_call = message["tool_calls"][0]
-            args = tool_call["function"]["arguments"]
 
-            repo_changes = RepoToolInput.model_validate_json(args)
-            print(repo_changes)
-            rt.implement_changes(repo_changes)
-            RepoTool.run_command(
-                f"git commit -m 'commit #{commit_counter}'", cwd=rt.repo_dir
-            )
+            if candidates > 1:
+                reverted = False
+                commit_counter += 1
+                log(f"{is_fulfilled=}, {output=}")
+                delta = await rt.fetch_blob_hash_delta()
+                continue
+
+            log(repo_changes)
+            await rt.commit(f"commit #{commit_counter}")
             commit_counter += 1
 
-            is_fulfilled, output = rt.requirement_is_fulfilled(requirement)
-            print(f"{is_fulfilled=}, {output=}")
+            (is_fulfilled, output), delta = await asyncio.gather(
+                rt.requirement_is_fulfilled(requirement), rt.fetch_blob_hash_delta()
+            )
+            log(f"{is_fulfilled=}, {output=}")
+    finally:
+        rt.close()
 
-            if is_fulfilled:
-                print("requirements fulfilled!")
-                exit(0)
+    return SessionResult(
+        fulfilled=is_fulfilled,
+        iterations=commit_counter - 1,
+        output=output,
+        requirement=requirement,
+    )
 
-        else:
-            print("До свидания!")
-            exit(0)
+
+def run_session(
+    client: ChatClient,
+    repo_dir: str,
+    requirement_text: str = DEFAULT_REQUIREMENT,
+    max_iterations: Optional[int] = None,
+    confirm: Optional[Callable[[], bool]] = None,
+    log: Callable = print,
+    repo_tool_options: Optional[Dict] = None,
+    candidates: int = 1,
+) -> SessionResult:
+    # the same session for callers without an event loop (batch workers)
+    return asyncio.run(
+        run_session_async(
+            client,
+            repo_dir,
+            requirement_text,
+            max_iterations,
+            confirm,
+            log,
+            repo_tool_options,
+            candidates,
+        )
+    )
+
+
+async def async_main():
+    client = ChatClient(cache=cache_from_env())
+    result = await run_session_async(
+        client,
+        "cpp_hello",
+        confirm=lambda: input("Generate repository changes? (y/n) ").lower() == "y",
+    )
+    if result.fulfilled:
+        print("requirements fulfilled!")
+    else:
+        print("До свидания!")
+
+
+def main():
+    asyncio.run(async_main())
 
 
 if __name__ == "__main__":
+    # GITPT_TRACE=trace.jsonl / GITPT_CHROME_TRACE=trace.json turn tracing on
+    configure_from_env()
     main()
@@ -1,6 +1,12 @@
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator
 from pydantic import BaseModel, Field
 from enum import Enum
+import binascii
+import re
+
+# characters per slice when streaming file content, ~1MB
+CONTENT_SLICE_CHARS = 1 << 20
+NOT_BASE64 = re.compile(r"[^A-Za-z0-9+/=]")
 
 
 class Action(str, Enum):
@@ -8,12 +14,51 @@ class Action(str, Enum):
     DELETE = "delete"
 
 
+class ContentEncoding(str, Enum):
+    TEXT = "text"
+    BASE64 = "base64"
+
+
 class FileAction(BaseModel):
     action: Action = Field(description="File action, e.g. `create` or `delete`")
     file_name: str = Field(description="Name of file to create or delete")
     content: Optional[str] = Field(
         description="Optional content for file creation", default=None
     )
+    content_chunks: Optional[List[str]] = Field(
+        description="Optional further content for file creation, appended in order after `content`",
+        default=None,
+    )
+    encoding: ContentEncoding = Field(
+        description="Encoding of `content` and `content_chunks`: `text` for UTF-8 text, `base64` for binary files",
+        default=ContentEncoding.TEXT,
+    )
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        # the file's bytes in slices of bounded size, however large the content
+        pieces = [self.content or "", *(self.content_chunks or [])]
+        if self.encoding == ContentEncoding.TEXT:
+            for piece in pieces:
+                for start in range(0, len(piece), CONTENT_SLICE_CHARS):
+                    yield piece[start : start + CONTENT_SLICE_CHARS].encode()
+            return
+
+        # base64 is decoded in groups of four characters, carried across pieces
+        carry = ""
+        for piece in pieces:
+            for start in range(0, len(piece), CONTENT_SLICE_CHARS):
+                text = carry + NOT_BASE64.sub(
+                    "", piece[start : start + CONTENT_SLICE_CHARS]
+                )
+                usable = len(text) - len(text) % 4
+                carry = text[usable:]
+                if usable:
+                    yield binascii.a2b_base64(text[:usable])
+        if carry:
+            raise ValueError(f"truncated base64 content for {self.file_name}")
+
+    def content_size(self) -> int:
+        return sum(len(data) for data in self.iter_bytes())
 
 
 class DirectoryAction(BaseModel):
@@ -31,16 +76,20 @@ class Patch(BaseModel):
         description="List of changes to file, of the form `+<content>` (indicating addition), `-<content>` (indicating removal) or ` <content>` (indicating no change)"
     )
 
+    def to_patch(self) -> str:
+        lines = [
+            f"diff --git a/{self.file_name} b/{self.file_name}",
+            f"index {self.blob_hash}..0000000 100644",
+            f"--- a/{self.file_name}",
+            f"+++ b/{self.file_name}",
+            f"@@ {self.diff_range} @@",
+            *self.changes,
+        ]
+        return "\n".join(lines) + "\n"
+
     def to_patch_file(self, file_path: str):
         with open(file_path, "w") as patch_file:
-            patch_file.write(f"diff --git a/{self.file_name} b/{self.file_name}\n")
-            patch_file.write(f"index {self.blob_hash}..0000000 100644\n")
-            patch_file.write(f"--- a/{self.file_name}\n")
-            patch_file.write(f"+++ b/{self.file_name}\n")
-            patch_file.write(f"@@ {self.diff_range} @@\n")
-
-            for change in self.changes:
-                patch_file.write(f"{change}\n")
+            patch_file.write(self.to_patch())
 
 
 class RepoChange(BaseModel):
@@ -70,6 +119,48 @@ class Requirement(BaseModel):
     expected_output: str = Field(
         description="Expected output from the verification commands to consider the requirement fulfilled"
     )
+    verification_inputs: List[List[str]] = Field(
+        description="For each verification command, glob patterns of the repository files it reads (e.g. `**/CMakeLists.txt` for a configure step). A command whose inputs are unchanged since it last succeeded is skipped; an empty list means it always runs",
+        default_factory=list,
+    )
+
+
+class ResourceLimits(BaseModel):
+    wall_seconds: Optional[float] = Field(
+        description="Wall-clock limit for the whole verification", default=None
+    )
+    command_wall_seconds: Optional[float] = Field(
+        description="Wall-clock limit for each verification command", default=None
+    )
+    cpu_seconds: Optional[int] = Field(
+        description="CPU time limit (RLIMIT_CPU) for every process", default=None
+    )
+    memory_bytes: Optional[int] = Field(
+        description="Address space limit (RLIMIT_AS) for every process", default=None
+    )
+
+
+class VerificationStatus(str, Enum):
+    FULFILLED = "fulfilled"
+    UNFULFILLED = "unfulfilled"
+    TIMED_OUT = "timed_out"
+
+
+class VerificationResult(BaseModel):
+    status: VerificationStatus
+    output: str
+
+    @property
+    def is_fulfilled(self) -> bool:
+        return self.status == VerificationStatus.FULFILLED
+
+
+class SessionResult(BaseModel):
+    fulfilled: bool
+    # rounds of repository changes that were made
+    iterations: int
+    output: str
+    requirement: Optional[Requirement] = None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+class BoundedCapture:
+    # keeps the first `head_bytes` and the last `tail_bytes` of a stream and
+    # forgets the middle, while tracking the last non-empty line seen
+    def __init__(self, head_bytes: int, tail_bytes: int):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self._partial_line = bytearray()
+        self._last_line = b""
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > self.head_bytes + self.tail_bytes
+
+    def write(self, data: bytes):
+        self.total_bytes += len(data)
+
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            # trim lazily so the copy cost stays amortised
+            if len(self.tail) > 2 * self.tail_bytes:
+                del self.tail[: len(self.tail) - self.tail_bytes]
+
+    def track_lines(self, data: bytes):
+        *complete, partial = data.split(b"\n")
+        if complete:
+            lines = [bytes(self._partial_line) + complete[0], *complete[1:]]
+            for line in reversed(lines):
+                if line.strip():
+                    self._last_line = line
+                    break
+            self._partial_line = bytearray()
+        self._partial_line += partial
+        # a single endless line must not grow without bound either
+        if self.tail_bytes and len(self._partial_line) > self.tail_bytes:
+            del self._partial_line[: len(self._partial_line) - self.tail_bytes]
+
+    @property
+    def last_line(self) -> str:
+        line = self._partial_line if self._partial_line.strip() else self._last_line
+        return bytes(line).decode(errors="replace").strip()
+
+    def text(self) -> str:
+        tail = self.tail[-self.tail_bytes :] if self.tail_bytes else b""
+        if not self.truncated:
+            return (self.head + self.tail).decode(errors="replace")
+
+        omitted = self.total_bytes - len(self.head) - len(tail)
+        return (
+            self.head.decode(errors="replace")
+            + f"\n... [{omitted} bytes omitted] ...\n"
+            + tail.decode(errors="replace")
+        )
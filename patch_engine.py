@@ -0,0 +1,242 @@
+from models import Patch
+
+
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
+import re
+import os
+
+DIFF_RANGE_PATTERN = re.compile(r"-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?")
+
+
+class HunkResult(BaseModel):
+    diff_range: str
+    applied: bool
+    # how far from the line given in diff_range the hunk was found
+    offset: int = 0
+    # how many leading/trailing context lines had to be ignored to match
+    fuzz: int = 0
+    message: str = ""
+
+
+class PatchResult(BaseModel):
+    file_name: str
+    hunks: List[HunkResult]
+
+    @property
+    def applied(self) -> bool:
+        return all(hunk.applied for hunk in self.hunks)
+
+
+def parse_diff_range(diff_range: str) -> Tuple[int, int, int, int]:
+    match = DIFF_RANGE_PATTERN.search(diff_range)
+    if match is None:
+        raise ValueError(f"invalid diff range: {diff_range!r}")
+    old_start, old_count, new_start, new_count = match.groups()
+    return (
+        int(old_start),
+        int(old_count) if old_count is not None else 1,
+        int(new_start),
+        int(new_count) if new_count is not None else 1,
+    )
+
+
+def split_changes(changes: List[str]) -> Tuple[List[str], List[str], int, int]:
+    old_lines, new_lines = [], []
+    for change in changes:
+        if change.startswith("\\"):  # "\ No newline at end of file"
+            continue
+        marker, content = (change[0], change[1:]) if change else (" ", "")
+        if marker not in " +-":
+            # models sometimes drop the leading space of context lines
+            marker, content = " ", change
+        if marker in " -":
+            old_lines.append(content)
+        if marker in " +":
+            new_lines.append(content)
+
+    leading = 0
+    for change in changes:
+        if change[:1] not in ("", " "):
+            break
+        leading += 1
+    trailing = 0
+    for change in reversed(changes):
+        if change[:1] not in ("", " "):
+            break
+        trailing += 1
+    return old_lines, new_lines, leading, trailing
+
+
+def find_block(
+    lines: List[str], block: List[str], expected: int, search_window: Optional[int]
+) -> Optional[int]:
+    last_start = len(lines) - len(block)
+    if last_start < 0:
+        return None
+
+    expected = min(max(expected, 0), last_start)
+    max_distance = max(expected, last_start - expected)
+    if search_window is not None:
+        max_distance = min(max_distance, search_window)
+
+    # nearest match wins, trying positions on both sides of the expected one
+    for distance in range(max_distance + 1):
+        for start in (expected - distance, expected + distance):
+            if 0 <= start <= last_start and lines[start : start + len(block)] == block:
+                return start
+            if distance == 0:
+                break
+    return None
+
+
+def apply_hunk(
+    lines: List[str],
+    patch: Patch,
+    line_offset: int = 0,
+    max_fuzz: int = 2,
+    search_window: Optional[int] = None,
+) -> Tuple[List[str], HunkResult, int]:
+    try:
+        old_start, old_count, _, _ = parse_diff_range(patch.diff_range)
+    except ValueError as error:
+        return (
+            lines,
+            HunkResult(diff_range=patch.diff_range, applied=False, message=str(error)),
+            0,
+        )
+
+    old_lines, new_lines, leading, trailing = split_changes(patch.changes)
+    # a hunk that removes nothing inserts *after* old_start
+    expected = old_start if old_count == 0 or not old_lines else old_start - 1
+    expected += line_offset
+
+    for fuzz in range(max_fuzz + 1):
+        trim_leading = min(fuzz, leading)
+        trim_trailing = min(fuzz, trailing)
+        if fuzz and not (trim_leading or trim_trailing):
+            break
+        if trim_leading + trim_trailing >= len(old_lines) and old_lines:
+            break
+
+        old_block = old_lines[trim_leading : len(old_lines) - trim_trailing]
+        new_block = new_lines[trim_leading : len(new_lines) - trim_trailing]
+        start = find_block(lines, old_block, expected + trim_leading, search_window)
+        if start is None:
+            continue
+
+        result = HunkResult(
+            diff_range=patch.diff_range,
+            applied=True,
+            offset=start - trim_leading - expected,
+            fuzz=fuzz,
+        )
+        new_file = lines[:start] + new_block + lines[start + len(old_block) :]
+        # later hunks are most likely displaced by the same amount
+        return new_file, result, len(new_block) - len(old_block) + result.offset
+
+    return (
+        lines,
+        HunkResult(
+            diff_range=patch.diff_range,
+            applied=False,
+            message="context did not match: expected\n"
+            + "\n".join(old_lines[:10])
+            + ("\n..." if len(old_lines) > 10 else ""),
+        ),
+        0,
+    )
+
+
+def invalid_path(repo_dir: str, file_name: str) -> bool:
+    # what `git apply` refuses as "invalid path": anything that resolves
+    # outside the checkout (absolute, `..`, symlinks) or into .git
+    repo_dir = os.path.realpath(repo_dir)
+    file_path = os.path.realpath(os.path.join(repo_dir, file_name))
+    if os.path.commonpath([repo_dir, file_path]) != repo_dir or file_path == repo_dir:
+        return True
+    return ".git" in os.path.relpath(file_path, repo_dir).split(os.sep)
+
+
+def failed_result(file_name: str, patches: List[Patch], message: str) -> PatchResult:
+    return PatchResult(
+        file_name=file_name,
+        hunks=[
+            HunkResult(diff_range=patch.diff_range, applied=False, message=message)
+            for patch in patches
+        ],
+    )
+
+
+def apply_patches(
+    repo_dir: str,
+    patches: List[Patch],
+    max_fuzz: int = 2,
+    search_window: Optional[int] = None,
+) -> List[PatchResult]:
+    # every file is read and written once, however many hunks touch it
+    by_file: Dict[str, List[Patch]] = {}
+    for patch in patches:
+        by_file.setdefault(patch.file_name, []).append(patch)
+
+    results = []
+    for file_name, file_patches in by_file.items():
+        if invalid_path(repo_dir, file_name):
+            results.append(
+                failed_result(file_name, file_patches, f"invalid path {file_name}")
+            )
+            continue
+        file_path = os.path.join(repo_dir, file_name)
+        try:
+            # undecodable bytes survive the round trip as lone surrogates,
+            # so a Latin-1 file is patched instead of raising
+            with open(
+                file_path, newline="", encoding="utf-8", errors="surrogateescape"
+            ) as file:
+                content = file.read()
+        except FileNotFoundError:
+            # pure additions to a missing file create it
+            if any(
+                change[:1] in (" ", "-")
+                for patch in file_patches
+                for change in patch.changes
+            ):
+                results.append(
+                    failed_result(
+                        file_name, file_patches, f"{file_name} does not exist"
+                    )
+                )
+                continue
+            content = ""
+
+        separator = "\r\n" if "\r\n" in content else "\n"
+        lines = content.split(separator) if content else []
+        keep_trailing_newline = not content or lines[-1] == ""
+        if content and lines[-1] == "":
+            lines.pop()
+
+        hunks = []
+        line_offset = 0
+        for patch in file_patches:
+            lines, hunk, shift = apply_hunk(
+                lines, patch, line_offset, max_fuzz, search_window
+            )
+            hunks.append(hunk)
+            line_offset += shift
+
+        if any(hunk.applied for hunk in hunks):
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            with open(
+                file_path,
+                "w",
+                newline="",
+                encoding="utf-8",
+                errors="surrogateescape",
+            ) as file:
+                file.write(separator.join(lines))
+                if lines and keep_trailing_newline:
+                    file.write(separator)
+
+        results.append(PatchResult(file_name=file_name, hunks=hunks))
+
+    return results
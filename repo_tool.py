@@ -1,86 +1,451 @@
-from models import RepoToolInput, Requirement, Action
+from models import (
+    RepoToolInput,
+    Requirement,
+    Action,
+    Patch,
+    FileAction,
+    ResourceLimits,
+    VerificationResult,
+    VerificationStatus,
+)
+from git_objects import GitObjectStore, BlobHashDelta, find_git_dir
+from git_coprocess import GitCoprocesses
+from verification_cache import VerificationCache, StepMemo
+from patch_engine import apply_patches, PatchResult
+from tracing import tracer
+from supervisor import run_supervised
+from build_cache import build_dir_for, build_environment
+from snapshot import WorkspaceSnapshot, status_paths
+from change_journal import ChangeJournal
 
 
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
+import multiprocessing
 import subprocess
+import threading
+import tempfile
+import fnmatch
+import uuid
+import hashlib
+import fcntl
+import shlex
 import shutil
+import time
+import zlib
 import os
 
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+# worker processes for parallel verification start from a clean server
+# process: forking this one, whose other threads (batch jobs, tracing) may
+# hold locks at that moment, can deadlock the child
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+# written into the build directory once memoized steps have run in it
+STEP_MEMO_MARKER = ".gitpt-steps"
+
+
+class CandidateResult(BaseModel):
+    index: int
+    fulfilled: bool
+    output: str
+    # the candidate committed on top of the base commit, None if that failed
+    commit: Optional[str] = None
+    patch_results: List[PatchResult] = []
+
 
 class RepoTool:
-    def __init__(self, repo_dir: str):
+    def __init__(
+        self,
+        repo_dir: str,
+        batch_changes: bool = True,
+        persistent_git: bool = False,
+        verification_cache: Optional[VerificationCache] = None,
+        patch_fuzz: int = 2,
+        max_output_bytes: Optional[int] = None,
+        spill_dir: Optional[str] = None,
+        limits: Optional[ResourceLimits] = None,
+        build_root: Optional[str] = None,
+        compiler_cache: Optional[str] = None,
+        memoize_steps: bool = True,
+        watch_changes: bool = False,
+        cancel_path: Optional[str] = None,
+    ):
         self.repo_dir = repo_dir
+        # when batching, patches are applied together (one read/write per file)
+        # and the index is written once at the end of the call
+        self.batch_changes = batch_changes
+        self._object_store: Optional[GitObjectStore] = None
+        # the object store's caches and the coprocess pipes are not
+        # thread-safe; an async session reads blob hashes on one thread
+        # while another verifies or applies changes
+        self._state_lock = threading.RLock()
+        # keep cat-file/hash-object/update-index running for the repo's lifetime
+        self._git: Optional[GitCoprocesses] = (
+            GitCoprocesses(repo_dir) if persistent_git else None
+        )
+        self.verification_cache = verification_cache
+        self.patch_fuzz = patch_fuzz
+        # when set, verification output is streamed into a bounded head+tail
+        # buffer instead of being held in memory whole; spill_dir keeps the
+        # full logs gzipped on disk
+        self.max_output_bytes = max_output_bytes
+        self.spill_dir = spill_dir
+        # default wall-clock/CPU/memory limits for every verification
+        self.limits = limits
+        # when set, verification commands get a persistent out-of-tree build
+        # directory in $GITPT_BUILD_DIR, and compiles run through a cache
+        self.build_root = build_root
+        self.compiler_cache = compiler_cache
+        # verification steps whose declared inputs did not change since they
+        # last succeeded are skipped
+        self.step_memo: Optional[StepMemo] = StepMemo() if memoize_steps else None
+        # verification is abandoned as soon as this file exists
+        self.cancel_path = cancel_path
+        # snapshots still alive; they copy untracked files a change touches
+        self._snapshots: List[WorkspaceSnapshot] = []
+        # threads waiting for abandoned candidates to clean up after themselves
+        self._reapers: List[threading.Thread] = []
+        # inotify journal of the paths that may be dirty, so status queries
+        # skip the rest of a large checkout; None where inotify is missing
+        self.journal: Optional[ChangeJournal] = (
+            ChangeJournal.start(repo_dir) if watch_changes else None
+        )
+        # per-hunk outcome of the patches in the last implement_changes call
+        self.patch_results: List[PatchResult] = []
+        # last HEAD tree handed out by fetch_blob_hash_delta
+        self._reported_tree: Optional[str] = None
+        self._reported_blob_hashes: Optional[Dict[str, str]] = None
+
+    def _objects(self) -> GitObjectStore:
+        if self._object_store is None:
+            self._object_store = GitObjectStore(self.repo_dir)
+        return self._object_store
+
+    def close(self):
+        for reaper in self._reapers:
+            reaper.join()
+        self._reapers = []
+        if self.journal is not None:
+            self.journal.close()
+        with self._state_lock:
+            if self._git is not None:
+                self._git.close()
+            if self._object_store is not None:
+                self._object_store.close()
+                self._object_store = None
 
     @staticmethod
-    def run_command(command, cwd=None) -> (bool, str):
+    def run_command(command, cwd=None, input=None) -> (bool, str):
+        if tracer.enabled:
+            started, start = time.time(), time.perf_counter()
         result = subprocess.run(
-            command, shell=True, text=True, capture_output=True, cwd=cwd
+            command, shell=True, text=True, capture_output=True, cwd=cwd, input=input
         )
+        if tracer.enabled:
+            tracer.record_command(
+                command,
+                cwd,
+                started,
+                time.perf_counter() - start,
+                result.returncode,
+                len(result.stdout) + len(result.stderr),
+            )
         if result.returncode != 0:
             return False, result.stdout + "\n" + result.stderr
 
         return True, result.stdout.strip()
 
-    def implement_changes(self, data: RepoToolInput):
+    def implement_changes(self, data: RepoToolInput) -> List[PatchResult]:
+        with self._state_lock:
+            return self._implement_changes(data)
+
+    def _implement_changes(self, data: RepoToolInput) -> List[PatchResult]:
+        self.patch_results = []
+        pending_patches: List[Patch] = []
+        staged_paths: List[str] = []
+        # files created in this call whose blobs were written in-process
+        written_blobs: Dict[str, str] = {}
+
         for change in data.changes:
             if change.patch:
-                patch_file_path = os.path.join(self.repo_dir, "temp.patch")
-                change.patch.to_patch_file(patch_file_path)
-                RepoTool.run_command(f"git apply {patch_file_path}", self.repo_dir)
-                RepoTool.run_command(f"git add {change.patch.file_name}", self.repo_dir)
+                self._preserve(change.patch.file_name)
+                pending_patches.append(change.patch)
+                staged_paths.append(change.patch.file_name)
+                written_blobs.pop(os.path.normpath(change.patch.file_name), None)
 
             if change.file_action:
-                file_path = os.path.join(self.repo_dir, change.file_action.file_name)
+                file_name = change.file_action.file_name
+                if RepoTool._touches(file_name, pending_patches):
+                    self._apply_patches(pending_patches)
+                    pending_patches = []
+
+                self._preserve(file_name)
+                file_path = os.path.join(self.repo_dir, file_name)
+                blob_hash = None
                 match change.file_action.action:
                     case Action.CREATE:
-                        with open(file_path, "w") as file:
-                            if change.file_action.content:
-                                file.write(change.file_action.content)
-                        RepoTool.run_command(
-                            f"git add {change.file_action.file_name}", self.repo_dir
-                        )
+                        blob_hash = self._write_file(change.file_action, file_path)
 
                     case Action.DELETE:
                         os.remove(file_path)
-                        RepoTool.run_command(
-                            f"git rm {change.file_action.file_name}", self.repo_dir
-                        )
+
+                if blob_hash is not None:
+                    # already hashed and stored, no need to read it again
+                    written_blobs[os.path.normpath(file_name)] = blob_hash
+                else:
+                    staged_paths.append(file_name)
+                    written_blobs.pop(os.path.normpath(file_name), None)
 
             if change.directory_action:
-                directory_path = os.path.join(
-                    self.repo_dir, change.directory_action.directory_name
-                )
+                directory_name = change.directory_action.directory_name
+                if RepoTool._touches(directory_name, pending_patches):
+                    self._apply_patches(pending_patches)
+                    pending_patches = []
+
+                directory_path = os.path.join(self.repo_dir, directory_name)
                 match change.directory_action.action:
                     case Action.CREATE:
                         os.makedirs(directory_path, exist_ok=True)
-                        RepoTool.run_command(
-                            f"git add {change.directory_action.directory_name}",
+                        # what `git add` would pick up: gitignored files stay out
+                        _, listed = RepoTool.run_command(
+                            "git ls-files -z --cached --others --exclude-standard"
+                            f" -- {shlex.quote(':(literal)' + directory_name)}",
                             self.repo_dir,
                         )
+                        staged_paths.extend(path for path in listed.split("\0") if path)
 
                     case Action.DELETE:
+                        self._preserve(directory_name)
                         if os.path.exists(directory_path):
                             shutil.rmtree(directory_path)
+                        for path in list(written_blobs):
+                            if RepoTool._inside(path, directory_name):
+                                del written_blobs[path]
+
+            if not self.batch_changes:
+                self._apply_patches(pending_patches)
+                self._stage_paths(staged_paths)
+                self._stage_blobs(written_blobs)
+                pending_patches, staged_paths, written_blobs = [], [], {}
+
+        self._apply_patches(pending_patches)
+        self._stage_paths(staged_paths)
+        self._stage_blobs(written_blobs)
+        if self._git is not None:
+            self._git.flush_index()
+
+        return self.patch_results
+
+    def commit(self, message: str, allow_empty: bool = False) -> Tuple[bool, str]:
+        with self._state_lock:
+            return self._commit(message, allow_empty)
+
+    def _commit(self, message: str, allow_empty: bool) -> Tuple[bool, str]:
+        # commits the index with plumbing only: no worktree scan, no index
+        # refresh, no hooks. write-tree reuses the cached subtrees update-index
+        # left intact, so the cost follows the staged change, not the checkout
+        if self._git is not None:
+            self._git.flush_index()
+
+        with tracer.span("commit"):
+            success, tree = RepoTool.run_command("git write-tree", self.repo_dir)
+            if not success:
+                return False, tree
+
+            has_parent, parent = RepoTool.run_command(
+                "git rev-parse --verify -q HEAD", self.repo_dir
+            )
+            if has_parent and not allow_empty:
+                try:
+                    parent_tree = self._objects().commit_tree(parent)
+                except (OSError, ValueError, KeyError, zlib.error):
+                    _, parent_tree = RepoTool.run_command(
+                        f"git rev-parse {parent}^{{tree}}", self.repo_dir
+                    )
+                if parent_tree == tree:
+                    return False, "nothing to commit"
+            elif not has_parent and not allow_empty and tree == EMPTY_TREE:
+                return False, "nothing to commit"
+
+            success, commit_sha = RepoTool.run_command(
+                f"git commit-tree {tree}" + (f" -p {parent}" if has_parent else ""),
+                self.repo_dir,
+                input=message + "\n",
+            )
+            if not success:
+                return False, commit_sha
+
+            # compare-and-swap against the parent we read; 40 zeros means
+            # "must not exist yet"
+            old = parent if has_parent else "0" * 40
+            success, output = RepoTool.run_command(
+                f"git update-ref -m {shlex.quote('commit: ' + message)} "
+                f"HEAD {commit_sha} {old}",
+                self.repo_dir,
+            )
+            if not success:
+                return False, output
+        return True, commit_sha
+
+    def snapshot(self) -> WorkspaceSnapshot:
+        # cheap restore point: HEAD, the index and copies of dirty files
+        if self._git is not None:
+            with self._state_lock:
+                self._git.flush_index()
+        with tracer.span("snapshot"):
+            snapshot = WorkspaceSnapshot(self.repo_dir, self.journal)
+        self._snapshots = [
+            other for other in self._snapshots if not other.discarded
+        ] + [snapshot]
+        return snapshot
+
+    def _preserve(self, path: str):
+        for snapshot in self._snapshots:
+            if not snapshot.discarded:
+                snapshot.preserve(path)
+
+    def rollback(self, snapshot: WorkspaceSnapshot):
+        # undoes every change to tracked and untracked (not ignored) files
+        # since `snapshot`, including commits and staged changes
+        if self._git is not None:
+            with self._state_lock:
+                self._git.flush_index()
+        with tracer.span("rollback"):
+            snapshot.restore()
+
+    @staticmethod
+    def _inside(file_name: str, path: str) -> bool:
+        file_name, path = os.path.normpath(file_name), os.path.normpath(path)
+        return file_name == path or file_name.startswith(path + os.sep)
+
+    @staticmethod
+    def _touches(path: str, patches: List[Patch]) -> bool:
+        return any(RepoTool._inside(patch.file_name, path) for patch in patches)
+
+    def _write_file(self, file_action: FileAction, file_path: str) -> Optional[str]:
+        # streams the content to disk and into a loose object in one pass,
+        # returning its blob hash; None when the object store is not usable
+        # and the file has to be staged by path instead
+        size = file_action.content_size()
+        try:
+            objects = None if self._converts(file_action.file_name) else self._objects()
+        except (OSError, ValueError):
+            objects = None
+        if objects is not None:
+            with tracer.span("write_blob", file_name=file_action.file_name, size=size):
+                return objects.write_blob(file_action.iter_bytes(), size, file_path)
+
+        with open(file_path, "wb") as file:
+            for data in file_action.iter_bytes():
+                file.write(data)
+        return None
+
+    def _converts(self, path: str) -> bool:
+        # whether git would store something other than the bytes on disk
+        # (autocrlf, or text, eol or filter attributes such as LFS), in
+        # which case only git itself can hash the file
+        success, output = RepoTool.run_command(
+            f"git check-attr -z text eol filter crlf -- {shlex.quote(path)}"
+            " && git config --default false --get core.autocrlf",
+            self.repo_dir,
+        )
+        if not success:
+            return True
+        *attributes, autocrlf = output.split("\0")
+        return autocrlf.strip().lower() != "false" or any(
+            value != "unspecified" for value in attributes[2::3]
+        )
+
+    def _stage_blobs(self, blobs: Dict[str, str]):
+        if not blobs:
+            return
+        # the update-index coprocess holds index.lock until it is flushed
+        if self._git is not None:
+            self._git.flush_index()
+
+        entries = []
+        for path, blob_hash in blobs.items():
+            executable = os.stat(os.path.join(self.repo_dir, path)).st_mode & 0o100
+            mode = "100755" if executable else "100644"
+            entries.append(f"{mode} {blob_hash}\t{path}\0")
+        RepoTool.run_command(
+            "git update-index -z --index-info", self.repo_dir, input="".join(entries)
+        )
+
+    def _apply_patches(self, patches: List[Patch]) -> List[PatchResult]:
+        if not patches:
+            return []
+
+        with tracer.span("apply_patches", patches=len(patches)):
+            results = apply_patches(self.repo_dir, patches, max_fuzz=self.patch_fuzz)
+        self.patch_results.extend(results)
+        return results
+
+    def _stage_paths(self, paths: List[str]):
+        paths = list(dict.fromkeys(os.path.normpath(path) for path in paths))
+        if not paths:
+            return
+
+        if self._git is not None:
+            self._git.stage(paths)
+            return
 
-    def requirement_is_fulfilled(self, data: Requirement):
-        current_dir = self.repo_dir  # Starting in the repo directory
-        full_command = ""
+        RepoTool.run_command(
+            "git update-index --add --remove -z --stdin",
+            self.repo_dir,
+            input="\0".join(paths) + "\0",
+        )
+
+    def read_object(self, name: str) -> Tuple[str, bytes]:
+        with self._state_lock:
+            if self._git is not None:
+                return self._git.read_object(name)
+
+            return self._objects().read_object(name)
+
+    def hash_files(self, paths: List[str]) -> List[str]:
+        if self._git is not None:
+            with self._state_lock:
+                return self._git.hash_files(paths)
+
+        if not paths:
+            return []
+        _, output = RepoTool.run_command(
+            "git hash-object --stdin-paths",
+            self.repo_dir,
+            input="".join(f"{path}\n" for path in paths),
+        )
+        return output.splitlines()
+
+    @staticmethod
+    def verification_steps(data: Requirement) -> List[str]:
+        steps = []
         for command in data.verification_commands:
             if "mkdir" in command and "mkdir -p" not in command:
                 command.replace("mkdir", "mkdir -p")
+            steps.append(command)
 
-            if not full_command:
-                full_command = command
-            else:
-                full_command += f" && {command}"
+        return steps
 
-        # Combine directory change with the actual command if needed
-        print(f"RUNNING FULL COMMAND: {full_command}")
-        success, output = self.run_command(full_command, cwd=self.repo_dir)
+    @staticmethod
+    def verification_command(data: Requirement) -> str:
+        return " && ".join(RepoTool.verification_steps(data))
+
+    @staticmethod
+    def check_verification_output(
+        data: Requirement,
+        success: bool,
+        output: str,
+        final_output: Optional[str] = None,
+    ) -> (bool, str):
         if not success:
             return False, output
 
-        final_output = output.split("\n")[-1]
+        if final_output is None:
+            final_output = output.split("\n")[-1]
 
         # Check the output of the last command
         if not final_output == data.expected_output:
@@ -91,7 +456,403 @@ class RepoTool:
 
         return True, "Requirement fulfilled"
 
+    def requirement_is_fulfilled(
+        self, data: Requirement, limits: Optional[ResourceLimits] = None
+    ):
+        result = self.verify(data, limits)
+        return result.is_fulfilled, result.output
+
+    def verify(
+        self, data: Requirement, limits: Optional[ResourceLimits] = None
+    ) -> VerificationResult:
+        cache_key = None
+        if self.verification_cache is not None:
+            cache_key = VerificationCache.key(
+                self.tree_hash(), self.dirty_digest(), data
+            )
+            cached = self.verification_cache.get(cache_key)
+            if cached is not None:
+                return VerificationResult(
+                    status=(
+                        VerificationStatus.FULFILLED
+                        if cached[0]
+                        else VerificationStatus.UNFULFILLED
+                    ),
+                    output=cached[1],
+                )
+
+        steps = RepoTool.verification_steps(data)
+        digests: List[Optional[str]] = []
+        skipped = 0
+        memoized = self.step_memo is not None and any(data.verification_inputs)
+        if memoized:
+            if self.build_state() != self.step_memo.build_state:
+                # whatever the remembered steps produced may be gone
+                self.step_memo.clear()
+            digests = self.step_input_digests(data, steps)
+            skipped = self.step_memo.skippable(data, steps, digests)
+            self.step_memo.forget(steps, skipped)
+
+        # parallel batch jobs share stdout, so what runs goes to the trace;
+        # each job's log already has the requirement
+        with tracer.span(
+            "verification",
+            description=data.description,
+            steps=steps[skipped:],
+            skipped_steps=steps[:skipped],
+        ):
+            run = run_supervised(
+                steps[skipped:],
+                cwd=self.repo_dir,
+                limits=limits or self.limits,
+                max_output_bytes=self.max_output_bytes,
+                spill_path=self._spill_path(),
+                env=self.build_environment(),
+                cancel_path=self.cancel_path,
+            )
+
+        # timeouts say nothing about the tree, so they are never cached
+        if run.timed_out:
+            return VerificationResult(
+                status=VerificationStatus.TIMED_OUT,
+                output=f"Timed out: {run.timeout_reason}\n"
+                + run.stdout.text()
+                + "\n"
+                + run.stderr.text(),
+            )
+
+        if memoized:
+            ran = len(steps) - skipped
+            succeeded = ran if run.returncode == 0 else run.steps_started - 1
+            self.step_memo.record(steps, digests, skipped, skipped + succeeded)
+            self.step_memo.build_state = self.build_state(create=True)
+
+        if run.returncode != 0:
+            success, output = False, run.stdout.text() + "\n" + run.stderr.text()
+        else:
+            success, output = True, run.stdout.text().strip()
+        final_output = run.stdout.last_line if run.stdout.truncated else None
+        is_fulfilled, output = RepoTool.check_verification_output(
+            data, success, output, final_output
+        )
+
+        if cache_key is not None:
+            self.verification_cache.put(cache_key, is_fulfilled, output)
+        return VerificationResult(
+            status=(
+                VerificationStatus.FULFILLED
+                if is_fulfilled
+                else VerificationStatus.UNFULFILLED
+            ),
+            output=output,
+        )
+
+    def step_input_digests(
+        self, data: Requirement, steps: List[str]
+    ) -> List[Optional[str]]:
+        # one digest per step over the blob hashes of the files its declared
+        # globs match in the working tree; None for steps that always run
+        patterns = [
+            (
+                data.verification_inputs[index]
+                if index < len(data.verification_inputs)
+                else []
+            )
+            for index in range(len(steps))
+        ]
+        if not any(patterns):
+            return [None] * len(steps)
+
+        _, output = RepoTool.run_command(
+            "git ls-files -z --cached --others --exclude-standard", self.repo_dir
+        )
+        files = sorted(
+            path
+            for path in set(output.split("\0"))
+            if path and os.path.lexists(os.path.join(self.repo_dir, path))
+        )
+        matched = [
+            [
+                path
+                for path in files
+                if any(fnmatch.fnmatch(path, pattern) for pattern in step_patterns)
+                or any(
+                    pattern.startswith("**/")
+                    and fnmatch.fnmatch(path, pattern[len("**/") :])
+                    for pattern in step_patterns
+                )
+            ]
+            for step_patterns in patterns
+        ]
+        needed = sorted({path for paths in matched for path in paths})
+        blob_hashes = dict(zip(needed, self.hash_files(needed)))
+
+        digests: List[Optional[str]] = []
+        for step, step_patterns, paths in zip(steps, patterns, matched):
+            if not step_patterns or not StepMemo.memoizable(step):
+                digests.append(None)
+                continue
+            digest = hashlib.sha256(f"{step}\0{step_patterns}\0".encode())
+            for path in paths:
+                digest.update(f"{path}\0{blob_hashes[path]}\0".encode())
+            digests.append(digest.hexdigest())
+        return digests
+
+    def _spill_path(self) -> Optional[str]:
+        if self.spill_dir is None:
+            return None
+        os.makedirs(self.spill_dir, exist_ok=True)
+        return os.path.join(
+            self.spill_dir,
+            f"verification-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns()}.log.gz",
+        )
+
+    def build_dir(self) -> Optional[str]:
+        if self.build_root is None:
+            return None
+        return build_dir_for(self.repo_dir, self.build_root)
+
+    def build_state(self, create: bool = False) -> Optional[str]:
+        # identifies the build the step memo was recorded against, without
+        # creating anything unless asked to
+        if self.build_root is not None:
+            # a token in the build directory, gone with the directory
+            build_dir = build_dir_for(self.repo_dir, self.build_root, create=create)
+            marker = os.path.join(build_dir, STEP_MEMO_MARKER)
+            if create and not os.path.exists(marker):
+                with open(marker, "w") as file:
+                    file.write(uuid.uuid4().hex)
+            try:
+                with open(marker) as file:
+                    return file.read()
+            except FileNotFoundError:
+                return None
+
+        # in-tree builds: the untracked and ignored entries at the top of the
+        # checkout, by inode, so deleting or recreating `build/` is noticed
+        _, output = RepoTool.run_command(
+            "git ls-files -z --others --directory", self.repo_dir
+        )
+        digest = hashlib.sha256()
+        for name in sorted({path.split("/")[0] for path in output.split("\0") if path}):
+            try:
+                inode = os.lstat(os.path.join(self.repo_dir, name)).st_ino
+            except FileNotFoundError:
+                continue
+            digest.update(f"{name}\0{inode}\0".encode())
+        return digest.hexdigest()
+
+    def build_environment(self) -> Optional[Dict[str, str]]:
+        if self.build_root is None and self.compiler_cache is None:
+            return None
+        build_dir = self.build_dir()
+        return build_environment(
+            self.repo_dir, build_dir or self.repo_dir, self.compiler_cache
+        )
+
+    def verification_options(self) -> Dict[str, object]:
+        # settings a RepoTool in another worktree needs to verify the same way
+        return {
+            "max_output_bytes": self.max_output_bytes,
+            "spill_dir": self.spill_dir,
+            "limits": self.limits,
+            "build_root": self.build_root,
+            "compiler_cache": self.compiler_cache,
+            "memoize_steps": self.step_memo is not None,
+        }
+
+    def verify_requirements(
+        self,
+        requirements: List[Requirement],
+        max_workers: Optional[int] = None,
+        commit: str = "HEAD",
+    ) -> List[Tuple[bool, str]]:
+        # every requirement gets its own worktree pinned to the same commit, so
+        # builds can run side by side without stepping on each other
+        success, commit_sha = RepoTool.run_command(
+            f"git rev-parse --verify {commit}^{{commit}}", cwd=self.repo_dir
+        )
+        if not success:
+            return [(False, commit_sha)] * len(requirements)
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=POOL_CONTEXT
+        ) as pool:
+            futures = [
+                pool.submit(
+                    verify_in_worktree,
+                    os.path.abspath(self.repo_dir),
+                    commit_sha,
+                    requirement,
+                    self.verification_options(),
+                )
+                for requirement in requirements
+            ]
+            return [future.result() for future in futures]
+
+    def evaluate_candidates(
+        self,
+        candidates: List[RepoToolInput],
+        requirement: Requirement,
+        message: str = "candidate",
+        max_workers: Optional[int] = None,
+        commit: str = "HEAD",
+    ) -> Tuple[Optional[int], List[CandidateResult]]:
+        # every candidate is applied, committed and verified in its own
+        # worktree branched from `commit`; returns the index of the first
+        # candidate to pass (in completion order) and all results by index
+        success, commit_sha = RepoTool.run_command(
+            f"git rev-parse --verify {commit}^{{commit}}", cwd=self.repo_dir
+        )
+        if not success:
+            return None, [
+                CandidateResult(index=index, fulfilled=False, output=commit_sha)
+                for index in range(len(candidates))
+            ]
+
+        winner = None
+        results: Dict[int, CandidateResult] = {}
+        # losers still building when a winner is found are told to stop
+        # through this file; nobody waits for them
+        cancel_dir = tempfile.mkdtemp(prefix="gitpt-cancel-")
+        cancel_path = os.path.join(cancel_dir, "cancel")
+        options = {**self.verification_options(), "cancel_path": cancel_path}
+        with tracer.span("evaluate_candidates", candidates=len(candidates)):
+            pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=POOL_CONTEXT)
+            futures = []
+            try:
+                futures = [
+                    pool.submit(
+                        evaluate_in_worktree,
+                        os.path.abspath(self.repo_dir),
+                        commit_sha,
+                        index,
+                        candidate,
+                        requirement,
+                        f"{message} ({index + 1}/{len(candidates)})",
+                        options,
+                    )
+                    for index, candidate in enumerate(candidates)
+                ]
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        # the worker itself died; the other candidates go on
+                        result = CandidateResult(
+                            index=futures.index(future),
+                            fulfilled=False,
+                            output=str(error),
+                        )
+                    results[result.index] = result
+                    if result.fulfilled:
+                        winner = result.index
+                        break
+            finally:
+                open(cancel_path, "w").close()
+                pool.shutdown(wait=False, cancel_futures=True)
+                # the losers remove their own worktrees once they stop
+                reaper = threading.Thread(
+                    target=reap_candidates, args=(futures, cancel_dir)
+                )
+                reaper.start()
+                self._reapers.append(reaper)
+
+        return winner, [
+            results.get(index)
+            or CandidateResult(index=index, fulfilled=False, output="not evaluated")
+            for index in range(len(candidates))
+        ]
+
+    def adopt_candidate(self, result: CandidateResult) -> bool:
+        # moves the checkout to the candidate's commit, which is a child of HEAD
+        if result.commit is None:
+            return False
+        success, _ = RepoTool.run_command(
+            f"git merge --ff-only -q {result.commit}", cwd=self.repo_dir
+        )
+        if success:
+            self.patch_results = result.patch_results
+        return success
+
+    def tree_hash(self) -> str:
+        try:
+            with self._state_lock:
+                return self._objects().head_tree() or ""
+        except (OSError, ValueError, KeyError, zlib.error):
+            _, output = RepoTool.run_command(
+                "git rev-parse HEAD^{tree}", cwd=self.repo_dir
+            )
+            return output
+
+    def dirty_digest(self) -> str:
+        # untracked files are left out on purpose: they are mostly build
+        # products of earlier verification runs, while everything the model
+        # writes is staged by implement_changes. With a journal they are
+        # still queried, so the journal learns which candidates are clean
+        candidates = self.changed_candidates()
+        status = status_paths(
+            self.repo_dir,
+            candidates,
+            untracked="no" if self.journal is None else "normal",
+        )
+        if self.journal is not None:
+            self.journal.settle(status)
+        entries = sorted(
+            f"{code} {path}" for path, code in status.items() if code != "??"
+        )
+        paths = [
+            path
+            for path, code in sorted(status.items())
+            if code != "??" and os.path.isfile(os.path.join(self.repo_dir, path))
+        ]
+
+        digest = hashlib.sha256()
+        for entry in entries:
+            digest.update(f"{entry}\0".encode())
+        for path, blob_hash in zip(paths, self.hash_files(paths)):
+            digest.update(f"{path}\0{blob_hash}\0".encode())
+        return digest.hexdigest()
+
+    def changed_candidates(self) -> Optional[List[str]]:
+        # paths that may differ from the index, or None to scan everything
+        if self.journal is None:
+            return None
+        with tracer.span("change_journal"):
+            return self.journal.candidates()
+
     def fetch_blob_hashes(self) -> Dict[str, str]:
+        # read HEAD's tree in-process; decoded trees are cached across calls so
+        # unchanged subtrees are never re-read. Fall back to git for anything
+        # the reader does not understand (e.g. sha256 repositories).
+        try:
+            with self._state_lock, tracer.span("fetch_blob_hashes"):
+                return self._objects().head_blob_hashes()
+        except (OSError, ValueError, KeyError, zlib.error):
+            return self._fetch_blob_hashes_with_git()
+
+    def fetch_blob_hash_delta(self) -> BlobHashDelta:
+        # only the paths that changed since the last report; unchanged
+        # subtrees are skipped by hash without being read
+        try:
+            with self._state_lock:
+                new_tree = self._objects().head_tree()
+                delta = self._objects().diff_trees(self._reported_tree, new_tree)
+                self._reported_tree = new_tree
+            return delta
+        except (OSError, ValueError, KeyError, zlib.error):
+            blob_hashes = self._fetch_blob_hashes_with_git()
+            delta = BlobHashDelta.between(self._reported_blob_hashes or {}, blob_hashes)
+            self._reported_blob_hashes = blob_hashes
+            return delta
+
+    def reset_blob_hash_report(self):
+        # the next delta will list every path again, e.g. after the
+        # conversation lost earlier reports
+        self._reported_tree = None
+        self._reported_blob_hashes = None
+
+    def _fetch_blob_hashes_with_git(self) -> Dict[str, str]:
         blob_hashes = {}
 
         success, committed_output = RepoTool.run_command(
@@ -103,3 +864,98 @@ class RepoTool:
                 blob_hashes[file_path] = blob_hash
 
         return blob_hashes
+
+
+def worktree_command(command: str, repo_dir: str) -> Tuple[bool, str]:
+    # concurrent `git worktree add`s can read each other's half-written
+    # metadata and fail, so add/remove take turns across processes
+    lock_path = os.path.join(find_git_dir(repo_dir) or repo_dir, "gitpt-worktree.lock")
+    with open(lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return RepoTool.run_command(command, cwd=repo_dir)
+
+
+def verify_in_worktree(
+    repo_dir: str,
+    commit_sha: str,
+    requirement: Requirement,
+    options: Optional[Dict[str, object]] = None,
+) -> Tuple[bool, str]:
+    worktree_dir = tempfile.mkdtemp(prefix="gitpt-worktree-")
+    success, output = worktree_command(
+        f"git worktree add --detach {worktree_dir} {commit_sha}", repo_dir
+    )
+    if not success:
+        shutil.rmtree(worktree_dir, ignore_errors=True)
+        return False, output
+
+    repo_tool = RepoTool(worktree_dir, **(options or {}))
+    try:
+        return repo_tool.requirement_is_fulfilled(requirement)
+    finally:
+        worktree_command(f"git worktree remove --force {worktree_dir}", repo_dir)
+        shutil.rmtree(worktree_dir, ignore_errors=True)
+        # a build directory is tied to its source path, so one made for a
+        # throwaway worktree is never reused; compiles still hit the cache
+        if repo_tool.build_root is not None:
+            shutil.rmtree(repo_tool.build_dir(), ignore_errors=True)
+
+
+def reap_candidates(futures, cancel_dir: str):
+    wait(futures)
+    shutil.rmtree(cancel_dir, ignore_errors=True)
+
+
+def evaluate_in_worktree(
+    repo_dir: str,
+    commit_sha: str,
+    index: int,
+    candidate: RepoToolInput,
+    requirement: Requirement,
+    message: str,
+    options: Optional[Dict[str, object]] = None,
+) -> CandidateResult:
+    worktree_dir = tempfile.mkdtemp(prefix="gitpt-candidate-")
+    success, output = worktree_command(
+        f"git worktree add --detach {worktree_dir} {commit_sha}", repo_dir
+    )
+    if not success:
+        shutil.rmtree(worktree_dir, ignore_errors=True)
+        return CandidateResult(index=index, fulfilled=False, output=output)
+
+    repo_tool = RepoTool(worktree_dir, **(options or {}))
+    try:
+        patch_results = repo_tool.implement_changes(candidate)
+        # the commit lands in the shared object store, so the main checkout
+        # can fast-forward to it
+        success, output = repo_tool.commit(message, allow_empty=True)
+        if not success:
+            return CandidateResult(
+                index=index,
+                fulfilled=False,
+                output=output,
+                patch_results=patch_results,
+            )
+        fulfilled, verification_output = repo_tool.requirement_is_fulfilled(requirement)
+        return CandidateResult(
+            index=index,
+            fulfilled=fulfilled,
+            output=verification_output,
+            commit=output,
+            patch_results=patch_results,
+        )
+    except Exception as error:
+        # a candidate that cannot even be applied (say, deleting a missing
+        # file) just loses
+        return CandidateResult(
+            index=index,
+            fulfilled=False,
+            output=str(error),
+            patch_results=repo_tool.patch_results,
+        )
+    finally:
+        repo_tool.close()
+        worktree_command(f"git worktree remove --force {worktree_dir}", repo_dir)
+        shutil.rmtree(worktree_dir, ignore_errors=True)
+        if repo_tool.build_root is not None:
+            shutil.rmtree(repo_tool.build_dir(), ignore_errors=True)
@@ -0,0 +1,102 @@
+from typing import Dict, List, Optional, Tuple
+import tempfile
+import hashlib
+import json
+import os
+
+RESPONSE_CACHE_ENV = "GITPT_RESPONSE_CACHE"
+REPLAY_ENV = "GITPT_REPLAY"
+
+
+class ReplayMiss(KeyError):
+    pass
+
+
+def canonical_payload(payload: Dict) -> bytes:
+    # streamed and plain requests produce the same message, so `stream` is
+    # not part of the key
+    return json.dumps(
+        {key: value for key, value in payload.items() if key != "stream"},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode()
+
+
+class ResponseCache:
+    # assistant messages stored on disk under the hash of the request payload.
+    # Least recently used entries are evicted once the directory exceeds
+    # max_bytes; in replay mode a miss raises instead of reaching the network
+    def __init__(
+        self, path: str, max_bytes: int = 256 * 1024 * 1024, replay: bool = False
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.replay = replay
+        os.makedirs(path, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def key(payload: Dict) -> str:
+        return hashlib.sha256(canonical_payload(payload)).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key[2:]}.json")
+
+    def _entries(self) -> List[Tuple[float, str, int]]:
+        entries = []
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                entry_path = os.path.join(directory, name)
+                stat = os.stat(entry_path)
+                entries.append((stat.st_mtime, entry_path, stat.st_size))
+        return entries
+
+    def get(self, payload: Dict) -> Optional[Dict]:
+        entry_path = self._entry_path(ResponseCache.key(payload))
+        try:
+            with open(entry_path) as file:
+                message = json.load(file)
+        except FileNotFoundError:
+            if self.replay:
+                raise ReplayMiss(ResponseCache.key(payload))
+            return None
+        # the modification time doubles as the last-use time for eviction
+        os.utime(entry_path)
+        return message
+
+    def put(self, payload: Dict, message: Dict):
+        if self.replay:
+            return
+        entry_path = self._entry_path(ResponseCache.key(payload))
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # write-then-rename so concurrent sessions never read half an entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path))
+        with os.fdopen(fd, "w") as file:
+            json.dump(message, file)
+        old_size = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+        os.replace(temp_path, entry_path)
+        self.total_bytes += os.path.getsize(entry_path) - old_size
+
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        entries = sorted(self._entries())
+        self.total_bytes = sum(size for _, _, size in entries)
+        for _, entry_path, size in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            os.remove(entry_path)
+            self.total_bytes -= size
+
+
+def cache_from_env() -> Optional[ResponseCache]:
+    # GITPT_RESPONSE_CACHE=dir turns caching on, GITPT_REPLAY=1 makes it strict
+    if not os.getenv(RESPONSE_CACHE_ENV):
+        return None
+    return ResponseCache(
+        os.environ[RESPONSE_CACHE_ENV], replay=os.getenv(REPLAY_ENV) == "1"
+    )
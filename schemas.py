@@ -0,0 +1,63 @@
+from pydantic import BaseModel, TypeAdapter
+from functools import lru_cache
+from typing import Dict, List, Optional, Type, TypeVar, Union
+
+T = TypeVar("T")
+
+
+class FunctionCall(BaseModel):
+    name: str = ""
+    arguments: str = ""
+
+
+class ToolCall(BaseModel):
+    id: Optional[str] = None
+    type: str = "function"
+    function: FunctionCall
+
+
+class AssistantMessage(BaseModel):
+    role: str = "assistant"
+    content: Optional[str] = None
+    tool_calls: Optional[List[ToolCall]] = None
+
+
+class Choice(BaseModel):
+    message: AssistantMessage
+
+
+class ChatCompletion(BaseModel):
+    choices: List[Choice]
+
+
+@lru_cache(maxsize=None)
+def adapter(type_: Type[T]) -> TypeAdapter:
+    # building a validator is the expensive part, so each type gets one
+    return TypeAdapter(type_)
+
+
+@lru_cache(maxsize=None)
+def json_schema(model: Type[BaseModel]) -> Dict:
+    # shared between callers; treat as read-only
+    return model.model_json_schema()
+
+
+def decode_choices(content: bytes) -> List[Dict]:
+    # validates the response body as bytes: no decoded copy of the body and
+    # no intermediate dict tree, only the strings the messages keep
+    completion = adapter(ChatCompletion).validate_json(content)
+    messages = []
+    for choice in completion.choices:
+        message = choice.message.model_dump()
+        if message["tool_calls"] is None:
+            del message["tool_calls"]
+        messages.append(message)
+    return messages
+
+
+def decode_completion(content: bytes) -> Dict:
+    return decode_choices(content)[0]
+
+
+def parse_arguments(type_: Type[T], arguments: Union[str, bytes]) -> T:
+    return adapter(type_).validate_json(arguments)
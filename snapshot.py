@@ -0,0 +1,273 @@
+from git_objects import find_git_dir
+from tracing import tracer
+
+
+from typing import Dict, List, Optional, Set, Tuple
+import subprocess
+import tempfile
+import shlex
+import shutil
+import fcntl
+import time
+import os
+
+# ioctl that makes dst share src's extents on btrfs/xfs (cp --reflink)
+FICLONE = 0x40049409
+LS_FILES_BATCH = 1000
+
+
+def clone_file(src: str, dst: str):
+    # copy-on-write where the filesystem supports it, a plain copy otherwise
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            shutil.copyfileobj(src_file, dst_file, 1 << 20)
+    shutil.copymode(src, dst)
+
+
+def git(repo_dir: str, *args: str, input: Optional[bytes] = None) -> Tuple[int, bytes]:
+    if tracer.enabled:
+        started, start = time.time(), time.perf_counter()
+    result = subprocess.run(
+        ["git", *args],
+        cwd=repo_dir,
+        input=input,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if tracer.enabled:
+        tracer.record_command(
+            shlex.join(["git", *args]),
+            repo_dir,
+            started,
+            time.perf_counter() - start,
+            result.returncode,
+            len(result.stdout),
+        )
+    return result.returncode, result.stdout
+
+
+def status_paths(
+    repo_dir: str, limit_to: Optional[List[str]] = None, untracked: str = "all"
+) -> Dict[str, str]:
+    # path -> two-letter status for everything that differs from HEAD,
+    # untracked files included (untracked="normal" lists a wholly untracked
+    # directory once, as `dir/`); renames are reported as delete + add.
+    # limit_to restricts the scan to those paths (and what is below them)
+    args = [
+        "status",
+        "--porcelain",
+        "-z",
+        f"--untracked-files={untracked}",
+        "--no-renames",
+    ]
+    if limit_to is None:
+        outputs = [git(repo_dir, *args)[1]]
+    else:
+        outputs = [
+            git(
+                repo_dir,
+                *args,
+                "--",
+                *[
+                    f":(literal){path}"
+                    for path in limit_to[start : start + LS_FILES_BATCH]
+                ],
+            )[1]
+            for start in range(0, len(limit_to), LS_FILES_BATCH)
+        ]
+    paths = {}
+    for output in outputs:
+        for entry in output.decode(errors="surrogateescape").split("\0"):
+            if len(entry) > 3:
+                paths[entry[3:]] = entry[:2]
+    return paths
+
+
+class WorkspaceSnapshot:
+    # HEAD, the index and copies of the tracked files that were dirty when it
+    # was taken; clean files are restored from the index. Untracked files
+    # (mostly build output) are only copied when a change is about to touch
+    # them, see preserve(), so taking and restoring a snapshot costs
+    # O(changed files), not O(repository) or O(build output)
+    def __init__(
+        self,
+        repo_dir: str,
+        journal=None,
+    ):
+        self.repo_dir = repo_dir
+        # a ChangeJournal narrows status queries to the paths that can be
+        # dirty; without one the whole tree is scanned
+        self.journal = journal
+        self.discarded = False
+        self.git_dir = find_git_dir(repo_dir)
+        if self.git_dir is None:
+            raise FileNotFoundError(f"not a git repository: {repo_dir}")
+
+        code, head = git(repo_dir, "rev-parse", "--verify", "-q", "HEAD")
+        self.head: Optional[str] = head.decode().strip() if code == 0 else None
+        code, branch = git(repo_dir, "symbolic-ref", "-q", "HEAD")
+        self.branch: Optional[str] = branch.decode().strip() if code == 0 else None
+
+        self.path = tempfile.mkdtemp(prefix="gitpt-snapshot-", dir=self.git_dir)
+        index_path = os.path.join(self.git_dir, "index")
+        self.index_path: Optional[str] = None
+        if os.path.exists(index_path):
+            # git replaces the index by renaming a new file over it, so a
+            # hard link keeps this version alive without copying it
+            self.index_path = os.path.join(self.path, "index")
+            os.link(index_path, self.index_path)
+
+        # dirty path -> saved copy, or None if it was missing from disk
+        self.saved: Dict[str, Optional[str]] = {}
+        # untracked files and directories (`dir/`), left alone by restore
+        # unless preserve() saved them first
+        self.untracked: Set[str] = set()
+        status = self._status()
+        for path, code in status.items():
+            if code == "??":
+                self.untracked.add(path)
+            else:
+                self._save(path)
+
+    def _status(self) -> Dict[str, str]:
+        if self.journal is None:
+            return status_paths(self.repo_dir, untracked="normal")
+        status = status_paths(
+            self.repo_dir, self.journal.candidates(), untracked="normal"
+        )
+        self.journal.settle(status)
+        return status
+
+    def _save(self, path: str):
+        file_path = os.path.join(self.repo_dir, path)
+        if os.path.isfile(file_path) or os.path.islink(file_path):
+            copy_path = os.path.join(self.path, "files", path)
+            if os.path.islink(file_path):
+                os.makedirs(os.path.dirname(copy_path), exist_ok=True)
+                os.symlink(os.readlink(file_path), copy_path)
+            else:
+                clone_file(file_path, copy_path)
+            self.saved[path] = copy_path
+        else:
+            self.saved[path] = None
+
+    def _is_untracked(self, path: str) -> bool:
+        return path in self.untracked or any(
+            entry.endswith("/") and path.startswith(entry) for entry in self.untracked
+        )
+
+    def preserve(self, path: str):
+        # called before a change writes or deletes `path`; untracked files
+        # are copied on first touch, and new files under untracked
+        # directories are remembered as missing so restore removes them
+        path = os.path.normpath(path)
+        file_path = os.path.join(self.repo_dir, path)
+        if os.path.isdir(file_path) and not os.path.islink(file_path):
+            for root, _, files in os.walk(file_path):
+                for name in files:
+                    self.preserve(
+                        os.path.relpath(os.path.join(root, name), self.repo_dir)
+                    )
+            return
+        if path not in self.saved and self._is_untracked(path):
+            self._save(path)
+
+    def changed_paths(self) -> List[str]:
+        status = self._status()
+        paths = set(self.saved) | set(status)
+        code, head = git(self.repo_dir, "rev-parse", "--verify", "-q", "HEAD")
+        head = head.decode().strip() if code == 0 else None
+        if head != self.head:
+            if self.head is None or head is None:
+                _, tracked = git(self.repo_dir, "ls-files", "-z")
+                paths.update(path for path in tracked.decode().split("\0") if path)
+            else:
+                _, diff = git(
+                    self.repo_dir, "diff", "--name-only", "-z", self.head, head
+                )
+                paths.update(path for path in diff.decode().split("\0") if path)
+        return sorted(paths)
+
+    def restore(self):
+        changed = self.changed_paths()
+
+        # HEAD first: commits made since the snapshot are left to the reflog
+        if self.head is not None:
+            git(self.repo_dir, "reset", "-q", "--soft", self.head)
+        elif self.branch is not None:
+            git(self.repo_dir, "update-ref", "-d", self.branch)
+
+        index_path = os.path.join(self.git_dir, "index")
+        if self.index_path is not None:
+            temp_path = f"{index_path}.gitpt"
+            shutil.copyfile(self.index_path, temp_path)
+            os.replace(temp_path, index_path)
+        elif os.path.exists(index_path):
+            os.remove(index_path)
+
+        # untracked files nobody touched stay as they are
+        changed = [
+            path
+            for path in changed
+            if path in self.saved or not self._is_untracked(path)
+        ]
+        unsaved = [path for path in changed if path not in self.saved]
+        tracked = set()
+        for start in range(0, len(unsaved), LS_FILES_BATCH):
+            _, output = git(
+                self.repo_dir,
+                "ls-files",
+                "-z",
+                "--",
+                *[
+                    f":(literal){path}"
+                    for path in unsaved[start : start + LS_FILES_BATCH]
+                ],
+            )
+            tracked.update(path for path in output.decode().split("\0") if path)
+
+        for path in changed:
+            file_path = os.path.join(self.repo_dir, path)
+            if path in tracked:
+                continue
+            if os.path.lexists(file_path) and not os.path.isdir(file_path):
+                os.remove(file_path)
+            elif os.path.isdir(file_path) and path not in self.saved:
+                shutil.rmtree(file_path)
+            copy_path = self.saved.get(path)
+            if copy_path is not None:
+                if os.path.islink(copy_path):
+                    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+                    os.symlink(os.readlink(copy_path), file_path)
+                else:
+                    clone_file(copy_path, file_path)
+            else:
+                self._prune_empty_dirs(os.path.dirname(path))
+
+        # files that were clean come back from the restored index
+        if tracked:
+            git(
+                self.repo_dir,
+                "checkout-index",
+                "-f",
+                "-z",
+                "--stdin",
+                input="".join(f"{path}\0" for path in sorted(tracked)).encode(),
+            )
+        # stat information in the restored index is stale for those files
+        git(self.repo_dir, "update-index", "-q", "--refresh")
+
+    def _prune_empty_dirs(self, directory: str):
+        while directory:
+            try:
+                os.rmdir(os.path.join(self.repo_dir, directory))
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def discard(self):
+        self.discarded = True
+        shutil.rmtree(self.path, ignore_errors=True)
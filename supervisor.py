@@ -0,0 +1,188 @@
+from models import ResourceLimits
+from output_capture import BoundedCapture
+from tracing import tracer
+
+
+from typing import Dict, List, Optional
+import subprocess
+import selectors
+import signal
+import gzip
+import time
+import sys
+import os
+
+READ_SIZE = 64 * 1024
+POLL_SECONDS = 0.1
+# how long to keep draining pipes after the process group has been killed
+DRAIN_SECONDS = 1.0
+# dash only understands single-digit descriptors in redirections
+MARKER_FD = 3
+
+
+class SupervisedResult:
+    def __init__(
+        self, steps: List[str], stdout: BoundedCapture, stderr: BoundedCapture
+    ):
+        self.steps = steps
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode: Optional[int] = None
+        # how many steps had started when the run ended
+        self.steps_started = 0
+        self.timeout_reason: Optional[str] = None
+
+    @property
+    def timed_out(self) -> bool:
+        return self.timeout_reason is not None
+
+    @property
+    def current_step(self) -> Optional[str]:
+        if 0 < self.steps_started <= len(self.steps):
+            return self.steps[self.steps_started - 1]
+        return None
+
+
+def kill_process_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_supervised(
+    steps: List[str],
+    cwd: Optional[str] = None,
+    limits: Optional[ResourceLimits] = None,
+    max_output_bytes: Optional[int] = None,
+    spill_path: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    cancel_path: Optional[str] = None,
+) -> SupervisedResult:
+    limits = limits or ResourceLimits()
+    if max_output_bytes is None:
+        stdout = BoundedCapture(sys.maxsize, 0)
+        stderr = BoundedCapture(sys.maxsize, 0)
+    else:
+        head_bytes = max_output_bytes // 4
+        stdout = BoundedCapture(head_bytes, max_output_bytes - head_bytes)
+        stderr = BoundedCapture(head_bytes, max_output_bytes - head_bytes)
+    result = SupervisedResult(steps, stdout, stderr)
+
+    # the shell reports the start of every step on a side pipe, which is how
+    # per-command deadlines work without giving up `cd dir && ...` chains.
+    # The pipe comes in as stdin and is moved to MARKER_FD by the script
+    # itself, and limits are set with ulimit: no preexec_fn, which is not
+    # safe to use while other threads are running
+    marker_read, marker_write = os.pipe()
+    setup = [f"exec {MARKER_FD}>&0 0</dev/null"]
+    if limits.cpu_seconds is not None:
+        # SIGXCPU at the soft limit, SIGKILL a second later
+        setup.append(f"ulimit -S -t {limits.cpu_seconds}")
+        setup.append(f"ulimit -H -t {limits.cpu_seconds + 1}")
+    if limits.memory_bytes is not None:
+        setup.append(f"ulimit -v {max(limits.memory_bytes // 1024, 1)}")
+    # setup lines stand alone so a trailing `&` in a step cannot pull them
+    # into a background job
+    command = "\n".join(
+        [
+            *(f"{line} || exit 126" for line in setup),
+            " && ".join(f"printf . >&{MARKER_FD} && {step}" for step in steps),
+        ]
+    )
+
+    spill = gzip.open(spill_path, "wb") if spill_path else None
+    started, start = time.time(), time.perf_counter()
+    try:
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            cwd=cwd,
+            env={**os.environ, **env} if env else None,
+            stdin=marker_write,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+    finally:
+        os.close(marker_write)
+
+    deadline = start + limits.wall_seconds if limits.wall_seconds else None
+    step_deadline = None
+    drain_deadline = None
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ, stdout)
+        selector.register(process.stderr, selectors.EVENT_READ, stderr)
+        selector.register(marker_read, selectors.EVENT_READ, None)
+
+        def output_open() -> bool:
+            return any(key.data for key in selector.get_map().values())
+
+        while output_open() or process.poll() is None:
+            now = time.perf_counter()
+            if drain_deadline is None:
+                if deadline is not None and now >= deadline:
+                    result.timeout_reason = (
+                        f"verification exceeded {limits.wall_seconds}s wall-clock limit"
+                    )
+                elif cancel_path is not None and os.path.exists(cancel_path):
+                    result.timeout_reason = "verification was cancelled"
+                elif step_deadline is not None and now >= step_deadline:
+                    result.timeout_reason = (
+                        f"command exceeded {limits.command_wall_seconds}s "
+                        f"wall-clock limit: {result.current_step}"
+                    )
+                if result.timed_out or process.poll() is not None:
+                    # also reaps background jobs that would outlive the shell
+                    kill_process_group(process)
+                    drain_deadline = now + DRAIN_SECONDS
+            elif now >= drain_deadline:
+                break
+
+            for key, _ in selector.select(timeout=POLL_SECONDS):
+                data = os.read(key.fd, READ_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                if key.data is None:
+                    result.steps_started += len(data)
+                    if limits.command_wall_seconds:
+                        step_deadline = (
+                            time.perf_counter() + limits.command_wall_seconds
+                        )
+                    continue
+                key.data.write(data)
+                if key.data is stdout:
+                    stdout.track_lines(data)
+                if spill:
+                    spill.write(data)
+
+    result.returncode = process.wait()
+    kill_process_group(process)
+    os.close(marker_read)
+    process.stdout.close()
+    process.stderr.close()
+    if spill:
+        spill.close()
+
+    # the shell reports a child killed by SIGXCPU as 128 + SIGXCPU
+    if not result.timed_out and result.returncode in (
+        -signal.SIGXCPU,
+        128 + signal.SIGXCPU,
+    ):
+        result.timeout_reason = (
+            f"command exceeded {limits.cpu_seconds}s CPU time limit: "
+            f"{result.current_step}"
+        )
+
+    if tracer.enabled:
+        tracer.record_command(
+            " && ".join(steps),
+            cwd,
+            started,
+            time.perf_counter() - start,
+            result.returncode,
+            stdout.total_bytes + stderr.total_bytes,
+        )
+    return result
@@ -0,0 +1,170 @@
+from models import RepoToolInput, RepoChange, FileAction, Action
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import pytest
+import json
+import os
+
+
+def make_tool_input():
+    return RepoToolInput(
+        changes=[
+            RepoChange(
+                file_action=FileAction(
+                    action=Action.CREATE,
+                    file_name="a.txt",
+                    content='{"changes": ["}"]}',
+                )
+            ),
+            RepoChange(file_action=FileAction(action=Action.DELETE, file_name="b.txt")),
+        ]
+    )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+    # False cuts streams off before [DONE]
+    finish_streams = True
+    # answered instead of a completion when set
+    error_status = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        StandInHandler.connections.add(self.client_address)
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        arguments = make_tool_input().model_dump_json()
+
+        if self.error_status is not None:
+            body = json.dumps({"error": {"message": "rate limited"}}).encode()
+            self.send_response(self.error_status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if not payload.get("stream"):
+            body = json.dumps(
+                {
+                    "choices": [
+                        {
+                            "message": {
+                                "role": "assistant",
+                                "content": None,
+                                "tool_calls": [
+                                    {
+                                        "id": "call_1",
+                                        "type": "function",
+                                        "function": {
+                                            "name": "implement_changes",
+                                            "arguments": arguments,
+                                        },
+                                    }
+                                ],
+                            }
+                        }
+                    ]
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # Stream the arguments in small fragments, like the real API does
+        chunks = [
+            {
+                "tool_calls": [
+                    {
+                        "index": 0,
+                        "id": "call_1",
+                        "function": {"name": "implement_changes"},
+                    }
+                ]
+            }
+        ]
+        for i in range(0, len(arguments), 7):
+            chunks.append(
+                {
+                    "tool_calls": [
+                        {"index": 0, "function": {"arguments": arguments[i : i + 7]}}
+                    ]
+                }
+            )
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [
+            f"data: {json.dumps({'choices': [{'delta': c}]})}\n\n" for c in chunks
+        ]
+        if self.finish_streams:
+            events.append("data: [DONE]\n\n")
+        for event in events:
+            data = event.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def run_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def tool_input():
+    return make_tool_input()
+
+
+@pytest.fixture
+def stand_in_server():
+    # a local server that answers every chat request with make_tool_input()
+    StandInHandler.connections = set()
+    StandInHandler.finish_streams = True
+    StandInHandler.error_status = None
+    server = run_server()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def write_file(repo_dir, path, content):
+    os.makedirs(
+        os.path.dirname(os.path.join(repo_dir, path)) or repo_dir, exist_ok=True
+    )
+    with open(os.path.join(repo_dir, path), "w") as file:
+        file.write(content)
+
+
+def file_creation(file_name, content):
+    return RepoToolInput(
+        changes=[
+            RepoChange(
+                file_action=FileAction(
+                    action=Action.CREATE, file_name=file_name, content=content
+                )
+            )
+        ]
+    )
+
+
+@pytest.fixture
+def write():
+    # write(repo_dir, path, content), creating parent directories
+    return write_file
+
+
+@pytest.fixture
+def create_file():
+    # create_file(file_name, content): a RepoToolInput creating one file
+    return file_creation
@@ -0,0 +1,47 @@
+from models import Requirement, RepoToolInput, RepoChange, FileAction, Action
+from async_repo_tool import AsyncRepoTool
+
+import asyncio
+import tempfile
+
+
+def test_async_repo_tool_round_trip():
+    async def run(tmpdir):
+        await AsyncRepoTool.run_command("git init", tmpdir)
+        repo_tool = AsyncRepoTool(tmpdir)
+
+        await repo_tool.implement_changes(
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE,
+                            file_name="hello.sh",
+                            content="echo hello world\n",
+                        )
+                    )
+                ]
+            )
+        )
+        success, _ = await repo_tool.commit("initial commit")
+        assert success
+
+        requirement = Requirement(
+            description="script prints hello world",
+            verification_commands=["sh hello.sh"],
+            expected_output="hello world",
+        )
+        (fulfilled, output), blob_hashes = await asyncio.gather(
+            repo_tool.requirement_is_fulfilled(requirement),
+            repo_tool.fetch_blob_hashes(),
+        )
+        assert fulfilled, output
+        assert list(blob_hashes) == ["hello.sh"]
+
+        # Failing commands report combined stdout and stderr
+        success, output = await AsyncRepoTool.run_command("echo out; exit 3", tmpdir)
+        assert not success
+        assert output.startswith("out")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        asyncio.run(run(tmpdir))
@@ -0,0 +1,121 @@
+from batch import run_batch, load_jobs
+from models import Requirement, RepoToolInput, RepoChange, FileAction, Action
+
+import tempfile
+import json
+import os
+
+
+def tool_message(name: str, arguments: str):
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [
+            {
+                "id": f"call_{name}",
+                "type": "function",
+                "function": {"name": name, "arguments": arguments},
+            }
+        ],
+    }
+
+
+class ScriptedClient:
+    # asks to `cat hello.txt`, then creates it
+    def complete(self, payload):
+        requirement = Requirement(
+            description="hello.txt says hello",
+            verification_commands=["cat hello.txt"],
+            expected_output="hello",
+        )
+        return tool_message("check_requirements", requirement.model_dump_json())
+
+    def stream(self, payload, on_change=None):
+        changes = RepoToolInput(
+            changes=[
+                RepoChange(
+                    file_action=FileAction(
+                        action=Action.CREATE, file_name="hello.txt", content="hello\n"
+                    )
+                )
+            ]
+        )
+        return tool_message("implement_changes", changes.model_dump_json())
+
+
+def test_batch_runs_jobs_in_their_own_repositories():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jobs_path = os.path.join(tmpdir, "jobs.jsonl")
+        with open(jobs_path, "w") as file:
+            for index in range(3):
+                file.write(json.dumps({"requirement": f"say hello #{index}"}) + "\n")
+        jobs = load_jobs(jobs_path)
+        jobs.append({"id": "no-rounds", "requirement": "say hello"})
+
+        work_dir = os.path.join(tmpdir, "runs")
+        results_path = os.path.join(tmpdir, "results.jsonl")
+        records = run_batch(
+            jobs[:3],
+            work_dir,
+            results_path,
+            max_workers=2,
+            make_client=ScriptedClient,
+            repo_tool_options={},
+        )
+        assert sorted(record["id"] for record in records) == [
+            "job-1",
+            "job-2",
+            "job-3",
+        ]
+        assert all(record["status"] == "fulfilled" for record in records)
+        assert all(record["iterations"] == 1 for record in records)
+        assert os.path.exists(os.path.join(work_dir, "job-2", "hello.txt"))
+
+        # finished jobs are skipped, the iteration cap is honoured
+        records = run_batch(
+            jobs,
+            work_dir,
+            results_path,
+            max_iterations=0,
+            make_client=ScriptedClient,
+            repo_tool_options={},
+        )
+        assert [(record["id"], record["status"]) for record in records] == [
+            ("no-rounds", "unfulfilled")
+        ]
+        with open(results_path) as file:
+            assert len(file.readlines()) == 4
+
+
+class SpeculativeClient(ScriptedClient):
+    def complete_choices(self, payload, n):
+        assert n == 2
+        good = self.stream(payload)
+        bad = tool_message(
+            "implement_changes",
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE, file_name="hello.txt", content="bye\n"
+                        )
+                    )
+                ]
+            ).model_dump_json(),
+        )
+        return [bad, good]
+
+
+def test_speculative_candidates_finish_in_one_round():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        records = run_batch(
+            [{"id": "speculative", "requirement": "say hello"}],
+            os.path.join(tmpdir, "runs"),
+            os.path.join(tmpdir, "results.jsonl"),
+            max_iterations=1,
+            make_client=SpeculativeClient,
+            repo_tool_options={},
+            candidates=2,
+        )
+        assert records[0]["status"] == "fulfilled"
+        assert records[0]["iterations"] == 1
@@ -0,0 +1,27 @@
+from benchmarks import bench_repo_tool
+
+import tempfile
+import json
+import os
+
+
+def test_benchmark_suite_smoke():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = os.path.join(tmpdir, "results.json")
+        bench_repo_tool.run(
+            sizes=[10], layouts=["flat", "deep"], repeat=1, batch=5, output=output
+        )
+
+        with open(output) as file:
+            results = json.load(file)
+
+        names = {result["benchmark"] for result in results["results"]}
+        assert "fetch_blob_hashes_cold" in names
+        assert "implement_changes_5_patches" in names
+        assert "implement_changes_5_file_creations" in names
+        assert "requirement_is_fulfilled_cached" in names
+        assert all(result["seconds"]["min"] >= 0 for result in results["results"])
+        assert all(result["peak_python_bytes"] > 0 for result in results["results"])
+
+        # Comparing a run against itself reports no regressions
+        assert bench_repo_tool.compare(results, output, threshold=1e9) == []
@@ -0,0 +1,86 @@
+from build_cache import build_dir_for, compile_cached, parse_compile
+from models import Requirement
+from repo_tool import RepoTool
+
+import tempfile
+import os
+
+
+def test_parse_compile_strips_outputs():
+    compile_ = parse_compile(
+        ["-O2", "-MD", "-MT", "a.o", "-MF", "a.o.d", "-o", "a.o", "-c", "a.c"]
+    )
+    assert compile_["object"] == "a.o"
+    assert compile_["deps"] == "a.o.d"
+    assert compile_["preprocess"] == ["-O2", "-E", "a.c"]
+
+    # links are not cached
+    assert parse_compile(["-o", "hello", "a.o"]) is None
+
+
+def test_compile_cached_hits_on_identical_preprocessed_input():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_dir = os.path.join(tmpdir, "cache")
+        source = os.path.join(tmpdir, "a.c")
+        header = os.path.join(tmpdir, "a.h")
+        with open(header, "w") as file:
+            file.write("#define ANSWER 42\n")
+        with open(source, "w") as file:
+            file.write('#include "a.h"\nint answer(void) { return ANSWER; }\n')
+
+        argv = ["cc", "-o", os.path.join(tmpdir, "a.o"), "-c", source]
+        assert compile_cached(argv, cache_dir) == (0, "miss")
+        with open(os.path.join(tmpdir, "a.o"), "rb") as file:
+            compiled = file.read()
+        os.remove(os.path.join(tmpdir, "a.o"))
+
+        # a comment does not survive preprocessing, so this is still a hit
+        with open(source, "a") as file:
+            file.write("/* reformatted */\n")
+        assert compile_cached(argv, cache_dir) == (0, "hit")
+        with open(os.path.join(tmpdir, "a.o"), "rb") as file:
+            assert file.read() == compiled
+
+        # a header change is not
+        with open(header, "w") as file:
+            file.write("#define ANSWER 43\n")
+        assert compile_cached(argv, cache_dir) == (0, "miss")
+
+
+def test_persistent_build_dir_outside_the_repository():
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as build_root:
+        RepoTool.run_command("git init", tmpdir)
+        with open(os.path.join(tmpdir, "CMakeLists.txt"), "w") as file:
+            file.write(
+                "cmake_minimum_required(VERSION 3.5)\n"
+                "project(HelloWorld)\n"
+                "add_executable(hello main.cpp)\n"
+            )
+        with open(os.path.join(tmpdir, "main.cpp"), "w") as file:
+            file.write(
+                "#include <iostream>\n"
+                'int main() { std::cout << "hello world" << std::endl; }\n'
+            )
+        RepoTool.run_command("git add . && git commit -m 'hello'", tmpdir)
+
+        cache_dir = os.path.join(build_root, "ccache")
+        repo_tool = RepoTool(tmpdir, build_root=build_root, compiler_cache=cache_dir)
+        requirement = Requirement(
+            description="hello builds out of tree",
+            verification_commands=[
+                'cmake -S . -B "$GITPT_BUILD_DIR"',
+                'cmake --build "$GITPT_BUILD_DIR"',
+                '"$GITPT_BUILD_DIR/hello"',
+            ],
+            expected_output="hello world",
+        )
+
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        build_dir = build_dir_for(tmpdir, build_root)
+        assert os.path.exists(os.path.join(build_dir, "CMakeCache.txt"))
+        assert not os.path.exists(os.path.join(tmpdir, "CMakeCache.txt"))
+        assert os.listdir(cache_dir)
+
+        # the second run reuses the configured build directory
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert build_dir_for(tmpdir, build_root) == build_dir
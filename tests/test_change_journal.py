@@ -0,0 +1,58 @@
+from repo_tool import RepoTool
+
+import tempfile
+import pytest
+import os
+
+
+def test_journal_limits_status_to_changed_paths(write):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        for index in range(20):
+            write(tmpdir, f"src/file{index}.txt", f"{index}\n")
+        write(tmpdir, "dirty.txt", "committed\n")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+        write(tmpdir, "dirty.txt", "dirty before the journal\n")
+
+        repo_tool = RepoTool(tmpdir, watch_changes=True)
+        unwatched = RepoTool(tmpdir)
+        if repo_tool.journal is None:
+            pytest.skip("inotify is not available")
+
+        # the first query is a full scan, which sets the baseline
+        assert repo_tool.changed_candidates() is None
+        assert repo_tool.dirty_digest() == unwatched.dirty_digest()
+        assert repo_tool.changed_candidates() == ["dirty.txt"]
+
+        write(tmpdir, "src/file3.txt", "edited\n")
+        write(tmpdir, "new/deeper/file.txt", "new\n")
+        candidates = repo_tool.changed_candidates()
+        assert "dirty.txt" in candidates
+        assert "src/file3.txt" in candidates
+        assert "new" in candidates
+        assert "src/file4.txt" not in candidates
+
+        # the same answers as a full scan
+        assert repo_tool.dirty_digest() == unwatched.dirty_digest()
+        snapshot = repo_tool.snapshot()
+        assert sorted(snapshot.saved) == ["dirty.txt", "src/file3.txt"]
+        assert snapshot.untracked == {"new/"}
+        write(tmpdir, "newer/later.txt", "later\n")
+        repo_tool.rollback(snapshot)
+        snapshot.discard()
+        assert not os.path.exists(os.path.join(tmpdir, "newer"))
+        assert os.path.exists(os.path.join(tmpdir, "new/deeper/file.txt"))
+
+        # paths a query finds clean drop out of the journal
+        RepoTool.run_command("git add -A && git commit -m 'everything'", tmpdir)
+        assert repo_tool.dirty_digest() == unwatched.dirty_digest()
+        assert repo_tool.changed_candidates() == []
+
+        # lost events mean a full scan, after which the journal starts over
+        write(tmpdir, "src/file4.txt", "edited\n")
+        repo_tool.journal.overflowed = True
+        assert repo_tool.changed_candidates() is None
+        assert repo_tool.dirty_digest() == unwatched.dirty_digest()
+        assert repo_tool.changed_candidates() == ["src/file4.txt"]
+        repo_tool.close()
+        unwatched.close()
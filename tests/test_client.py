@@ -0,0 +1,67 @@
+from client import ChatClient, IncrementalChangesParser
+from models import RepoToolInput
+
+import requests
+import pytest
+
+
+def test_complete_reuses_connection(stand_in_server, tool_input):
+    client = ChatClient(
+        url=f"http://127.0.0.1:{stand_in_server.server_port}/", api_key="test"
+    )
+    for _ in range(3):
+        message = client.complete({"messages": []})
+        args = message["tool_calls"][0]["function"]["arguments"]
+        assert RepoToolInput.model_validate_json(args) == tool_input
+
+    # Keep-alive: every request went over the same connection
+    assert len(stand_in_server.RequestHandlerClass.connections) == 1
+    client.close()
+
+
+def test_stream_emits_changes_before_completion(stand_in_server, tool_input):
+    client = ChatClient(
+        url=f"http://127.0.0.1:{stand_in_server.server_port}/", api_key="test"
+    )
+    seen = []
+    message = client.stream({"messages": []}, on_change=seen.append)
+
+    assert seen == tool_input.changes
+    tool_call = message["tool_calls"][0]
+    assert tool_call["id"] == "call_1"
+    assert tool_call["function"]["name"] == "implement_changes"
+    assert (
+        RepoToolInput.model_validate_json(tool_call["function"]["arguments"])
+        == tool_input
+    )
+    client.close()
+
+
+def test_incremental_parser_emits_changes_early(tool_input):
+    parser = IncrementalChangesParser()
+    text = tool_input.model_dump_json()
+
+    completed = []
+    first_seen_at = None
+    for char in text:
+        completed.extend(parser.feed(char))
+        if completed and first_seen_at is None:
+            first_seen_at = parser.length
+
+    # The first change is available well before the document is finished
+    assert first_seen_at < len(text) - 100
+    assert completed == tool_input.changes
+
+
+def test_http_errors_are_raised(stand_in_server):
+    stand_in_server.RequestHandlerClass.error_status = 429
+    client = ChatClient(
+        url=f"http://127.0.0.1:{stand_in_server.server_port}/", api_key="test"
+    )
+    with pytest.raises(requests.HTTPError):
+        client.complete({"messages": []})
+    with pytest.raises(requests.HTTPError):
+        client.complete_choices({"messages": []}, 2)
+    with pytest.raises(requests.HTTPError):
+        client.stream({"messages": []})
+    client.close()
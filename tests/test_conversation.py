@@ -0,0 +1,93 @@
+from conversation import (
+    Conversation,
+    BLOB_HASH_SNAPSHOT,
+    BLOB_HASH_DELTA,
+    estimate_tokens,
+)
+
+
+def turn(index: int, output_size: int):
+    return [
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call{index}",
+                    "type": "function",
+                    "function": {
+                        "name": "implement_changes",
+                        "arguments": "x" * output_size,
+                    },
+                }
+            ],
+        },
+        {
+            "role": "tool",
+            "tool_call_id": f"call{index}",
+            "name": "implement_changes",
+            "content": "build output\n" * (output_size // 13),
+        },
+    ]
+
+
+def pinned_messages():
+    return [
+        {"role": "system", "content": "system prompt"},
+        {"role": "user", "content": "Requirement: hello world"},
+    ]
+
+
+def test_superseded_blob_hash_reports_are_dropped():
+    conversation = Conversation(pinned_messages())
+    conversation.append({"role": "user", "content": "all"}, kind=BLOB_HASH_SNAPSHOT)
+    conversation.append({"role": "user", "content": "d1"}, kind=BLOB_HASH_DELTA)
+    conversation.append({"role": "user", "content": "all"}, kind=BLOB_HASH_SNAPSHOT)
+    conversation.append({"role": "user", "content": "d2"}, kind=BLOB_HASH_DELTA)
+
+    messages = conversation.compact()
+    assert [message["content"] for message in messages[2:]] == ["all", "d2"]
+    assert not conversation.blob_hashes_dropped
+
+
+def test_payload_stays_within_budget_over_long_sessions():
+    conversation = Conversation(
+        pinned_messages(), token_budget=5_000, keep_recent=3, folded_chars=200
+    )
+    sizes = []
+    for index in range(50):
+        for message in turn(index, 4_000):
+            conversation.append(message)
+        conversation.append(
+            {"role": "user", "content": f"changes {index}"},
+            kind=BLOB_HASH_SNAPSHOT if index == 0 else BLOB_HASH_DELTA,
+        )
+        messages = conversation.compact()
+        sizes.append(sum(estimate_tokens(message) for message in messages))
+
+    assert max(sizes) <= 5_000
+    # pinned messages are untouched
+    assert messages[:2] == pinned_messages()
+    # the latest turn is verbatim
+    assert messages[-2]["content"] == "build output\n" * (4_000 // 13)
+    # every tool result still follows the call it answers
+    for index, message in enumerate(messages):
+        if message["role"] == "tool":
+            calls = messages[index - 1].get("tool_calls") or []
+            assert message["tool_call_id"] in [call["id"] for call in calls]
+    # old reports were dropped, so the next one must be a full snapshot
+    assert conversation.blob_hashes_dropped
+
+
+def test_old_tool_output_is_folded_before_turns_are_dropped():
+    conversation = Conversation(
+        pinned_messages(), token_budget=3_000, keep_recent=2, folded_chars=100
+    )
+    for index in range(3):
+        for message in turn(index, 4_000):
+            conversation.append(message)
+
+    messages = conversation.compact()
+    assert len(messages) == 8
+    assert "characters folded" in messages[3]["content"]
+    assert len(messages[2]["tool_calls"][0]["function"]["arguments"]) < 200
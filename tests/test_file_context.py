@@ -0,0 +1,53 @@
+from file_context import ContextDelivery, number_lines
+from patch_engine import PatchResult, HunkResult
+from repo_tool import RepoTool
+
+import tempfile
+import os
+
+
+def test_number_lines_ranges():
+    text = "".join(f"line {number}\n" for number in range(1, 12))
+    assert number_lines(text, 9, 20) == " 9| line 9\n10| line 10\n11| line 11"
+    assert number_lines("a\nb\n") == "1| a\n2| b"
+    # only newlines end lines, as in the patch engine
+    assert number_lines("a\x0cb\nc\u2028d\ne", 3) == "3| e"
+
+
+def test_contents_are_shipped_once_per_blob_hash():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        with open(os.path.join(tmpdir, "a.txt"), "w") as file:
+            file.write("alpha\n")
+        with open(os.path.join(tmpdir, "b.bin"), "wb") as file:
+            file.write(b"\0\1\2")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+
+        repo_tool = RepoTool(tmpdir)
+        delivery = ContextDelivery(repo_tool)
+        first = delivery.contents_message()
+        assert "a.txt" in first and "1| alpha" in first
+        assert "b.bin" in first and "binary file" in first
+        assert delivery.contents_message() == ""
+
+        # only the file whose blob changed comes back
+        with open(os.path.join(tmpdir, "a.txt"), "w") as file:
+            file.write("alpha\nbeta\n")
+        RepoTool.run_command("git commit -am 'edit'", tmpdir)
+        second = delivery.contents_message(["a.txt"])
+        assert "2| beta" in second and "b.bin" not in second
+
+        delivery.reset()
+        assert "b.bin" in delivery.contents_message()
+
+        excerpts = delivery.failed_hunk_excerpts(
+            [
+                PatchResult(
+                    file_name="a.txt",
+                    hunks=[HunkResult(diff_range="-2 +2", applied=False)],
+                )
+            ],
+            context=1,
+        )
+        assert excerpts == "a.txt lines 1-4:\n```\n1| alpha\n2| beta\n```"
+        repo_tool.close()
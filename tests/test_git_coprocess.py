@@ -0,0 +1,59 @@
+from models import RepoToolInput, RepoChange, FileAction, Action
+from repo_tool import RepoTool
+
+import tempfile
+import os
+
+
+def test_persistent_git_round_trip():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        repo_tool = RepoTool(tmpdir, persistent_git=True)
+
+        # Staging goes through the update-index coprocess and is flushed per call
+        repo_tool.implement_changes(
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE, file_name="a.txt", content="hello\n"
+                        )
+                    )
+                ]
+            )
+        )
+        assert not os.path.exists(os.path.join(tmpdir, ".git", "index.lock"))
+        _, status = RepoTool.run_command("git status --porcelain", tmpdir)
+        assert status == "A  a.txt"
+
+        # hash-object and cat-file answer over the same long-lived pipes
+        [blob_hash] = repo_tool.hash_files(["a.txt"])
+        _, expected = RepoTool.run_command("git hash-object a.txt", tmpdir)
+        assert blob_hash == expected
+        assert repo_tool.hash_files(["a.txt"]) == [expected]
+        # more answers than a pipe holds must not deadlock
+        assert repo_tool.hash_files(["./a.txt"] * 20_000) == [expected] * 20_000
+
+        RepoTool.run_command("git commit -m 'initial commit'", tmpdir)
+        assert repo_tool.read_object(blob_hash) == ("blob", b"hello\n")
+
+        repo_tool.close()
+
+
+def test_persistent_git_restarts_dead_coprocess():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        with open(os.path.join(tmpdir, "a.txt"), "w") as file:
+            file.write("hello\n")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+        _, blob_hash = RepoTool.run_command("git rev-parse HEAD:a.txt", tmpdir)
+
+        repo_tool = RepoTool(tmpdir, persistent_git=True)
+        assert repo_tool.read_object(blob_hash) == ("blob", b"hello\n")
+
+        # Kill the cat-file coprocess behind the tool's back
+        repo_tool._git.cat_file.process.kill()
+        repo_tool._git.cat_file.process.wait()
+        assert repo_tool.read_object(blob_hash) == ("blob", b"hello\n")
+
+        repo_tool.close()
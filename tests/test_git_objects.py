@@ -0,0 +1,116 @@
+from git_objects import GitObjectStore, BlobHashDelta
+from repo_tool import RepoTool
+
+import tempfile
+import pytest
+import os
+
+
+def ls_tree(tmpdir):
+    _, output = RepoTool.run_command("git ls-tree -r HEAD", tmpdir)
+    blob_hashes = {}
+    for line in output.splitlines():
+        _, _, blob_hash, file_path = line.split(maxsplit=3)
+        blob_hashes[file_path] = blob_hash
+    return blob_hashes
+
+
+def make_history(tmpdir):
+    # Several commits of similar files in nested directories so gc produces deltas
+    RepoTool.run_command("git init", tmpdir)
+    for commit in range(3):
+        for i in range(20):
+            dir_path = os.path.join(tmpdir, f"dir{i % 4}", "nested")
+            os.makedirs(dir_path, exist_ok=True)
+            with open(os.path.join(dir_path, f"file{i}.txt"), "w") as file:
+                file.write("shared line\n" * 50 + f"commit {commit} file {i}\n")
+        RepoTool.run_command("git add .", tmpdir)
+        RepoTool.run_command(f"git commit -m 'commit {commit}'", tmpdir)
+
+
+def test_loose_objects_match_ls_tree():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_history(tmpdir)
+
+        store = GitObjectStore(tmpdir)
+        assert store.head_blob_hashes() == ls_tree(tmpdir)
+
+
+def test_packed_objects_match_ls_tree():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_history(tmpdir)
+        RepoTool.run_command("git gc --aggressive --quiet", tmpdir)
+        # the branch HEAD points to now lives in packed-refs, whatever its name
+        _, branch = RepoTool.run_command("git symbolic-ref HEAD", tmpdir)
+        assert not os.path.exists(os.path.join(tmpdir, ".git", branch))
+        with open(os.path.join(tmpdir, ".git", "packed-refs")) as file:
+            assert branch in file.read().split()
+
+        store = GitObjectStore(tmpdir)
+        assert store.head_blob_hashes() == ls_tree(tmpdir)
+
+        # Blob contents survive delta resolution
+        blob_hash = ls_tree(tmpdir)["dir1/nested/file5.txt"]
+        obj_type, data = store.read_object(blob_hash)
+        assert obj_type == "blob"
+        assert data.endswith(b"commit 2 file 5\n")
+
+
+def test_fetch_blob_hashes_unborn_head():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        repo_tool = RepoTool(tmpdir)
+        assert repo_tool.fetch_blob_hashes() == {}
+
+        RepoTool.run_command("git init", tmpdir)
+        assert repo_tool.fetch_blob_hashes() == {}
+
+        with open(os.path.join(tmpdir, "file.txt"), "w") as file:
+            file.write("content\n")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+        assert repo_tool.fetch_blob_hashes() == ls_tree(tmpdir)
+
+
+def test_fetch_blob_hash_delta():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_history(tmpdir)
+        repo_tool = RepoTool(tmpdir)
+
+        # The first report lists every path
+        delta = repo_tool.fetch_blob_hash_delta()
+        assert delta.added == ls_tree(tmpdir)
+        assert not repo_tool.fetch_blob_hash_delta()
+
+        # Modify, add, remove and replace a directory with a file
+        before = ls_tree(tmpdir)
+        with open(os.path.join(tmpdir, "dir0", "nested", "file0.txt"), "w") as file:
+            file.write("modified\n")
+        os.makedirs(os.path.join(tmpdir, "dir9"))
+        with open(os.path.join(tmpdir, "dir9", "new.txt"), "w") as file:
+            file.write("new\n")
+        RepoTool.run_command("git rm -rq dir1", tmpdir)
+        with open(os.path.join(tmpdir, "dir1"), "w") as file:
+            file.write("now a file\n")
+        RepoTool.run_command("git add -A && git commit -m 'reshape'", tmpdir)
+
+        delta = repo_tool.fetch_blob_hash_delta()
+        expected = BlobHashDelta.between(before, ls_tree(tmpdir))
+        assert delta.to_dict() == expected.to_dict()
+        assert list(delta.modified) == ["dir0/nested/file0.txt"]
+        assert sorted(delta.added) == ["dir1", "dir9/new.txt"]
+        assert len(delta.removed) == 5
+
+        # Resetting the report starts over with a full listing
+        repo_tool.reset_blob_hash_report()
+        assert repo_tool.fetch_blob_hash_delta().added == ls_tree(tmpdir)
+
+
+def test_reftable_refs_are_not_mistaken_for_an_unborn_head():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        RepoTool.run_command("git commit --allow-empty -m 'initial commit'", tmpdir)
+        os.makedirs(os.path.join(tmpdir, ".git", "reftable"))
+
+        store = GitObjectStore(tmpdir)
+        with pytest.raises(ValueError):
+            store.head_blob_hashes()
+        store.close()
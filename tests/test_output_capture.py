@@ -0,0 +1,71 @@
+from output_capture import BoundedCapture
+from supervisor import run_supervised
+from models import Requirement
+from repo_tool import RepoTool
+
+import tempfile
+import gzip
+import os
+
+
+def test_bounded_capture_keeps_head_and_tail():
+    capture = BoundedCapture(head_bytes=10, tail_bytes=10)
+    for i in range(1000):
+        data = f"line {i}\n".encode()
+        capture.write(data)
+        capture.track_lines(data)
+
+    assert capture.truncated
+    text = capture.text()
+    assert text.startswith("line 0\nlin")
+    assert text.endswith("line 999\n")
+    assert "bytes omitted" in text
+    assert capture.last_line == "line 999"
+    assert len(capture.tail) <= 20
+
+
+def test_run_supervised_large_output():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        spill_path = os.path.join(tmpdir, "log.gz")
+        # ~6MB of build noise on both streams, then the interesting line
+        command = (
+            "seq 1 500000 | sed 's/^/compiling /'; "
+            "seq 1 200000 >&2; echo; echo 'hello world'; echo"
+        )
+        result = run_supervised(
+            [command], cwd=tmpdir, max_output_bytes=64 * 1024, spill_path=spill_path
+        )
+
+        assert result.returncode == 0
+        assert result.stdout.last_line == "hello world"
+        assert len(result.stdout.text()) < 64 * 1024 + 100
+        assert result.stdout.text().startswith("compiling 1\n")
+
+        # The full log survives on disk
+        with gzip.open(spill_path, "rt") as file:
+            spilled = file.read()
+        assert "compiling 250000\n" in spilled
+        assert "hello world" in spilled
+
+
+def test_requirement_with_bounded_output():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        repo_tool = RepoTool(tmpdir, max_output_bytes=4096)
+
+        requirement = Requirement(
+            description="prints hello world after lots of noise",
+            verification_commands=["seq 1 100000", "echo hello world"],
+            expected_output="hello world",
+        )
+        assert repo_tool.requirement_is_fulfilled(requirement) == (
+            True,
+            "Requirement fulfilled",
+        )
+
+        # Failures still report the (bounded) output
+        requirement.verification_commands = ["seq 1 100000", "false"]
+        fulfilled, output = repo_tool.requirement_is_fulfilled(requirement)
+        assert not fulfilled
+        assert "bytes omitted" in output
+        assert len(output) < 4096 + 100
@@ -0,0 +1,165 @@
+from patch_engine import apply_patches, parse_diff_range
+from models import Patch
+
+import tempfile
+import os
+
+
+def write(tmpdir, content, file_name="file.txt"):
+    with open(os.path.join(tmpdir, file_name), "w", newline="") as file:
+        file.write(content)
+
+
+def read(tmpdir, file_name="file.txt"):
+    with open(os.path.join(tmpdir, file_name), newline="") as file:
+        return file.read()
+
+
+def patch(diff_range, changes, file_name="file.txt"):
+    return Patch(
+        file_name=file_name, blob_hash="0000000", diff_range=diff_range, changes=changes
+    )
+
+
+def test_parse_diff_range():
+    assert parse_diff_range("-0,0 +1") == (0, 0, 1, 1)
+    assert parse_diff_range("-1,5 +1,2") == (1, 5, 1, 2)
+    assert parse_diff_range("@@ -3 +4,2 @@") == (3, 1, 4, 2)
+
+
+def test_apply_exact_hunk():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write(tmpdir, "line 1\nline 2 to remove\nline 3\n")
+
+        [result] = apply_patches(
+            tmpdir, [patch("-1,3 +1,2", [" line 1", "-line 2 to remove", " line 3"])]
+        )
+
+        assert result.applied
+        assert result.hunks[0].offset == 0
+        assert read(tmpdir) == "line 1\nline 3\n"
+
+
+def test_apply_to_empty_and_missing_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write(tmpdir, "")
+        apply_patches(tmpdir, [patch("-0,0 +1,2", ["+first", "+second"])])
+        assert read(tmpdir) == "first\nsecond\n"
+
+        # Pure additions create missing files; anything else reports failure
+        [created, missing] = apply_patches(
+            tmpdir,
+            [
+                patch("-0,0 +1", ["+new"], file_name="src/new.txt"),
+                patch("-1 +1", ["-old", "+new"], file_name="missing.txt"),
+            ],
+        )
+        assert created.applied
+        assert read(tmpdir, "src/new.txt") == "new\n"
+        assert not missing.applied
+        assert "does not exist" in missing.hunks[0].message
+
+
+def test_offset_search_and_fuzz():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write(tmpdir, "".join(f"line {i}\n" for i in range(1, 21)))
+
+        # The hunk claims line 2 but the context lives at line 10
+        [result] = apply_patches(
+            tmpdir, [patch("-2,3 +2,3", [" line 9", "-line 10", "+ten", " line 11"])]
+        )
+        assert result.hunks[0].offset == 7
+        assert result.hunks[0].fuzz == 0
+
+        # Stale outer context is ignored with fuzz
+        [result] = apply_patches(
+            tmpdir,
+            [patch("-14,3 +14,3", [" stale", "-line 15", "+fifteen", " line 16"])],
+        )
+        assert result.applied
+        assert result.hunks[0].fuzz == 1
+        assert "fifteen\nline 16\n" in read(tmpdir)
+
+        # Without fuzz the same hunk is rejected with a structured reason
+        [result] = apply_patches(
+            tmpdir,
+            [patch("-16,3 +16,3", [" stale", "-line 17", "+seventeen", " line 18"])],
+            max_fuzz=0,
+        )
+        assert not result.applied
+        assert result.hunks[0].message.startswith("context did not match")
+        assert "seventeen" not in read(tmpdir)
+
+
+def test_many_hunks_one_file():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write(tmpdir, "a\nb\nc\nd\ne\n")
+
+        # Line numbers refer to the original file, like a multi-hunk diff
+        [result] = apply_patches(
+            tmpdir,
+            [
+                patch("-1 +1,3", ["-a", "+a1", "+a2", "+a3"]),
+                patch("-3 +5", ["-c", "+C"]),
+                patch("-5 +7", [" e", "+f"]),
+                patch("-4 +6", ["-nope", "+never"]),
+            ],
+        )
+
+        assert [hunk.applied for hunk in result.hunks] == [True, True, True, False]
+        assert read(tmpdir) == "a1\na2\na3\nb\nC\nd\ne\nf\n"
+
+
+def test_preserves_crlf_and_missing_trailing_newline():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write(tmpdir, "one\r\ntwo\r\n")
+        apply_patches(tmpdir, [patch("-2 +2", ["-two", "+2"])])
+        assert read(tmpdir) == "one\r\n2\r\n"
+
+        write(tmpdir, "one\ntwo")
+        apply_patches(tmpdir, [patch("-2 +2", ["-two", "+2"])])
+        assert read(tmpdir) == "one\n2"
+
+
+def test_non_utf8_bytes_survive_patching():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, "file.txt"), "wb") as file:
+            file.write(b"caf\xe9\nline 2\n")
+
+        [result] = apply_patches(tmpdir, [patch("-2 +2", ["-line 2", "+changed"])])
+        assert result.applied
+        with open(os.path.join(tmpdir, "file.txt"), "rb") as file:
+            assert file.read() == b"caf\xe9\nchanged\n"
+
+        # context the file cannot match fails the hunk instead of raising
+        [result] = apply_patches(tmpdir, [patch("-1 +1", ["-café", "+coffee"])])
+        assert not result.applied
+
+
+def test_paths_outside_the_repository_are_rejected():
+    with tempfile.TemporaryDirectory() as outer:
+        repo_dir = os.path.join(outer, "repo")
+        os.makedirs(os.path.join(repo_dir, ".git"))
+        os.symlink(outer, os.path.join(repo_dir, "link"))
+
+        results = apply_patches(
+            repo_dir,
+            [
+                patch("-0,0 +1", ["+escaped"], file_name="../escaped.txt"),
+                patch("-0,0 +1", ["+escaped"], file_name=os.path.join(outer, "a.txt")),
+                patch("-0,0 +1", ["+escaped"], file_name="link/b.txt"),
+                patch("-0,0 +1", ["+hook"], file_name=".git/hooks/pre-commit"),
+                patch("-0,0 +1", ["+inside"], file_name="sub/../inside.txt"),
+            ],
+        )
+        assert [result.applied for result in results] == [
+            False,
+            False,
+            False,
+            False,
+            True,
+        ]
+        assert "invalid path" in results[0].hunks[0].message
+        assert sorted(os.listdir(outer)) == ["repo"]
+        assert not os.path.exists(os.path.join(repo_dir, ".git", "hooks"))
+        assert read(repo_dir, "inside.txt") == "inside\n"
@@ -5,8 +5,10 @@ from models import (
     FileAction,
     Action,
     DirectoryAction,
+    ContentEncoding,
 )
 from repo_tool import RepoTool
+import base64
 import os
 import tempfile
 
@@ -116,6 +118,36 @@ def test_repo_tool_with_directory_action():
         assert not os.path.exists(dir_path)
 
 
+def test_repo_tool_directory_create_skips_ignored_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        os.makedirs(os.path.join(tmpdir, "src"))
+        for name, content in [
+            (".gitignore", "*.o\n"),
+            ("src/a.c", "int a;\n"),
+            ("src/a.o", "object\n"),
+        ]:
+            with open(os.path.join(tmpdir, name), "w") as file:
+                file.write(content)
+
+        repo_tool = RepoTool(tmpdir)
+        repo_tool.implement_changes(
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        directory_action=DirectoryAction(
+                            action=Action.CREATE, directory_name="src"
+                        )
+                    )
+                ]
+            )
+        )
+
+        # the same files `git add src` would have staged
+        _, staged = RepoTool.run_command("git ls-files", tmpdir)
+        assert staged.splitlines() == ["src/a.c"]
+
+
 def test_repo_tool_remove_non_empty_directory():
     with tempfile.TemporaryDirectory() as tmpdir:
         # Setup: Initialize git repo and create a non-empty directory
@@ -142,3 +174,191 @@ def test_repo_tool_remove_non_empty_directory():
 
         # Verify the directory was deleted
         assert not os.path.exists(dir_path)
+
+
+def test_repo_tool_batched_changes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Setup: Initialize git repo with two committed files
+        RepoTool.run_command("git init", tmpdir)
+        for name in ["a.txt", "b.txt"]:
+            with open(os.path.join(tmpdir, name), "w") as file:
+                file.write(f"{name} line\n")
+        RepoTool.run_command("git add .", tmpdir)
+        RepoTool.run_command("git commit -m 'initial commit'", tmpdir)
+
+        # Two good patches, one patch that cannot apply, a new file and a deletion
+        repo_tool_input = RepoToolInput(
+            changes=[
+                RepoChange(
+                    patch=Patch(
+                        file_name="a.txt",
+                        blob_hash="0000000",
+                        diff_range="-1 +1",
+                        changes=["-a.txt line", "+a.txt modified"],
+                    )
+                ),
+                RepoChange(
+                    patch=Patch(
+                        file_name="b.txt",
+                        blob_hash="0000000",
+                        diff_range="-1 +1",
+                        changes=["-no such line", "+never applied"],
+                    )
+                ),
+                RepoChange(
+                    file_action=FileAction(
+                        action=Action.CREATE, file_name="c.txt", content="c\n"
+                    )
+                ),
+                RepoChange(
+                    patch=Patch(
+                        file_name="c.txt",
+                        blob_hash="0000000",
+                        diff_range="-1 +1",
+                        changes=["-c", "+c modified"],
+                    )
+                ),
+                RepoChange(
+                    file_action=FileAction(action=Action.DELETE, file_name="b.txt")
+                ),
+            ]
+        )
+        repo_tool = RepoTool(tmpdir)
+        repo_tool.implement_changes(repo_tool_input)
+
+        # Verify the good patches landed and everything is staged in the index
+        with open(os.path.join(tmpdir, "a.txt")) as file:
+            assert file.read() == "a.txt modified\n"
+        with open(os.path.join(tmpdir, "c.txt")) as file:
+            assert file.read() == "c modified\n"
+        assert not os.path.exists(os.path.join(tmpdir, "temp.patch"))
+
+        _, status = RepoTool.run_command("git status --porcelain", tmpdir)
+        assert sorted(status.splitlines()) == ["A  c.txt", "D  b.txt", "M  a.txt"]
+
+
+def test_repo_tool_streams_chunked_and_binary_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Setup: Initialize git repo
+        RepoTool.run_command("git init", tmpdir)
+        binary = bytes(range(256)) * 1000
+        encoded = base64.b64encode(binary).decode()
+
+        repo_tool = RepoTool(tmpdir)
+        repo_tool.implement_changes(
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE,
+                            file_name="text.txt",
+                            content="header\n",
+                            content_chunks=["line\n" * 1000, "ünïcode footer\n"],
+                        )
+                    ),
+                    # chunk boundaries need not fall on base64 groups
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE,
+                            file_name="asset.bin",
+                            encoding=ContentEncoding.BASE64,
+                            content_chunks=[encoded[:1001], encoded[1001:]],
+                        )
+                    ),
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE, file_name="gone.txt", content="x"
+                        )
+                    ),
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.DELETE, file_name="gone.txt"
+                        )
+                    ),
+                ]
+            )
+        )
+
+        with open(os.path.join(tmpdir, "asset.bin"), "rb") as file:
+            assert file.read() == binary
+        with open(os.path.join(tmpdir, "text.txt")) as file:
+            assert file.read() == "header\n" + "line\n" * 1000 + "ünïcode footer\n"
+
+        # Both files are staged with the blobs git itself would compute
+        _, status = RepoTool.run_command("git status --porcelain", tmpdir)
+        assert sorted(status.splitlines()) == ["A  asset.bin", "A  text.txt"]
+        _, staged = RepoTool.run_command("git ls-files -s", tmpdir)
+        _, hashed = RepoTool.run_command("git hash-object asset.bin text.txt", tmpdir)
+        assert [line.split()[1] for line in staged.splitlines()] == hashed.split()
+        assert RepoTool.run_command("git fsck --no-dangling", tmpdir)[0]
+
+
+def test_repo_tool_created_files_honour_gitattributes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        with open(os.path.join(tmpdir, ".gitattributes"), "w") as file:
+            file.write("* text=auto eol=lf\n")
+
+        repo_tool = RepoTool(tmpdir)
+        repo_tool.implement_changes(
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE,
+                            file_name="crlf.txt",
+                            content="one\r\ntwo\r\n",
+                        )
+                    )
+                ]
+            )
+        )
+
+        # staged as git normalises it, not as the bytes on disk
+        _, staged = RepoTool.run_command("git ls-files -s crlf.txt", tmpdir)
+        _, hashed = RepoTool.run_command("git hash-object crlf.txt", tmpdir)
+        assert staged.split()[1] == hashed
+
+
+def test_repo_tool_commit_uses_plumbing():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Setup: Initialize git repo with a hook that would reject any commit
+        RepoTool.run_command("git init", tmpdir)
+        hook_path = os.path.join(tmpdir, ".git", "hooks", "pre-commit")
+        with open(hook_path, "w") as file:
+            file.write("#!/bin/sh\nexit 1\n")
+        os.chmod(hook_path, 0o755)
+
+        repo_tool = RepoTool(tmpdir)
+        assert repo_tool.commit("empty") == (False, "nothing to commit")
+
+        repo_tool.implement_changes(
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE, file_name="a.txt", content="a\n"
+                        )
+                    )
+                ]
+            )
+        )
+        # an untracked file is not part of the commit
+        with open(os.path.join(tmpdir, "junk.txt"), "w") as file:
+            file.write("junk\n")
+
+        success, first = repo_tool.commit("commit #1")
+        assert success
+        _, head = RepoTool.run_command("git rev-parse HEAD", tmpdir)
+        assert head == first
+        _, files = RepoTool.run_command("git ls-tree --name-only HEAD", tmpdir)
+        assert files == "a.txt"
+        _, message = RepoTool.run_command("git log -1 --format=%s", tmpdir)
+        assert message == "commit #1"
+
+        # nothing staged since: no new commit
+        assert repo_tool.commit("commit #2") == (False, "nothing to commit")
+        success, second = repo_tool.commit("commit #2", allow_empty=True)
+        assert success
+        _, parent = RepoTool.run_command("git rev-parse HEAD^", tmpdir)
+        assert parent == first
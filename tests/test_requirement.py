@@ -1,7 +1,8 @@
-from models import Requirement
+from models import Requirement, RepoToolInput, RepoChange, FileAction, Action
 from repo_tool import RepoTool
 
 import tempfile
+import time
 import os
 
 
@@ -47,3 +48,138 @@ def test_requirement_is_fulfilled():
         fulfilled, output = repo_tool.requirement_is_fulfilled(requirement)
         print(output)
         assert not fulfilled
+
+
+def test_verify_requirements_in_parallel_worktrees():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Setup: a committed script and an uncommitted edit in the main checkout
+        RepoTool.run_command("git init", tmpdir)
+        with open(os.path.join(tmpdir, "hello.sh"), "w") as file:
+            file.write("echo hello world\n")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+        with open(os.path.join(tmpdir, "hello.sh"), "w") as file:
+            file.write("echo uncommitted\n")
+
+        requirements = [
+            Requirement(
+                description="script prints hello world",
+                verification_commands=["sh hello.sh"],
+                expected_output="hello world",
+            ),
+            Requirement(
+                description="verification runs outside the main checkout",
+                verification_commands=[f"test $(pwd) != {tmpdir}", "echo isolated"],
+                expected_output="isolated",
+            ),
+            Requirement(
+                description="failing requirement",
+                verification_commands=["echo nope"],
+                expected_output="yes",
+            ),
+        ]
+
+        repo_tool = RepoTool(tmpdir)
+        results = repo_tool.verify_requirements(requirements, max_workers=2)
+        assert [fulfilled for fulfilled, _ in results] == [True, True, False]
+
+        # All temporary worktrees were removed again
+        _, worktrees = RepoTool.run_command("git worktree list", tmpdir)
+        assert len(worktrees.splitlines()) == 1
+
+
+def test_evaluate_candidates_adopts_a_passing_candidate(create_file):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        with open(os.path.join(tmpdir, "README"), "w") as file:
+            file.write("base\n")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+
+        requirement = Requirement(
+            description="script prints hello world",
+            verification_commands=["sh hello.sh"],
+            expected_output="hello world",
+        )
+        repo_tool = RepoTool(tmpdir)
+        winner, results = repo_tool.evaluate_candidates(
+            [
+                create_file("hello.sh", "echo goodbye\n"),
+                create_file("hello.sh", "echo hello world\n"),
+            ],
+            requirement,
+            max_workers=2,
+        )
+        assert winner == 1
+        # the loser either failed or was abandoned once the winner passed
+        assert not results[0].fulfilled
+
+        # the main checkout only moves when a candidate is adopted
+        assert not os.path.exists(os.path.join(tmpdir, "hello.sh"))
+        assert repo_tool.adopt_candidate(results[winner])
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        _, status = RepoTool.run_command("git status --porcelain", tmpdir)
+        assert status == ""
+        # close() waits for abandoned candidates to remove their worktrees
+        repo_tool.close()
+        _, worktrees = RepoTool.run_command("git worktree list", tmpdir)
+        assert len(worktrees.splitlines()) == 1
+
+
+def test_evaluate_candidates_does_not_wait_for_slow_losers(create_file):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        RepoTool.run_command("git commit --allow-empty -m 'initial commit'", tmpdir)
+
+        requirement = Requirement(
+            description="script prints hello world",
+            verification_commands=["sh hello.sh"],
+            expected_output="hello world",
+        )
+        repo_tool = RepoTool(tmpdir)
+        start = time.perf_counter()
+        winner, results = repo_tool.evaluate_candidates(
+            [
+                create_file("hello.sh", "sleep 30\necho hello world\n"),
+                create_file("hello.sh", "echo hello world\n"),
+            ],
+            requirement,
+            max_workers=2,
+        )
+        assert winner == 1
+        assert time.perf_counter() - start < 10
+        repo_tool.close()
+        assert time.perf_counter() - start < 10
+        _, worktrees = RepoTool.run_command("git worktree list", tmpdir)
+        assert len(worktrees.splitlines()) == 1
+
+
+def test_evaluate_candidates_survives_a_candidate_that_raises(create_file):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        RepoTool.run_command("git commit --allow-empty -m 'initial commit'", tmpdir)
+
+        requirement = Requirement(
+            description="script prints hello world",
+            verification_commands=["sh h.sh"],
+            expected_output="hello world",
+        )
+        repo_tool = RepoTool(tmpdir)
+        winner, results = repo_tool.evaluate_candidates(
+            [
+                RepoToolInput(
+                    changes=[
+                        RepoChange(
+                            file_action=FileAction(
+                                action=Action.DELETE, file_name="nope.txt"
+                            )
+                        )
+                    ]
+                ),
+                create_file("h.sh", "echo hello world\n"),
+            ],
+            requirement,
+            max_workers=2,
+        )
+        assert winner == 1
+        assert results[1].fulfilled
+        assert not results[0].fulfilled
+        repo_tool.close()
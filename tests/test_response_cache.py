@@ -0,0 +1,69 @@
+from response_cache import ResponseCache, ReplayMiss
+from client import ChatClient
+
+import tempfile
+import time
+import pytest
+
+
+def test_key_ignores_stream_and_key_order():
+    payload = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    reordered = {"messages": payload["messages"], "model": "m", "stream": True}
+    assert ResponseCache.key(payload) == ResponseCache.key(reordered)
+    assert ResponseCache.key(payload) != ResponseCache.key({**payload, "model": "n"})
+
+
+def test_eviction_and_replay():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ResponseCache(tmpdir, max_bytes=2_000)
+        for index in range(10):
+            cache.put({"n": index}, {"content": "x" * 500})
+            # eviction order comes from file modification times
+            time.sleep(0.01)
+        assert cache.total_bytes <= 2_000
+        assert cache.get({"n": 9}) == {"content": "x" * 500}
+        assert cache.get({"n": 0}) is None
+
+        replay = ResponseCache(tmpdir, replay=True)
+        assert replay.get({"n": 9}) == {"content": "x" * 500}
+        with pytest.raises(ReplayMiss):
+            replay.get({"n": 0})
+
+
+def test_client_serves_repeated_payloads_from_cache(stand_in_server, tool_input):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        url = f"http://127.0.0.1:{stand_in_server.server_port}/"
+        client = ChatClient(url=url, api_key="test", cache=ResponseCache(tmpdir))
+        payload = {"messages": [{"role": "user", "content": "hi"}]}
+        first = client.stream(payload)
+        stand_in_server.shutdown()
+        stand_in_server.server_close()
+
+        # nothing is listening any more, so these must come from disk
+        replay = ChatClient(
+            url=url, api_key="test", cache=ResponseCache(tmpdir, replay=True)
+        )
+        assert replay.complete(payload) == first
+        seen = []
+        assert replay.stream(payload, on_change=seen.append) == first
+        assert seen == tool_input.changes
+        with pytest.raises(ReplayMiss):
+            replay.complete({"messages": []})
+
+
+def test_cut_off_streams_are_not_cached(stand_in_server):
+    stand_in_server.RequestHandlerClass.finish_streams = False
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ResponseCache(tmpdir)
+        client = ChatClient(
+            url=f"http://127.0.0.1:{stand_in_server.server_port}/",
+            api_key="test",
+            cache=cache,
+        )
+        payload = {"messages": [{"role": "user", "content": "hi"}]}
+        client.stream(payload)
+        assert cache.get(payload) is None
+
+        stand_in_server.RequestHandlerClass.finish_streams = True
+        client.stream(payload)
+        assert cache.get(payload) is not None
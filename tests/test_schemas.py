@@ -0,0 +1,58 @@
+from schemas import decode_completion, json_schema, parse_arguments
+from models import RepoToolInput, RepoChange, FileAction, Action
+
+import json
+
+
+def test_decode_completion_from_bytes():
+    tool_input = RepoToolInput(
+        changes=[
+            RepoChange(
+                file_action=FileAction(
+                    action=Action.CREATE,
+                    file_name="big.txt",
+                    content='line with "quotes" and ünïcode\n' * 100_000,
+                )
+            )
+        ]
+    )
+    body = json.dumps(
+        {
+            "id": "chatcmpl-1",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [
+                            {
+                                "id": "call_1",
+                                "type": "function",
+                                "function": {
+                                    "name": "implement_changes",
+                                    "arguments": tool_input.model_dump_json(),
+                                },
+                            }
+                        ],
+                    },
+                }
+            ],
+        }
+    ).encode()
+
+    message = decode_completion(body)
+    assert message["role"] == "assistant"
+    arguments = message["tool_calls"][0]["function"]["arguments"]
+    assert parse_arguments(RepoToolInput, arguments) == tool_input
+
+    plain = decode_completion(
+        b'{"choices": [{"message": {"role": "assistant", "content": "hi"}}]}'
+    )
+    assert plain == {"role": "assistant", "content": "hi"}
+
+
+def test_json_schema_is_built_once():
+    assert json_schema(RepoToolInput) is json_schema(RepoToolInput)
+    assert json_schema(RepoToolInput) == RepoToolInput.model_json_schema()
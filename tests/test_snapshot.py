@@ -0,0 +1,115 @@
+from models import RepoToolInput, RepoChange, Patch, FileAction, Action
+from repo_tool import RepoTool
+
+import tempfile
+import os
+
+
+def read(repo_dir, path):
+    with open(os.path.join(repo_dir, path)) as file:
+        return file.read()
+
+
+def test_rollback_restores_files_index_and_head(write):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Setup: a commit, a staged edit, an unstaged edit and an untracked file
+        RepoTool.run_command("git init", tmpdir)
+        for name in ["clean.txt", "staged.txt", "unstaged.txt", "removed.txt"]:
+            write(tmpdir, name, f"{name} v1\n")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+        write(tmpdir, "staged.txt", "staged v2\n")
+        RepoTool.run_command("git add staged.txt", tmpdir)
+        write(tmpdir, "unstaged.txt", "unstaged v2\n")
+        write(tmpdir, "notes/untracked.txt", "untracked\n")
+
+        repo_tool = RepoTool(tmpdir)
+        _, head = RepoTool.run_command("git rev-parse HEAD", tmpdir)
+        _, status = RepoTool.run_command("git status --porcelain", tmpdir)
+        snapshot = repo_tool.snapshot()
+
+        # Break everything: edits, deletions, new files, a commit
+        repo_tool.implement_changes(
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        patch=Patch(
+                            file_name="clean.txt",
+                            blob_hash="0000000",
+                            diff_range="-1 +1",
+                            changes=["-clean.txt v1", "+broken"],
+                        )
+                    ),
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.DELETE, file_name="removed.txt"
+                        )
+                    ),
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE, file_name="new.txt", content="new\n"
+                        )
+                    ),
+                ]
+            )
+        )
+        RepoTool.run_command("git commit -m 'broken'", tmpdir)
+        write(tmpdir, "unstaged.txt", "unstaged v3\n")
+        write(tmpdir, "build/junk.o", "junk\n")
+
+        repo_tool.rollback(snapshot)
+        snapshot.discard()
+
+        assert RepoTool.run_command("git rev-parse HEAD", tmpdir)[1] == head
+        assert RepoTool.run_command("git status --porcelain", tmpdir)[1] == status
+        assert read(tmpdir, "clean.txt") == "clean.txt v1\n"
+        assert read(tmpdir, "removed.txt") == "removed.txt v1\n"
+        assert read(tmpdir, "staged.txt") == "staged v2\n"
+        assert read(tmpdir, "unstaged.txt") == "unstaged v2\n"
+        assert read(tmpdir, "notes/untracked.txt") == "untracked\n"
+        assert not os.path.exists(os.path.join(tmpdir, "new.txt"))
+        assert not os.path.exists(os.path.join(tmpdir, "build"))
+
+
+def test_untracked_files_are_copied_only_when_touched(write):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        write(tmpdir, "tracked.txt", "tracked\n")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+        write(tmpdir, "build/a.o", "object\n")
+        write(tmpdir, "build/b.o", "object\n")
+
+        repo_tool = RepoTool(tmpdir)
+        snapshot = repo_tool.snapshot()
+        assert snapshot.saved == {}
+
+        repo_tool.implement_changes(
+            RepoToolInput(
+                changes=[
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE,
+                            file_name="build/a.o",
+                            content="overwritten\n",
+                        )
+                    ),
+                    RepoChange(
+                        file_action=FileAction(
+                            action=Action.CREATE,
+                            file_name="build/new.o",
+                            content="new\n",
+                        )
+                    ),
+                ]
+            )
+        )
+        assert sorted(snapshot.saved) == ["build/a.o", "build/new.o"]
+        write(tmpdir, "build/c.o", "later build output\n")
+
+        repo_tool.rollback(snapshot)
+        snapshot.discard()
+
+        assert read(tmpdir, "build/a.o") == "object\n"
+        assert not os.path.exists(os.path.join(tmpdir, "build/new.o"))
+        # build output nobody touched is left alone
+        assert read(tmpdir, "build/c.o") == "later build output\n"
+        assert RepoTool.run_command("git status --porcelain", tmpdir)[1] == "?? build/"
@@ -0,0 +1,72 @@
+from models import Requirement, ResourceLimits, VerificationStatus
+from repo_tool import RepoTool
+from supervisor import run_supervised
+from verification_cache import VerificationCache
+
+import tempfile
+import time
+import os
+
+
+def test_wall_clock_limit_kills_the_process_group():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pid_path = os.path.join(tmpdir, "pid")
+        start = time.perf_counter()
+        # the background sleep would outlive its shell if only the shell died
+        result = run_supervised(
+            [f"sleep 30 & echo $! > {pid_path}; wait"],
+            cwd=tmpdir,
+            limits=ResourceLimits(wall_seconds=0.5),
+        )
+
+        assert time.perf_counter() - start < 5
+        assert result.timed_out
+        assert "wall-clock" in result.timeout_reason
+        with open(pid_path) as file:
+            pid = int(file.read())
+        time.sleep(0.1)
+        assert (
+            not os.path.exists(f"/proc/{pid}")
+            or "Z" in open(f"/proc/{pid}/stat").read().split()[2]
+        )
+
+
+def test_command_limit_names_the_slow_command():
+    result = run_supervised(
+        ["echo first", "sleep 30", "echo never"],
+        limits=ResourceLimits(command_wall_seconds=0.5),
+    )
+
+    assert result.timed_out
+    assert result.current_step == "sleep 30"
+    assert "sleep 30" in result.timeout_reason
+    assert result.stdout.text() == "first\n"
+
+
+def test_cpu_limit_is_reported_as_timeout():
+    result = run_supervised(
+        ["while :; do :; done"], limits=ResourceLimits(cpu_seconds=1)
+    )
+
+    assert result.timed_out
+    assert "CPU time" in result.timeout_reason
+
+
+def test_timed_out_verification_is_not_cached():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        requirement = Requirement(
+            description="hangs",
+            verification_commands=["sleep 30"],
+            expected_output="",
+        )
+        repo_tool = RepoTool(
+            tmpdir,
+            verification_cache=VerificationCache(),
+            limits=ResourceLimits(wall_seconds=0.5),
+        )
+
+        result = repo_tool.verify(requirement)
+        assert result.status == VerificationStatus.TIMED_OUT
+        assert result.output.startswith("Timed out:")
+        assert len(repo_tool.verification_cache) == 0
@@ -0,0 +1,119 @@
+from tracing import tracer, command_type, JsonLinesExporter, ChromeTraceExporter
+from models import RepoToolInput, RepoChange, FileAction, Action, Requirement
+from repo_tool import RepoTool
+
+import tempfile
+import json
+import os
+
+
+def test_command_type():
+    assert command_type("git -C repo apply temp.patch") == "git apply"
+    assert command_type("git update-index --add --stdin") == "git update-index"
+    assert command_type("/usr/bin/cmake --build .") == "cmake"
+    assert command_type("") == ""
+
+
+def test_disabled_tracer_records_nothing():
+    tracer.reset_counters()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        with tracer.span("ignored") as span:
+            assert span is None
+    assert tracer.summary() == {}
+
+
+def test_tracing_run_command_and_spans():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jsonl_path = os.path.join(tmpdir, "trace.jsonl")
+        chrome_path = os.path.join(tmpdir, "trace.json")
+        repo_dir = os.path.join(tmpdir, "repo")
+        os.makedirs(repo_dir)
+
+        tracer.reset_counters()
+        tracer.enable(JsonLinesExporter(jsonl_path), ChromeTraceExporter(chrome_path))
+        try:
+            RepoTool.run_command("git init", repo_dir)
+            repo_tool = RepoTool(repo_dir)
+            repo_tool.implement_changes(
+                RepoToolInput(
+                    changes=[
+                        RepoChange(
+                            file_action=FileAction(
+                                action=Action.CREATE, file_name="a.txt", content="a\n"
+                            )
+                        )
+                    ]
+                )
+            )
+            repo_tool.requirement_is_fulfilled(
+                Requirement(
+                    description="fails",
+                    verification_commands=["cat missing.txt"],
+                    expected_output="",
+                )
+            )
+            summary = tracer.summary()
+        finally:
+            tracer.disable()
+
+        # Aggregated counters per command type
+        assert summary["git init"]["count"] == 1
+        assert summary["git update-index"]["count"] == 1
+        assert summary["cat"]["failures"] == 1
+        assert summary["cat"]["output_bytes"] > 0
+
+        # The JSON lines trace has a span per subprocess plus the verification span
+        with open(jsonl_path) as file:
+            spans = [json.loads(line) for line in file]
+        cat_span = next(span for span in spans if span["name"] == "cat")
+        assert cat_span["args"]["cwd"] == repo_dir
+        assert cat_span["args"]["exit_code"] != 0
+        verification = next(span for span in spans if span["name"] == "verification")
+        assert verification["args"]["steps"] == ["cat missing.txt"]
+
+        # The Chrome trace is a valid trace-event array
+        with open(chrome_path) as file:
+            events = json.load(file)
+        assert {event["ph"] for event in events} == {"X"}
+        assert len(events) == len(spans)
+
+
+def test_tracing_coprocess_and_snapshot_git_calls():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jsonl_path = os.path.join(tmpdir, "trace.jsonl")
+        repo_dir = os.path.join(tmpdir, "repo")
+        os.makedirs(repo_dir)
+        RepoTool.run_command("git init", repo_dir)
+
+        tracer.reset_counters()
+        tracer.enable(JsonLinesExporter(jsonl_path))
+        try:
+            repo_tool = RepoTool(repo_dir, persistent_git=True)
+            snapshot = repo_tool.snapshot()
+            repo_tool.implement_changes(
+                RepoToolInput(
+                    changes=[
+                        RepoChange(
+                            file_action=FileAction(
+                                action=Action.CREATE, file_name="a.txt", content="a\n"
+                            )
+                        )
+                    ]
+                )
+            )
+            repo_tool.rollback(snapshot)
+            snapshot.discard()
+            repo_tool.close()
+            summary = tracer.summary()
+        finally:
+            tracer.disable()
+
+        # the snapshot's git calls are counted like run_command's
+        assert summary["git status"]["count"] >= 1
+        assert summary["git rev-parse"]["count"] >= 1
+
+        with open(jsonl_path) as file:
+            spans = [json.loads(line) for line in file]
+        coprocess_spans = [span for span in spans if span["category"] == "coprocess"]
+        assert {span["name"] for span in coprocess_spans} >= {"git update-index"}
@@ -0,0 +1,193 @@
+from models import Requirement
+from repo_tool import RepoTool
+from verification_cache import VerificationCache, StepMemo
+from build_cache import build_dir_for
+
+import tempfile
+import pytest
+import shutil
+import os
+
+
+def count_runs(counter_path):
+    if not os.path.exists(counter_path):
+        return 0
+    with open(counter_path) as file:
+        return len(file.readlines())
+
+
+def test_verification_cache_skips_unchanged_tree():
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as cachedir:
+        # Setup: a committed script and a counter outside the repository
+        RepoTool.run_command("git init", tmpdir)
+        with open(os.path.join(tmpdir, "hello.sh"), "w") as file:
+            file.write("echo hello world\n")
+        RepoTool.run_command("git add . && git commit -m 'initial commit'", tmpdir)
+
+        counter_path = os.path.join(cachedir, "runs")
+        cache_path = os.path.join(cachedir, "cache.json")
+        requirement = Requirement(
+            description="script prints hello world",
+            verification_commands=[f"echo run >> {counter_path}", "sh hello.sh"],
+            expected_output="hello world",
+        )
+        repo_tool = RepoTool(
+            tmpdir, verification_cache=VerificationCache(path=cache_path)
+        )
+
+        # The second check is served from the cache
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert count_runs(counter_path) == 1
+
+        # Untracked build output does not invalidate the entry
+        with open(os.path.join(tmpdir, "build.log"), "w") as file:
+            file.write("junk\n")
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert count_runs(counter_path) == 1
+
+        # A dirty tracked file does
+        with open(os.path.join(tmpdir, "hello.sh"), "w") as file:
+            file.write("echo goodbye\n")
+        fulfilled, _ = repo_tool.requirement_is_fulfilled(requirement)
+        assert not fulfilled
+        assert count_runs(counter_path) == 2
+
+        # A fresh tool resumes from the on-disk cache
+        resumed = RepoTool(
+            tmpdir, verification_cache=VerificationCache(path=cache_path)
+        )
+        fulfilled, _ = resumed.requirement_is_fulfilled(requirement)
+        assert not fulfilled
+        assert count_runs(counter_path) == 2
+
+
+def test_verification_cache_lru_eviction():
+    cache = VerificationCache(max_entries=2)
+    cache.put("a", True, "a")
+    cache.put("b", True, "b")
+    assert cache.get("a") == (True, "a")
+
+    # "b" is now the least recently used entry
+    cache.put("c", False, "c")
+    assert cache.get("b") is None
+    assert cache.get("a") == (True, "a")
+    assert len(cache) == 2
+
+
+def test_steps_with_unchanged_inputs_are_skipped():
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as logdir:
+        RepoTool.run_command("git init", tmpdir)
+        for path, content in [
+            ("CMakeLists.txt", "project(hello)\n"),
+            ("src/hello.sh", "echo hello world\n"),
+        ]:
+            os.makedirs(os.path.dirname(os.path.join(tmpdir, path)), exist_ok=True)
+            with open(os.path.join(tmpdir, path), "w") as file:
+                file.write(content)
+
+        configure_log = os.path.join(logdir, "configure")
+        build_log = os.path.join(logdir, "build")
+        requirement = Requirement(
+            description="script prints hello world",
+            verification_commands=[
+                f"echo run >> {configure_log}",
+                f"echo run >> {build_log} && cp src/hello.sh {logdir}/hello.sh",
+                f"sh {logdir}/hello.sh",
+            ],
+            expected_output="hello world",
+            verification_inputs=[["**/CMakeLists.txt"], ["src/*"], []],
+        )
+        repo_tool = RepoTool(tmpdir)
+
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert (count_runs(configure_log), count_runs(build_log)) == (1, 1)
+
+        # a source change reruns the build, not the configure step
+        with open(os.path.join(tmpdir, "src/hello.sh"), "w") as file:
+            file.write("echo goodbye\n")
+        assert not repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert (count_runs(configure_log), count_runs(build_log)) == (1, 2)
+
+        # a configure change reruns everything after it
+        with open(os.path.join(tmpdir, "CMakeLists.txt"), "w") as file:
+            file.write("project(goodbye)\n")
+        assert not repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert (count_runs(configure_log), count_runs(build_log)) == (2, 3)
+
+        # another requirement's steps may have changed the shared build, so
+        # the memo does not carry over between requirements
+        other = requirement.model_copy(update={"description": "another check"})
+        repo_tool.requirement_is_fulfilled(other)
+        repo_tool.requirement_is_fulfilled(requirement)
+        assert (count_runs(configure_log), count_runs(build_log)) == (4, 5)
+        repo_tool.requirement_is_fulfilled(requirement)
+        assert (count_runs(configure_log), count_runs(build_log)) == (4, 5)
+
+        # shell state steps always run, so the steps after them do too
+        assert not RepoTool(tmpdir).step_input_digests(
+            requirement.model_copy(
+                update={"verification_commands": ["cd src", "true", "true"]}
+            ),
+            ["cd src", "true", "true"],
+        )[0]
+
+
+def test_steps_changing_shell_state_are_not_memoized():
+    assert StepMemo.memoizable("cmake -S . -B build")
+    assert StepMemo.memoizable("make -C build | tee log.txt")
+    for step in [
+        "cd sub",
+        "true && cd sub",
+        "mkdir -p build && cd build && cmake ..",
+        "make; export CC=clang",
+        "false || source env.sh",
+        "true\nFOO=bar",
+        "(cd sub)",
+    ]:
+        assert not StepMemo.memoizable(step), step
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        RepoTool.run_command("git init", tmpdir)
+        os.makedirs(os.path.join(tmpdir, "sub"))
+        with open(os.path.join(tmpdir, "sub", "x.txt"), "w") as file:
+            file.write("found\n")
+        requirement = Requirement(
+            description="x.txt is found from sub",
+            verification_commands=["true && cd sub", "cat x.txt"],
+            expected_output="found",
+            verification_inputs=[["**"], []],
+        )
+        repo_tool = RepoTool(tmpdir)
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        # the unchanged tree must not skip the `cd`
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+
+
+@pytest.mark.parametrize("out_of_tree", [True, False])
+def test_deleted_build_reruns_memoized_steps(out_of_tree):
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as build_root:
+        RepoTool.run_command("git init", tmpdir)
+        with open(os.path.join(tmpdir, "input.txt"), "w") as file:
+            file.write("hello world\n")
+        if out_of_tree:
+            repo_tool = RepoTool(tmpdir, build_root=build_root)
+            build_dir = build_dir_for(tmpdir, build_root)
+        else:
+            repo_tool = RepoTool(tmpdir)
+            build_dir = os.path.join(tmpdir, "build")
+        requirement = Requirement(
+            description="the configured build has the input",
+            verification_commands=[
+                f"mkdir -p {build_dir} && cp input.txt {build_dir}/out.txt",
+                f"cat {build_dir}/out.txt",
+            ],
+            expected_output="hello world",
+            verification_inputs=[["input.txt"], []],
+        )
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
+
+        shutil.rmtree(build_dir)
+        assert repo_tool.requirement_is_fulfilled(requirement)[0]
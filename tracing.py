@@ -0,0 +1,202 @@
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+import threading
+import atexit
+import shlex
+import json
+import time
+import os
+
+
+class Span:
+    def __init__(self, name: str, category: str, args: Optional[Dict] = None):
+        self.name = name
+        self.category = category
+        self.args = args or {}
+        self.start = time.time()
+        self.duration = 0.0
+        self.thread_id = threading.get_ident()
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "category": self.category,
+            "start": self.start,
+            "duration": self.duration,
+            "pid": os.getpid(),
+            "tid": self.thread_id,
+            "args": self.args,
+        }
+
+
+class JsonLinesExporter:
+    def __init__(self, path: str):
+        self.file = open(path, "a")
+
+    def export(self, span: Span):
+        self.file.write(json.dumps(span.to_dict()) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ChromeTraceExporter:
+    # the JSON array flavour of the trace-event format, loadable in
+    # chrome://tracing and Perfetto even if the closing bracket is missing
+    def __init__(self, path: str):
+        self.file = open(path, "w")
+        self.file.write("[\n")
+        self.first = True
+
+    def export(self, span: Span):
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": span.start * 1e6,
+            "dur": span.duration * 1e6,
+            "pid": os.getpid(),
+            "tid": span.thread_id,
+            "args": span.args,
+        }
+        self.file.write(("" if self.first else ",\n") + json.dumps(event))
+        self.file.flush()
+        self.first = False
+
+    def close(self):
+        self.file.write("\n]\n")
+        self.file.close()
+
+
+class CommandCounter:
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.output_bytes = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "seconds": self.seconds,
+            "output_bytes": self.output_bytes,
+        }
+
+
+def command_type(command: str) -> str:
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        words = command.split()
+    if not words:
+        return ""
+    # `git apply` and `git commit` are different hot spots, `cmake ..` is just cmake
+    if words[0] == "git":
+        options = iter(words[1:])
+        for word in options:
+            if word in ("-C", "-c"):
+                next(options, None)
+            elif not word.startswith("-"):
+                return f"git {word}"
+        return "git"
+    return os.path.basename(words[0])
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.exporters: List = []
+        self.counters: Dict[str, CommandCounter] = {}
+        self._lock = threading.Lock()
+
+    def enable(self, *exporters):
+        self.exporters.extend(exporters)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        with self._lock:
+            for exporter in self.exporters:
+                exporter.close()
+            self.exporters = []
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {}
+
+    def _finish(self, span: Span):
+        with self._lock:
+            for exporter in self.exporters:
+                exporter.export(span)
+
+    def span(self, name: str, category: str = "repo_tool", **args):
+        # callers pay for a single attribute check while tracing is off
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, category, args)
+
+    @contextmanager
+    def _span(self, name: str, category: str, args: Dict):
+        span = Span(name, category, args)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - started
+            self._finish(span)
+
+    def record_command(
+        self,
+        command: str,
+        cwd: Optional[str],
+        started: float,
+        duration: float,
+        exit_code: int,
+        output_size: int,
+    ):
+        name = command_type(command)
+        span = Span(
+            name,
+            "subprocess",
+            {
+                "command": command,
+                "cwd": cwd,
+                "exit_code": exit_code,
+                "output_bytes": output_size,
+            },
+        )
+        span.start = started
+        span.duration = duration
+
+        with self._lock:
+            counter = self.counters.setdefault(name, CommandCounter())
+            counter.count += 1
+            counter.failures += exit_code != 0
+            counter.seconds += duration
+            counter.output_bytes += output_size
+        self._finish(span)
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                name: counter.to_dict()
+                for name, counter in sorted(
+                    self.counters.items(), key=lambda item: -item[1].seconds
+                )
+            }
+
+
+tracer = Tracer()
+
+
+def configure_from_env():
+    exporters = []
+    if os.getenv("GITPT_TRACE"):
+        exporters.append(JsonLinesExporter(os.environ["GITPT_TRACE"]))
+    if os.getenv("GITPT_CHROME_TRACE"):
+        exporters.append(ChromeTraceExporter(os.environ["GITPT_CHROME_TRACE"]))
+    if exporters:
+        tracer.enable(*exporters)
+        atexit.register(tracer.disable)
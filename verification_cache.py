@@ -0,0 +1,125 @@
+from models import Requirement
+
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import re
+import os
+
+
+class VerificationCache:
+    def __init__(self, max_entries: int = 256, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: "OrderedDict[str, Tuple[bool, str]]" = OrderedDict()
+
+        if path and os.path.exists(path):
+            with open(path) as file:
+                for key, (is_fulfilled, output) in json.load(file):
+                    self._entries[key] = (is_fulfilled, output)
+
+    @staticmethod
+    def key(tree_hash: str, dirty_digest: str, requirement: Requirement) -> str:
+        requirement_hash = hashlib.sha256(
+            requirement.model_dump_json().encode()
+        ).hexdigest()
+        return hashlib.sha256(
+            f"{tree_hash}\0{dirty_digest}\0{requirement_hash}".encode()
+        ).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[bool, str]]:
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: str, is_fulfilled: bool, output: str):
+        self._entries[key] = (is_fulfilled, output)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        if self.path:
+            self.save()
+
+    def save(self):
+        # write-then-rename so a crash never leaves a truncated cache file
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(
+                [[key, list(value)] for key, value in self._entries.items()], file
+            )
+        os.replace(temp_path, self.path)
+
+
+# steps that change the state of the shell itself have to run every time for
+# the steps after them to see it, wherever in the step that happens
+SHELL_STATE_COMMAND = re.compile(
+    r"^[\s({]*(cd|pushd|popd|export|unset|source|set|alias|umask|shopt|exec"
+    r"|declare|typeset|readonly|local|trap|\.)(\s|$)|^[\s({]*\w+="
+)
+COMMAND_SEPARATOR = re.compile(r"&&|\|\||[;|&\n]")
+
+
+class StepMemo:
+    # the input digest each verification step last succeeded with. Steps run
+    # in one shell, so only a prefix can be skipped: once a step runs, the
+    # ones after it may see different outputs and run too. All steps share
+    # one build directory, so the memo only holds for the requirement that
+    # ran last: another requirement's steps may have reconfigured it
+    def __init__(self):
+        self._digests: Dict[Tuple[int, str], str] = {}
+        self._requirement: Optional[str] = None
+        # what the build looked like when steps were last recorded; the
+        # caller drops the memo once that changes (e.g. the build was deleted)
+        self.build_state: Optional[str] = None
+
+    @staticmethod
+    def memoizable(step: str) -> bool:
+        return not any(
+            SHELL_STATE_COMMAND.search(command)
+            for command in COMMAND_SEPARATOR.split(step)
+        )
+
+    def skippable(
+        self, requirement: Requirement, steps: List[str], digests: List[Optional[str]]
+    ) -> int:
+        requirement_hash = hashlib.sha256(
+            requirement.model_dump_json().encode()
+        ).hexdigest()
+        if requirement_hash != self._requirement:
+            self.clear()
+            self._requirement = requirement_hash
+
+        # the last step always runs; its output is what gets checked
+        skipped = 0
+        for index, (step, digest) in enumerate(zip(steps[:-1], digests)):
+            if digest is None or self._digests.get((index, step)) != digest:
+                break
+            skipped = index + 1
+        return skipped
+
+    def forget(self, steps: List[str], start: int):
+        # a step that runs again may leave its outputs half-written, so its
+        # memo only comes back if it succeeds
+        for index in range(start, len(steps)):
+            self._digests.pop((index, steps[index]), None)
+
+    def record(
+        self,
+        steps: List[str],
+        digests: List[Optional[str]],
+        start: int,
+        succeeded: int,
+    ):
+        for index in range(start, succeeded):
+            if digests[index] is not None:
+                self._digests[(index, steps[index])] = digests[index]
+
+    def clear(self):
+        self._digests.clear()